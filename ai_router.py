@@ -0,0 +1,206 @@
+# ai_router.py
+"""
+Task-aware model routing for chat completions.
+
+Each task class (chat, poem, flavor, ambient, structured, structured_lite) maps to a route: the models that are
+good enough for it in preference order, plus max_tokens, temperature and read / connect
+timeouts (applied by the shared transport).
+"prefer" routes use the first healthy model; "fastest" routes use the healthy model
+with the lowest rolling p50 latency. A model that fails is skipped for the rest of
+the call (failover) and, after MODEL_FAILURE_LIMIT failures in a row, for
+MODEL_COOLDOWN seconds.
+
+Routes can be changed without code changes: AI_ROUTES_FILE (JSON, re-read when it
+changes) and then the AI_ROUTES env var (JSON) are merged over the defaults, e.g.
+    {"flavor": {"models": ["gpt-4.1-nano"], "max_tokens": 60}}
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import METRICS
+from overload import OVERLOAD
+from tracing import TRACER
+from transport import HTTP_CONNECT_TIMEOUT, task_timeout
+from usage import USAGE
+
+AI_ROUTES_FILE = os.getenv("AI_ROUTES_FILE", "ai_routes.json")
+ROUTES_RECHECK_SECONDS = 30    # how often the routes file's mtime is checked
+MODEL_FAILURE_LIMIT = 3        # consecutive failures before a model is benched
+MODEL_COOLDOWN = 60.0          # seconds a benched model is skipped
+MAX_ATTEMPTS = 2               # models tried per call
+
+DEFAULT_ROUTES: Dict[str, Dict[str, Any]] = {
+    "chat": {"models": ["gpt-4o-mini", "gpt-4.1-mini"], "strategy": "prefer",
+             "max_tokens": 500, "temperature": None, "timeout": 30.0},
+    "poem": {"models": ["gpt-4o-mini", "gpt-4.1-mini"], "strategy": "prefer",
+             "max_tokens": 500, "temperature": None, "timeout": 45.0},
+    # One-line RPG narration: short, cheap, and it has a static fallback
+    "flavor": {"models": ["gpt-4.1-nano", "gpt-4o-mini"], "strategy": "fastest",
+               "max_tokens": 120, "temperature": 0.9, "timeout": 5.0, "connect_timeout": 2.0},
+    # Batches of canned replies to bare pings, generated in the background
+    "ambient": {"models": ["gpt-4o-mini", "gpt-4.1-mini"], "strategy": "prefer",
+                "max_tokens": 900, "temperature": 1.0, "timeout": 30.0},
+    # JSON documents the game depends on (shop stock)
+    "structured": {"models": ["gpt-4o-mini", "gpt-4.1-mini"], "strategy": "prefer",
+                   "max_tokens": 800, "temperature": 0.7, "timeout": 30.0},
+    # The same documents from cheaper models, for guilds near their daily budget
+    "structured_lite": {"models": ["gpt-4.1-nano", "gpt-4o-mini"], "strategy": "prefer",
+                        "max_tokens": 600, "temperature": 0.7, "timeout": 30.0},
+}
+
+
+class Route:
+    def __init__(self, task: str, models: List[str], strategy: str = "prefer", max_tokens: int = 500,
+                 temperature: Optional[float] = None, timeout: float = 30.0,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT):
+        self.task = task
+        self.models = list(models)
+        self.strategy = strategy
+        self.max_tokens = int(max_tokens)
+        self.temperature = temperature
+        self.timeout = float(timeout)
+        self.connect_timeout = float(connect_timeout)
+
+
+class ModelRouter:
+    def __init__(self, routes_file: str = AI_ROUTES_FILE):
+        self.routes_file = routes_file
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Route] = {}
+        self._file_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._failures: Dict[str, int] = {}          # model -> consecutive failures
+        self._benched_until: Dict[str, float] = {}   # model -> monotonic time
+        self.reload()
+
+    # ---------- config ----------
+    def reload(self) -> None:
+        config = {task: dict(route) for task, route in DEFAULT_ROUTES.items()}
+        overrides: List[Dict[str, Any]] = []
+        try:
+            with open(self.routes_file, "r", encoding="utf-8") as f:
+                overrides.append(json.load(f))
+            self._file_mtime = os.path.getmtime(self.routes_file)
+        except FileNotFoundError:
+            self._file_mtime = None
+        except (OSError, ValueError) as e:
+            print(f"⚠ Ignoring {self.routes_file}: {e}")
+        if os.getenv("AI_ROUTES"):
+            try:
+                overrides.append(json.loads(os.environ["AI_ROUTES"]))
+            except ValueError as e:
+                print(f"⚠ Ignoring AI_ROUTES: {e}")
+        for override in overrides:
+            for task, fields in override.items():
+                config.setdefault(task, dict(DEFAULT_ROUTES["chat"])).update(fields)
+        routes = {}
+        for task, fields in config.items():
+            try:
+                routes[task] = Route(task, **fields)
+            except (TypeError, ValueError) as e:
+                print(f"⚠ Bad route for {task!r} ({e}); using the default")
+                routes[task] = Route(task, **DEFAULT_ROUTES.get(task, DEFAULT_ROUTES["chat"]))
+        with self._lock:
+            self._routes = routes
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < ROUTES_RECHECK_SECONDS:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.routes_file)
+        except OSError:
+            mtime = None
+        if mtime != self._file_mtime:
+            self.reload()
+
+    def route(self, task: str) -> Route:
+        self._maybe_reload()
+        with self._lock:
+            return self._routes.get(task) or self._routes["chat"]
+
+    # ---------- selection ----------
+    def latency_ms(self, model: str) -> Optional[float]:
+        return METRICS.percentile(f"llm.{model}.ms", 50)
+
+    def candidates(self, route: Route) -> List[str]:
+        """Models to try, best first. Benched models go last rather than disappearing."""
+        now = time.monotonic()
+        healthy = [m for m in route.models if self._benched_until.get(m, 0) <= now]
+        benched = [m for m in route.models if m not in healthy]
+        if route.strategy == "fastest":
+            # Unmeasured models sort first so each gets tried once
+            healthy.sort(key=lambda m: self.latency_ms(m) or 0.0)
+        return healthy + benched
+
+    def _succeeded(self, model: str, ms: float) -> None:
+        METRICS.observe(f"llm.{model}.ms", ms)
+        self._failures.pop(model, None)
+
+    def _failed(self, model: str) -> None:
+        METRICS.incr(f"llm.{model}.failures")
+        n = self._failures.get(model, 0) + 1
+        self._failures[model] = n
+        if n >= MODEL_FAILURE_LIMIT:
+            self._benched_until[model] = time.monotonic() + MODEL_COOLDOWN
+            self._failures[model] = 0
+            print(f"⚠ Model {model} failed {n} times in a row; benched for {MODEL_COOLDOWN:.0f}s")
+
+    # ---------- calls ----------
+    def _complete(self, client, task: str, messages: List[dict],
+                  max_tokens: Optional[int] = None, **extra) -> Tuple[Any, str]:
+        route = self.route(task)
+        params = {"messages": messages, "max_tokens": max_tokens or route.max_tokens,
+                  "timeout": task_timeout(route.timeout, route.connect_timeout)}
+        if route.temperature is not None:
+            params["temperature"] = route.temperature
+        params.update(extra)
+        error: Optional[Exception] = None
+        for model in self.candidates(route)[:MAX_ATTEMPTS]:
+            started = time.perf_counter()
+            try:
+                response = client.chat.completions.create(model=model, **params)
+            except Exception as e:
+                self._failed(model)
+                error = e
+                continue
+            self._succeeded(model, (time.perf_counter() - started) * 1000)
+            TRACER.record_llm(response, started)
+            USAGE.record(model, response)
+            return response, model
+        raise error or RuntimeError(f"no model configured for {task!r}")
+
+    async def complete(self, client, task: str, messages: List[dict],
+                       max_tokens: Optional[int] = None, **extra) -> Tuple[Any, str]:
+        """
+        Chat completion for `task` in a worker thread, failing over between the route's
+        models. Usage is recorded (tracer + per-guild ledger). Returns (response, model used).
+        Time spent queued for the thread counts towards overload, and towards the task's
+        latency against its route timeout.
+        """
+        with OVERLOAD.track(task, self.route(task).timeout):
+            return await asyncio.to_thread(self._complete, client, task, messages, max_tokens, **extra)
+
+    def summary(self) -> List[str]:
+        """One line per model that has been called: p50 / p95 latency and failures."""
+        models = sorted({m for r in self._routes.values() for m in r.models})
+        lines = []
+        now = time.monotonic()
+        for m in models:
+            p50 = self.latency_ms(m)
+            fails = METRICS.get(f"llm.{m}.failures")
+            if p50 is None and not fails:
+                continue
+            p95 = METRICS.percentile(f"llm.{m}.ms", 95)
+            state = " (benched)" if self._benched_until.get(m, 0) > now else ""
+            lat = f"p50 {p50:.0f} / p95 {p95:.0f} ms" if p50 is not None else "no successes"
+            lines.append(f"`{m}`: {lat}, {fails} failures{state}")
+        return lines
+
+
+ROUTER = ModelRouter()
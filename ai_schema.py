@@ -0,0 +1,214 @@
+# ai_schema.py
+"""
+Declared response schemas for AI JSON output.
+
+A schema is built from Str / Int / Enum / List / Object specs and compiled once into
+plain closures. Decoding never raises: out-of-range numbers are clamped, bad or missing
+fields fall back to their default, and a list item that still can't be validated is
+dropped on its own instead of failing the whole response. Outcomes are counted in
+METRICS under ai.<schema>.* so parse-failure rates show up in /stats.
+"""
+import json
+import threading
+from typing import Any, Callable, Dict, List as ListT, Optional, Sequence
+
+from metrics import METRICS
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    orjson = None
+    _loads = json.loads
+
+_INVALID = object()
+_MISSING = object()
+
+Validator = Callable[[Any], Any]
+
+
+def _default(default: Any) -> Any:
+    return default() if callable(default) else default
+
+
+class Spec:
+    """default=None means the value is required: failure makes the parent invalid."""
+
+    def __init__(self, default: Any = None):
+        self.default = default
+
+    def compile(self, stats: Dict[str, int]) -> Validator:
+        raise NotImplementedError
+
+    def _fallback(self, stats: Dict[str, int]) -> Any:
+        if self.default is None:
+            return _INVALID
+        stats["defaulted"] += 1
+        return _default(self.default)
+
+
+class Str(Spec):
+    def __init__(self, max_len: int, default: Any = None):
+        super().__init__(default)
+        self.max_len = max_len
+
+    def compile(self, stats):
+        max_len = self.max_len
+
+        def check(v):
+            if isinstance(v, str):
+                v = v.strip()
+                if v:
+                    return v[:max_len]
+            return self._fallback(stats)
+        return check
+
+
+class Int(Spec):
+    def __init__(self, lo: int, hi: int, default: Any = None):
+        super().__init__(default)
+        self.lo, self.hi = lo, hi
+
+    def compile(self, stats):
+        lo, hi = self.lo, self.hi
+
+        def check(v):
+            if isinstance(v, bool):
+                return self._fallback(stats)
+            if not isinstance(v, int):
+                try:
+                    v = int(float(v))
+                except (TypeError, ValueError, OverflowError):
+                    return self._fallback(stats)
+            if v < lo or v > hi:
+                stats["clamped"] += 1
+                return lo if v < lo else hi
+            return v
+        return check
+
+
+class Enum(Spec):
+    def __init__(self, choices: Sequence[str], default: Any = None):
+        super().__init__(default)
+        self.choices = frozenset(choices)
+
+    def compile(self, stats):
+        choices = self.choices
+
+        def check(v):
+            if isinstance(v, str):
+                v = v.strip().lower()
+                if v in choices:
+                    return v
+            return self._fallback(stats)
+        return check
+
+
+class List(Spec):
+    """Invalid items are dropped one by one; `default` is used when nothing valid is left."""
+
+    def __init__(self, item: Spec, max_items: int, default: Any = None):
+        super().__init__(default)
+        self.item = item
+        self.max_items = max_items
+
+    def compile(self, stats):
+        check_item = self.item.compile(stats)
+        max_items = self.max_items
+
+        def check(v):
+            out = []
+            if isinstance(v, list):
+                for it in v:
+                    it = check_item(it)
+                    if it is _INVALID:
+                        stats["dropped"] += 1
+                        continue
+                    out.append(it)
+                    if len(out) == max_items:
+                        break
+            return out if out else self._fallback(stats)
+        return check
+
+
+class Object(Spec):
+    def __init__(self, fields: Dict[str, Spec], default: Any = None):
+        super().__init__(default)
+        self.fields = fields
+
+    def compile(self, stats):
+        checks = [(name, spec.compile(stats), spec) for name, spec in self.fields.items()]
+
+        def check(v):
+            if not isinstance(v, dict):
+                return self._fallback(stats)
+            out = {}
+            for name, field_check, spec in checks:
+                raw = v.get(name, _MISSING)
+                if raw is _MISSING:
+                    value = spec._fallback(stats)
+                else:
+                    value = field_check(raw)
+                if value is _INVALID:
+                    return self._fallback(stats)
+                out[name] = value
+            return out
+        return check
+
+
+class Schema:
+    """
+    A compiled top-level Object schema with its own outcome counters. The counters are
+    shared by every decode, and decodes run in worker threads, so a lock serializes them.
+    """
+
+    registry: Dict[str, "Schema"] = {}
+
+    def __init__(self, name: str, root: Object):
+        self.name = name
+        self._stats: Dict[str, int] = _Counts()
+        self._check = root.compile(self._stats)
+        self._lock = threading.Lock()
+        Schema.registry[name] = self
+
+    def decode(self, text: Any) -> Optional[Dict[str, Any]]:
+        """Validated dict, or None if the text isn't JSON or the root object is unusable."""
+        try:
+            raw = _loads(text)
+        except (TypeError, ValueError):
+            METRICS.incr(f"ai.{self.name}.parse_errors")
+            return None
+        with self._lock:
+            self._stats.clear()
+            value = self._check(raw)
+            counts = list(self._stats.items())
+        for k, n in counts:
+            METRICS.incr(f"ai.{self.name}.{k}", n)
+        if value is _INVALID:
+            METRICS.incr(f"ai.{self.name}.invalid")
+            return None
+        METRICS.incr(f"ai.{self.name}.ok")
+        return value
+
+
+class _Counts(dict):
+    def __missing__(self, key):
+        return 0
+
+
+def failure_summary() -> ListT[str]:
+    """One line per schema that has seen traffic: ok / parse errors / invalid, plus item-level repairs."""
+    lines = []
+    for name in sorted(Schema.registry):
+        ok = METRICS.get(f"ai.{name}.ok")
+        parse = METRICS.get(f"ai.{name}.parse_errors")
+        invalid = METRICS.get(f"ai.{name}.invalid")
+        total = ok + parse + invalid
+        if not total:
+            continue
+        lines.append(
+            f"`{name}`: {ok}/{total} ok ({(parse + invalid) / total:.1%} failed), "
+            f"{METRICS.get(f'ai.{name}.dropped')} items dropped, {METRICS.get(f'ai.{name}.clamped')} clamped, "
+            f"{METRICS.get(f'ai.{name}.defaulted')} defaulted"
+        )
+    return lines
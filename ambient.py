@@ -0,0 +1,84 @@
+# ambient.py
+"""
+Pre-generated replies for bare pings (a mention with no text).
+
+Each personality keeps a small pool of ready lines. Serving one is a list pop; when a
+pool runs low, a background task asks the model for a fresh batch in one call. Lines
+recently served (or already pooled) are dropped from new batches, so the same quip
+doesn't come back twice in a row.
+"""
+import asyncio
+import random
+import re
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from metrics import METRICS
+from usage import request_scope
+
+AMBIENT_POOL_SIZE = 12      # lines kept ready per personality
+AMBIENT_REFILL_AT = 4       # refill when fewer than this many are left
+AMBIENT_RECENT = 50         # served lines remembered per personality for de-duplication
+
+Generator = Callable[[str, int], Awaitable[List[str]]]
+
+
+def _norm(text: str) -> str:
+    return re.sub(r"\W+", " ", text.lower()).strip()
+
+
+class AmbientReplies:
+    def __init__(self, personalities: Dict[str, str], generate: Generator):
+        """`personalities` maps a short name to its system prompt; generate(prompt, n) returns up to n lines."""
+        self.personalities = personalities
+        self.generate = generate
+        self._pools: Dict[str, List[str]] = {name: [] for name in personalities}
+        self._recent: Dict[str, Deque[str]] = {name: deque(maxlen=AMBIENT_RECENT) for name in personalities}
+        self._refills: Dict[str, asyncio.Task] = {}
+
+    def take(self, name: str) -> Optional[str]:
+        """A ready line for `name` (schedules a refill when the pool runs low), or None if the pool is empty."""
+        pool = self._pools.get(name)
+        if pool is None:
+            return None
+        text = pool.pop(random.randrange(len(pool))) if pool else None
+        if text is None:
+            METRICS.incr("ambient.misses")
+        else:
+            METRICS.incr("ambient.hits")
+            self._recent[name].append(_norm(text))
+        if len(pool) < AMBIENT_REFILL_AT:
+            self.refill(name)
+        return text
+
+    def refill(self, name: str) -> None:
+        task = self._refills.get(name)
+        if task is None or task.done():
+            self._refills[name] = asyncio.create_task(self._refill(name))
+
+    def warm(self) -> None:
+        for name in self.personalities:
+            self.refill(name)
+
+    async def _refill(self, name: str) -> None:
+        pool = self._pools[name]
+        wanted = AMBIENT_POOL_SIZE - len(pool)
+        if wanted <= 0:
+            return
+        try:
+            with request_scope("ambient", "-"):
+                lines = await self.generate(self.personalities[name], wanted)
+        except Exception as e:
+            print(f"⚠ Ambient refill for {name} failed: {e}")
+            return
+        seen = set(self._recent[name]) | {_norm(t) for t in pool}
+        added = 0
+        for line in lines:
+            key = _norm(line)
+            if not key or key in seen:
+                METRICS.incr("ambient.duplicates")
+                continue
+            seen.add(key)
+            pool.append(line)
+            added += 1
+        METRICS.incr("ambient.generated", added)
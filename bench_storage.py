@@ -0,0 +1,218 @@
+# bench_storage.py
+"""
+Synthetic-scale storage benchmark for rpg.db and memory.db.
+
+Builds synthetic databases with the bot's own schema, then runs the real query
+functions (RPGCog.top_players / inv_all / get_user / set_user / inv_add and
+get_memory / add_to_memory) from concurrent reader and writer threads. It reports
+latency percentiles per operation, write-lock wait time and file sizes.
+
+    python bench_storage.py                                   # small default dataset
+    python bench_storage.py --players 1000000 --guilds 5000 --memory-rows 50000000
+    python bench_storage.py --readers 16 --writers 4 --duration 60 --workdir /fast/disk/bench
+
+Needs the bot's dependencies installed (it imports newbot_ai and cogs.rpg).
+The data is generated once per --workdir and reused; pass --regen to rebuild.
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+WORDS = ("hey lol what is the best build for a level ten ranger honestly i think the goblin shop "
+         "had a great sword today did you see the stream last night gg that boss was brutal").split()
+
+
+# =========================
+# Data generation
+# =========================
+def _guild_sizes(guilds: int) -> List[float]:
+    """Zipf-like weights: a few huge guilds, a long tail of small ones."""
+    return list(itertools.accumulate(1.0 / (i + 1) ** 0.9 for i in range(guilds)))
+
+def _text(rng: random.Random) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(4, 40)))
+
+def generate(args, rng: random.Random) -> List[Tuple[int, int]]:
+    """Fills rpg.db / memory.db in the current directory. Returns the (user, guild) population."""
+    cum = _guild_sizes(args.guilds)
+    guild_ids = [10_000_000 + g for g in range(args.guilds)]
+    players = [(1_000_000_000 + i, rng.choices(guild_ids, cum_weights=cum)[0]) for i in range(args.players)]
+
+    conn = sqlite3.connect("rpg.db")
+    conn.execute("PRAGMA synchronous=OFF")
+    print(f"• rpg_users: {len(players):,} rows")
+    conn.executemany(
+        "INSERT OR IGNORE INTO rpg_users (user_id, guild_id, coins, hp, atk, def, lvl, xp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        ((str(u), str(g), rng.randint(0, 5000), rng.randint(10, 200), rng.randint(5, 80), rng.randint(3, 80),
+          rng.randint(1, 60), rng.randint(0, 5000)) for u, g in players)
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO rpg_items (item_id, name, description, effects_json) VALUES (?, ?, ?, ?)",
+        ((i, f"Synthetic Item {i}", _text(rng)[:120], '[{"amount":2,"stat":"atk"}]') for i in range(1, args.items + 1))
+    )
+    print(f"• rpg_inventory: ~{len(players) * args.inv_per_player:,} rows")
+    conn.executemany(
+        "INSERT OR IGNORE INTO rpg_inventory (user_id, guild_id, item_id, qty, name) VALUES (?, ?, ?, ?, ?)",
+        ((str(u), str(g), i, rng.randint(1, 5), f"Synthetic Item {i}")
+         for u, g in players for i in (rng.randint(1, args.items) for _ in range(rng.randint(0, 2 * args.inv_per_player))))
+    )
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect("memory.db")
+    conn.execute("PRAGMA synchronous=OFF")
+    print(f"• memory: {args.memory_rows:,} rows")
+    batch = 100_000
+    for start in range(0, args.memory_rows, batch):
+        n = min(batch, args.memory_rows - start)
+        conn.executemany(
+            "INSERT INTO memory (user_id, guild_id, role, content) VALUES (?, ?, ?, ?)",
+            ((str(u), str(g), role, _text(rng))
+             for (u, g), role in zip(rng.choices(players, k=n), itertools.cycle(("user", "assistant"))))
+        )
+        conn.commit()
+    conn.close()
+    return players
+
+def load_population(rng: random.Random, limit: int = 200_000) -> List[Tuple[int, int]]:
+    conn = sqlite3.connect("rpg.db")
+    rows = conn.execute("SELECT user_id, guild_id FROM rpg_users ORDER BY RANDOM() LIMIT ?", (limit,)).fetchall()
+    conn.close()
+    return [(int(u), int(g)) for u, g in rows]
+
+
+# =========================
+# Workload
+# =========================
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return float("nan")
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+def run_workload(args, players: List[Tuple[int, int]], newbot_ai, cog) -> Tuple[Dict[str, List[float]], Dict[str, List[float]]]:
+    read_ops: Dict[str, Callable[[int, int], object]] = {
+        "top_players": lambda u, g: cog.top_players(g, random.choice(("level", "xp", "coins")), 10),
+        "inv_all": lambda u, g: cog.inv_all(u, g),
+        "get_user": lambda u, g: cog.get_user(u, g),
+        "get_memory": lambda u, g: newbot_ai.get_memory(u, g),
+    }
+    write_ops: Dict[str, Callable[[int, int], object]] = {
+        "set_user": lambda u, g: cog.set_user(u, g, coins=random.randint(0, 5000)),
+        "inv_add": lambda u, g: cog.inv_add(u, g, random.randint(1, args.items), 1),
+        "add_to_memory": lambda u, g: newbot_ai.add_to_memory(u, g, "user", _text(random)),
+    }
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    lock_waits: Dict[str, List[float]] = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker(ops: Dict[str, Callable]):
+        local = defaultdict(list)
+        names = list(ops)
+        while time.perf_counter() < deadline:
+            name = random.choice(names)
+            u, g = random.choice(players)
+            t0 = time.perf_counter()
+            ops[name](u, g)
+            local[name].append((time.perf_counter() - t0) * 1000)
+        with lock:
+            for k, v in local.items():
+                latencies[k].extend(v)
+
+    def lock_probe(db_file: str):
+        # Time to take the write lock under the running workload
+        conn = sqlite3.connect(db_file, isolation_level=None, timeout=30)
+        local = []
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            local.append((time.perf_counter() - t0) * 1000)
+            conn.execute("ROLLBACK")
+            time.sleep(0.01)
+        conn.close()
+        with lock:
+            lock_waits[db_file].extend(local)
+
+    threads = [threading.Thread(target=worker, args=(read_ops,)) for _ in range(args.readers)]
+    threads += [threading.Thread(target=worker, args=(write_ops,)) for _ in range(args.writers)]
+    threads += [threading.Thread(target=lock_probe, args=(db,)) for db in ("rpg.db", "memory.db")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, lock_waits
+
+
+def _size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+# =========================
+# CLI
+# =========================
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark rpg.db / memory.db queries at synthetic scale.")
+    ap.add_argument("--workdir", default="bench_data")
+    ap.add_argument("--players", type=int, default=100_000)
+    ap.add_argument("--guilds", type=int, default=500)
+    ap.add_argument("--memory-rows", type=int, default=1_000_000)
+    ap.add_argument("--items", type=int, default=2_000, help="distinct catalog items")
+    ap.add_argument("--inv-per-player", type=int, default=5, help="average inventory rows per player")
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--writers", type=int, default=2)
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds of mixed workload")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--regen", action="store_true", help="delete and regenerate the synthetic databases")
+    args = ap.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    if args.regen:
+        for f in os.listdir("."):
+            if f.startswith(("rpg.db", "memory.db")):
+                os.remove(f)
+    fresh = not os.path.exists("rpg.db")
+
+    # Import the real modules from inside the workdir so their DB_FILEs resolve here
+    sys.path.insert(0, REPO_ROOT)
+    os.environ.setdefault("OPENAI_API_KEY", "bench-not-used")
+    import newbot_ai
+    from cogs.rpg import RPGCog
+    cog = RPGCog(None)
+
+    rng = random.Random(args.seed)
+    if fresh:
+        t0 = time.perf_counter()
+        print(f"Generating synthetic data in {os.getcwd()} …")
+        generate(args, rng)
+        print(f"Generated in {time.perf_counter() - t0:.1f}s\n")
+    players = load_population(rng)
+
+    print(f"Workload: {args.readers} readers, {args.writers} writers, {args.duration:.0f}s")
+    latencies, lock_waits = run_workload(args, players, newbot_ai, cog)
+
+    print(f"\n{'operation':<15} {'count':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name in sorted(latencies):
+        s = latencies[name]
+        print(f"{name:<15} {len(s):>8} {percentile(s, 50):>8.2f} {percentile(s, 95):>8.2f} {percentile(s, 99):>8.2f} {max(s):>8.2f}")
+    print(f"\n{'write lock wait':<15} {'probes':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for db, s in sorted(lock_waits.items()):
+        print(f"{db:<15} {len(s):>8} {percentile(s, 50):>8.2f} {percentile(s, 95):>8.2f} {percentile(s, 99):>8.2f} {max(s):>8.2f}")
+    print("\nFile sizes:")
+    for db in ("rpg.db", "memory.db"):
+        print(f"  {db:<10} {_size(db) / 1_048_576:>10.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
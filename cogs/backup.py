@@ -0,0 +1,141 @@
+# cogs/backup.py
+import asyncio
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from typing import List, Tuple
+
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+
+# =========================
+# Config
+# =========================
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_DBS = ("memory.db", "rpg.db")
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "6"))
+BACKUP_KEEP = 8               # snapshots kept per database
+BACKUP_PAGES_PER_STEP = 64    # pages copied per backup step
+BACKUP_STEP_SLEEP = 0.005     # seconds between steps, so live traffic gets the GIL and disk
+
+
+# =========================
+# Snapshot helpers (blocking; run in a thread)
+# =========================
+def _open_snapshot(db_path: str) -> sqlite3.Connection:
+    """
+    Opens a read transaction on the live DB. Under WAL this pins a point-in-time view
+    that the stepped backup copies from, while writers keep committing undisturbed.
+    """
+    src = sqlite3.connect(db_path, isolation_level=None)
+    src.execute("BEGIN")
+    src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+    return src
+
+
+def _copy_and_compress(src: sqlite3.Connection, db_path: str, stamp: str) -> str:
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    tmp_path = os.path.join(BACKUP_DIR, f"{name}.{stamp}.db.tmp")
+    out_path = os.path.join(BACKUP_DIR, f"{name}.{stamp}.db.gz")
+
+    dst = sqlite3.connect(tmp_path)
+    try:
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+    finally:
+        dst.close()
+
+    with open(tmp_path, "rb") as f_in, gzip.open(out_path + ".tmp", "wb", compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.replace(out_path + ".tmp", out_path)
+    os.remove(tmp_path)
+    return out_path
+
+
+def _rotate(db_path: str) -> None:
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    snaps = sorted(f for f in os.listdir(BACKUP_DIR) if f.startswith(f"{name}.") and f.endswith(".db.gz"))
+    for old in snaps[:-BACKUP_KEEP]:
+        os.remove(os.path.join(BACKUP_DIR, old))
+
+
+def snapshot_all() -> List[Tuple[str, int]]:
+    """
+    Takes one snapshot of every DB in BACKUP_DBS. Read transactions on all of them are
+    opened up front so the set is as close to a single point in time as possible.
+    Returns [(path, compressed_bytes)].
+    """
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    sources = [(p, _open_snapshot(p)) for p in BACKUP_DBS if os.path.exists(p)]
+    results = []
+    try:
+        for db_path, src in sources:
+            out_path = _copy_and_compress(src, db_path, stamp)
+            src.execute("COMMIT")
+            _rotate(db_path)
+            results.append((out_path, os.path.getsize(out_path)))
+    finally:
+        for _, src in sources:
+            src.close()
+    return results
+
+
+# =========================
+# Cog
+# =========================
+class BackupCog(commands.Cog):
+    """Scheduled online snapshots of memory.db and rpg.db (gzip, rotated)."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._lock = asyncio.Lock()
+        self.last_backup: List[Tuple[str, int]] = []
+
+    async def cog_load(self):
+        self.scheduled_backup.change_interval(hours=BACKUP_INTERVAL_HOURS)
+        self.scheduled_backup.start()
+
+    async def cog_unload(self):
+        self.scheduled_backup.cancel()
+
+    async def run_backup(self) -> List[Tuple[str, int]]:
+        async with self._lock:
+            self.last_backup = await asyncio.to_thread(snapshot_all)
+            return self.last_backup
+
+    @tasks.loop(hours=6)
+    async def scheduled_backup(self):
+        try:
+            results = await self.run_backup()
+            print(f"💾 Backup complete: {', '.join(os.path.basename(p) for p, _ in results)}")
+        except Exception as e:
+            print(f"⚠ Scheduled backup failed: {e}")
+
+    @scheduled_backup.before_loop
+    async def _before_backup(self):
+        await self.bot.wait_until_ready()
+
+    @app_commands.command(name="backup", description="Owner: snapshot the bot databases now.")
+    async def backup(self, interaction: discord.Interaction):
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("⛔ Only the bot owner can trigger a backup.", ephemeral=True)
+            return
+        if self._lock.locked():
+            await interaction.response.send_message("⏳ A backup is already running.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            results = await self.run_backup()
+        except Exception as e:
+            await interaction.followup.send(f"⚠ Backup failed: {e}", ephemeral=True)
+            return
+        lines = [f"• `{os.path.basename(p)}` — {size / 1024:.0f} KiB" for p, size in results] or ["_No databases found._"]
+        await interaction.followup.send("💾 Backup complete:\n" + "\n".join(lines), ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(BackupCog(bot))
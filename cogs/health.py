@@ -0,0 +1,230 @@
+# cogs/health.py
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Dict, Optional
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from metrics import METRICS
+from overload import OVERLOAD
+
+# =========================
+# Config
+# =========================
+LAG_SAMPLE_INTERVAL = 0.25    # seconds between loop-lag probes
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", "200"))   # loop blocked this long -> capture its stack
+WATCHDOG_POLL = 0.05          # watchdog thread wake-up interval (seconds)
+SLOW_CALLBACK_KEEP = 20       # recent slow-callback records kept for /loop_health
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_SECONDS = 120
+PROFILE_INTERVAL = 0.005      # sampling period of /profile (seconds)
+MAX_PENDING_SPANS = 1000      # started-but-unfinished command timings kept
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# =========================
+# Stack helpers
+# =========================
+def _frame_label(frame) -> str:
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+def _stack_frames(frame) -> list:
+    """Frames from the outermost caller down to `frame`."""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _offending_handler(frames: list) -> str:
+    """Innermost frame that belongs to the bot's own code, falling back to the innermost frame."""
+    for frame in reversed(frames):
+        path = os.path.abspath(frame.f_code.co_filename)
+        if path.startswith(REPO_ROOT) and path != os.path.abspath(__file__):
+            return f"{os.path.relpath(path, REPO_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+    return f"{_frame_label(frames[-1])}:{frames[-1].f_lineno}" if frames else "?"
+
+
+def sample_profile(seconds: float, loop_thread_id: Optional[int]) -> Counter:
+    """
+    Samples every thread's stack for `seconds` (blocking; run in a thread).
+    Returns collapsed stacks {"thread;file:func;...": samples} in flamegraph.pl / speedscope format.
+    """
+    me = threading.get_ident()
+    stacks: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for tid, frame in sys._current_frames().items():
+            if tid == me:
+                continue
+            thread = "event-loop" if tid == loop_thread_id else names.get(tid, f"thread-{tid}")
+            stacks[";".join([thread] + [_frame_label(f) for f in _stack_frames(frame)])] += 1
+        time.sleep(PROFILE_INTERVAL)
+    return stacks
+
+
+# =========================
+# Cog
+# =========================
+class HealthCog(commands.Cog):
+    """Event-loop lag sampling, slow-callback capture, command timing spans and an on-demand profiler."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.loop_thread_id: Optional[int] = None
+        self.slow_callbacks: deque = deque(maxlen=SLOW_CALLBACK_KEEP)
+        self._heartbeat = time.monotonic()
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+        self._sampler: Optional[asyncio.Task] = None
+        self._cmd_started: Dict[int, float] = {}
+        self._profile_lock = asyncio.Lock()
+        self._orig_interaction_check = None
+
+    async def cog_load(self):
+        self.loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._sampler = asyncio.create_task(self._sample_lag())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        # CommandTree.interaction_check runs right before every slash command; stamp the start there
+        self._orig_interaction_check = self.bot.tree.interaction_check
+        self.bot.tree.interaction_check = self._stamp_command
+
+    async def cog_unload(self):
+        self._stop.set()
+        if self._sampler:
+            self._sampler.cancel()
+        if self._orig_interaction_check is not None:
+            self.bot.tree.interaction_check = self._orig_interaction_check
+
+    # ---------- loop lag ----------
+    async def _sample_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+            lag_ms = max(0.0, (loop.time() - started - LAG_SAMPLE_INTERVAL) * 1000)
+            METRICS.observe("loop.lag_ms", lag_ms)
+            self._heartbeat = time.monotonic()
+
+    def _watch(self):
+        """
+        Watchdog thread: if the loop's heartbeat goes stale for SLOW_CALLBACK_MS, whatever is
+        on the loop thread right now is the blocking callback, so grab its stack.
+        """
+        stale_after = LAG_SAMPLE_INTERVAL + SLOW_CALLBACK_MS / 1000
+        current: Optional[dict] = None
+        while not self._stop.wait(WATCHDOG_POLL):
+            beat = self._heartbeat
+            blocked = time.monotonic() - beat
+            if current is not None and current["beat"] != beat:
+                current["blocked_ms"] = (beat - current["beat"] - LAG_SAMPLE_INTERVAL) * 1000
+                print(f"🐢 Event loop blocked {current['blocked_ms']:.0f} ms in {current['handler']}")
+                current = None
+            if current is None and blocked > stale_after:
+                frame = sys._current_frames().get(self.loop_thread_id)
+                if frame is None:
+                    continue
+                frames = _stack_frames(frame)
+                current = {
+                    "at": time.time(),
+                    "beat": beat,
+                    "blocked_ms": blocked * 1000,
+                    "handler": _offending_handler(frames),
+                    "stack": "".join(traceback.format_list(traceback.extract_stack(frame))),
+                }
+                self.slow_callbacks.append(current)
+                METRICS.incr("loop.slow_callbacks")
+
+    # ---------- command spans ----------
+    async def _stamp_command(self, interaction: discord.Interaction) -> bool:
+        if len(self._cmd_started) >= MAX_PENDING_SPANS:
+            self._cmd_started.clear()   # commands that errored never complete; don't let them pile up
+        self._cmd_started[interaction.id] = time.perf_counter()
+        return await self._orig_interaction_check(interaction)
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        started = self._cmd_started.pop(interaction.id, None)
+        if started is not None:
+            METRICS.observe(f"span.cmd.{command.qualified_name}", (time.perf_counter() - started) * 1000)
+
+    # ---------- commands ----------
+    @app_commands.command(name="loop_health", description="Admin: event-loop lag, slow callbacks and handler timings.")
+    async def loop_health(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("⛔ You must be an admin to use this command.", ephemeral=True)
+            return
+
+        def ms(name: str, pct: float) -> str:
+            v = METRICS.percentile(name, pct)
+            return f"{v:.0f}" if v is not None else "–"
+
+        lines = [
+            f"Loop lag (ms): p50 **{ms('loop.lag_ms', 50)}** · p99 **{ms('loop.lag_ms', 99)}** · max **{ms('loop.lag_ms', 100)}**",
+            f"Slow callbacks (> {SLOW_CALLBACK_MS:.0f} ms): **{METRICS.get('loop.slow_callbacks')}**",
+        ]
+        lines.extend(OVERLOAD.summary())
+        for rec in list(self.slow_callbacks)[-3:][::-1]:
+            lines.append(f"• <t:{int(rec['at'])}:R> **{rec['blocked_ms']:.0f} ms** in `{rec['handler']}`")
+
+        spans = [(name, METRICS.percentile(f"span.{name}", 95) or 0.0) for name in METRICS.span_names()]
+        spans.sort(key=lambda x: x[1], reverse=True)
+        if spans:
+            lines.append("\n**Slowest handlers (p50 / p95 ms)**")
+            for name, _ in spans[:10]:
+                lines.append(f"`{name}` — {ms('span.' + name, 50)} / {ms('span.' + name, 95)}")
+
+        embed = discord.Embed(title="🩺 Loop Health", description="\n".join(lines), color=discord.Color.blurple())
+        extra = {}
+        if self.slow_callbacks:
+            stack = self.slow_callbacks[-1]["stack"]
+            extra["file"] = discord.File(io.BytesIO(stack.encode()), filename="last_slow_callback.txt")
+        await interaction.response.send_message(embed=embed, ephemeral=True, **extra)
+
+    @app_commands.command(name="profile", description="Owner: sample all thread stacks into a flamegraph file.")
+    @app_commands.describe(seconds=f"How long to sample (1–{PROFILE_MAX_SECONDS} seconds)")
+    async def profile(self, interaction: discord.Interaction, seconds: app_commands.Range[int, 1, PROFILE_MAX_SECONDS] = 15):
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("⛔ Only the bot owner can run the profiler.", ephemeral=True)
+            return
+        if self._profile_lock.locked():
+            await interaction.response.send_message("⏳ A profile is already running.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        async with self._profile_lock:
+            stacks = await asyncio.to_thread(sample_profile, seconds, self.loop_thread_id)
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"profile-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}.folded")
+        body = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(body)
+
+        loop_samples = sum(c for s, c in stacks.items() if s.startswith("event-loop;"))
+        await interaction.followup.send(
+            f"🔥 Profiled **{seconds}s**: {sum(stacks.values())} samples ({loop_samples} on the event loop). "
+            f"Open with `flamegraph.pl` or speedscope.app.",
+            file=discord.File(io.BytesIO(body.encode()), filename=os.path.basename(path)),
+            ephemeral=True,
+        )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(HealthCog(bot))
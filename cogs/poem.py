@@ -1,53 +1,235 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+from ai_router import ROUTER
+from ai_schema import Schema, Object, List as ListOf, Str
+from metrics import METRICS
+from tracing import TRACER
+from usage import USAGE, DOWNGRADE
+
+# =========================
+# Config
+# =========================
+# Poems generated per (target, style); extras back the Reroll button, which otherwise makes a
+# fresh call. Each alternate costs a full poem of tokens, so raise this only if
+# poem.rerolls / poem.requests shows rerolls are common enough to pay for it.
+POEM_ALTERNATES = int(os.getenv("POEM_ALTERNATES", "1"))
+POEM_CACHE_TTL = 600         # seconds a generated batch stays servable
+MAX_GROUP_TARGETS = 5
+
+STYLE_PROMPTS = {
+    "romantic": "Write a heartfelt, romantic poem for {name}. "
+                "Make it warm, affectionate, and beautiful — like a love letter in verse.",
+    "diss": "Write a clever, scathing roast poem for {name}. "
+            "Be creative, witty, and savage but keep it playful enough to be funny.",
+    "wholesome": "Write a wholesome, uplifting poem for {name}. "
+                 "Make it kind, encouraging, and genuinely heartwarming.",
+    "silly": "Write a ridiculous, goofy, and absurd poem for {name}. "
+             "Make it lighthearted and funny with unexpected twists.",
+}
+
+STYLE_CHOICES = [
+    app_commands.Choice(name="Romantic", value="romantic"),
+    app_commands.Choice(name="Diss", value="diss"),
+    app_commands.Choice(name="Wholesome", value="wholesome"),
+    app_commands.Choice(name="Silly", value="silly"),
+]
+
+PoemKey = Tuple[str, str]   # (target display name, style)
+
+POEMS_SCHEMA = Schema("poems", Object({
+    "poems": ListOf(Object({"name": Str(100), "poem": Str(4096)}), max_items=MAX_GROUP_TARGETS),
+}))
+
+
+class RerollView(discord.ui.View):
+    def __init__(self, cog: "Poem", author_id: int, key: PoemKey):
+        super().__init__(timeout=POEM_CACHE_TTL)
+        self.cog = cog
+        self.author_id = author_id
+        self.key = key
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author_id
+
+    @discord.ui.button(label="Reroll", style=discord.ButtonStyle.secondary, emoji="🎲")
+    async def reroll(self, interaction: discord.Interaction, button: discord.ui.Button):
+        METRICS.incr("poem.rerolls")
+        cached = self.cog.take_cached(self.key)
+        if cached is not None:
+            METRICS.incr("poem.reroll_hits")
+            await interaction.response.edit_message(content=cached, view=self)
+            return
+        await interaction.response.defer()
+        try:
+            text = await self.cog.get_poem(*self.key)
+        except Exception as e:
+            await interaction.followup.send(f"⚠ Error generating poem: {e}", ephemeral=True)
+            return
+        await interaction.edit_original_response(content=text, view=self)
+
+
 class Poem(commands.Cog):
     def __init__(self, bot, openai_client):
         self.bot = bot
         self.openai_client = openai_client
+        # (name, style) -> {"expires": ts, "poems": [unserved alternates]}
+        self._cache: Dict[PoemKey, Dict] = {}
+        self._inflight: Dict[PoemKey, asyncio.Task] = {}
 
+    # ---------- cache ----------
+    def take_cached(self, key: PoemKey) -> Optional[str]:
+        """Pops the next unserved alternate for key, if one is still fresh."""
+        entry = self._cache.get(key)
+        if not entry or entry["expires"] < time.time() or not entry["poems"]:
+            self._cache.pop(key, None)
+            return None
+        METRICS.incr("poem.cache_hits")
+        return entry["poems"].pop(0)
+
+    def _cache_put(self, key: PoemKey, poems: List[str]) -> None:
+        now = time.time()
+        for k in [k for k, v in self._cache.items() if v["expires"] < now]:
+            del self._cache[k]
+        entry = self._cache.setdefault(key, {"expires": 0, "poems": []})
+        entry["expires"] = now + POEM_CACHE_TTL
+        entry["poems"].extend(poems)
+
+    # ---------- generation ----------
+    async def get_poem(self, name: str, style: str) -> str:
+        """Cached alternate if there is one, otherwise a fresh batch (concurrent callers share it)."""
+        key = (name, style)
+        cached = self.take_cached(key)
+        if cached is not None:
+            return cached
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._generate(name, style))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._inflight.pop(k, None) if self._inflight.get(k) is t else None)
+        if not await asyncio.shield(task):
+            raise RuntimeError("the model returned no poem")
+        cached = self.take_cached(key)
+        if cached is None:
+            # Everything the batch produced was claimed by concurrent callers
+            return await self.get_poem(name, style)
+        return cached
+
+    async def _generate(self, name: str, style: str) -> int:
+        alternates = 1 if USAGE.check() == DOWNGRADE else POEM_ALTERNATES
+        METRICS.incr("poem.model_calls")
+        response, _ = await ROUTER.complete(
+            self.openai_client, "poem",
+            [
+                {"role": "system", "content": STYLE_PROMPTS[style].format(name=name)},
+                {"role": "user", "content": f"Write the full poem for {name} now."}
+            ],
+            n=alternates,
+        )
+        poems = [c.message.content for c in response.choices if c.message.content]
+        METRICS.incr("poem.generated", len(poems))
+        self._cache_put((name, style), poems)
+        return len(poems)
+
+    async def _generate_group(self, names: List[str], style: str) -> Dict[str, str]:
+        """One JSON completion with a poem for each name. Returns {name: poem} for the ones it wrote."""
+        USAGE.check()
+        METRICS.incr("poem.model_calls")
+        sys_p = (
+            STYLE_PROMPTS[style].format(name="each person listed") + " "
+            'Return JSON: {"poems": [{"name": str, "poem": str}]} with exactly one poem per name, '
+            "using each name exactly as given. Each poem stands alone."
+        )
+        response, _ = await ROUTER.complete(
+            self.openai_client, "poem",
+            [
+                {"role": "system", "content": sys_p},
+                {"role": "user", "content": "Names:\n" + "\n".join(f"- {n}" for n in names)},
+            ],
+            max_tokens=ROUTER.route("poem").max_tokens * len(names),
+            response_format={"type": "json_object"},
+        )
+        data = POEMS_SCHEMA.decode(response.choices[0].message.content)
+        wanted = {n.lower(): n for n in names}
+        out: Dict[str, str] = {}
+        for item in data["poems"] if data else []:
+            name = wanted.get(item["name"].lower())
+            if name and name not in out:
+                out[name] = item["poem"]
+        METRICS.incr("poem.generated", len(out))
+        return out
+
+    # ---------- commands ----------
     @app_commands.command(name="poem", description="Make the bot write a poem for someone.")
     @app_commands.describe(
         target="The user to write the poem for",
         style="The style of poem you want"
     )
-    @app_commands.choices(style=[
-        app_commands.Choice(name="Romantic", value="romantic"),
-        app_commands.Choice(name="Diss", value="diss"),
-        app_commands.Choice(name="Wholesome", value="wholesome"),
-        app_commands.Choice(name="Silly", value="silly")
-    ])
+    @app_commands.choices(style=STYLE_CHOICES)
     async def poem(self, interaction: discord.Interaction, target: discord.Member, style: app_commands.Choice[str]):
         await interaction.response.defer()
+        METRICS.incr("poem.requests")
+        key = (target.display_name, style.value)
 
-        style_prompts = {
-            "romantic": f"Write a heartfelt, romantic poem for {target.display_name}. "
-                        "Make it warm, affectionate, and beautiful — like a love letter in verse.",
-            "diss": f"Write a clever, scathing roast poem for {target.display_name}. "
-                    "Be creative, witty, and savage but keep it playful enough to be funny.",
-            "wholesome": f"Write a wholesome, uplifting poem for {target.display_name}. "
-                         "Make it kind, encouraging, and genuinely heartwarming.",
-            "silly": f"Write a ridiculous, goofy, and absurd poem for {target.display_name}. "
-                     "Make it lighthearted and funny with unexpected twists."
-        }
+        with TRACER.span("poem", interaction.user.id, interaction.guild_id, style=style.value) as ev:
+            try:
+                poem_text = await self.get_poem(*key)
+                ev["reply_chars"] = len(poem_text)
+                await interaction.followup.send(poem_text, view=RerollView(self, interaction.user.id, key))
 
-        try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": style_prompts[style.value]},
-                    {"role": "user", "content": f"Write the full poem for {target.display_name} now."}
-                ],
-                max_tokens=500
-            )
+            except Exception as e:
+                ev["ok"] = False
+                await interaction.followup.send(f"⚠ Error generating poem: {e}")
 
-            poem_text = response.choices[0].message.content
-            await interaction.followup.send(poem_text)
+    @app_commands.command(name="poems", description="Write poems for several people at once.")
+    @app_commands.describe(
+        style="The style of poem you want",
+        target1="First person", target2="Second person", target3="Third person",
+        target4="Fourth person", target5="Fifth person",
+    )
+    @app_commands.choices(style=STYLE_CHOICES)
+    async def poems(self, interaction: discord.Interaction, style: app_commands.Choice[str],
+                    target1: discord.Member, target2: discord.Member,
+                    target3: Optional[discord.Member] = None, target4: Optional[discord.Member] = None,
+                    target5: Optional[discord.Member] = None):
+        await interaction.response.defer()
+        names = list(dict.fromkeys(
+            m.display_name for m in (target1, target2, target3, target4, target5) if m is not None
+        ))[:MAX_GROUP_TARGETS]
+        METRICS.incr("poem.requests", len(names))
+
+        results: Dict[str, str] = {}
+        for name in names:
+            cached = self.take_cached((name, style.value))
+            if cached is not None:
+                results[name] = cached
+        missing = [n for n in names if n not in results]
+        with TRACER.span("poems", interaction.user.id, interaction.guild_id, style=style.value,
+                         targets=len(names), cached=len(names) - len(missing)) as ev:
+            try:
+                if missing:
+                    results.update(await self._generate_group(missing, style.value))
+            except Exception as e:
+                ev["ok"] = False
+                await interaction.followup.send(f"⚠ Error generating poems: {e}")
+                return
+
+        embeds = [
+            discord.Embed(
+                title=f"📜 For {name}",
+                description=results.get(name, "_The muse was silent for this one — try `/poem`._")[:4096],
+                color=discord.Color.purple(),
+            )
+            for name in names
+        ]
+        await interaction.followup.send(embeds=embeds)
 
-        except Exception as e:
-            await interaction.followup.send(f"⚠ Error generating poem: {e}")
 
 async def setup(bot):
-    from newbot_ai import openai_client  # import from your main bot file
-    await bot.add_cog(Poem(bot, openai_client))
+    await bot.add_cog(Poem(bot, bot.openai_client))
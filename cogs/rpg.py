@@ -1,14 +1,25 @@
 # cogs/rpg.py
 import asyncio
 import json
+import os
 import random
 import sqlite3
 import time
+import zlib
 from typing import Optional, List, Dict, Any, Tuple
 
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from ai_router import ROUTER
+from overload import OVERLOAD, TIER_FLAVOR
+from ai_schema import Schema, Object, List as ListOf, Str, Int, Enum
+from metrics import METRICS
+from tracing import TRACER, traced
+from usage import USAGE, DOWNGRADE, REFUSE, request_scope
+from warmup import WarmupBudget
+from rpg_engine import generate_encounter, resolve_fight, encounter_rng
 
 # =========================
 # Config
@@ -23,11 +34,87 @@ GAMBLE_COOLDOWN = 10
 
 # AI clamps / behavior
 MAX_ITEM_BONUS = 5          # per stat per item
-MAX_ENEMY_STAT = 18         # enemy atk/def cap
-MAX_ENEMY_HP = 60
-MIN_ENEMY_HP = 8
 SHOP_ITEMS_PER_DAY = (3, 5) # inclusive range
 
+# Shared daily shop pool: guilds sample their shop from one pool per level bracket,
+# so AI shop generations per day no longer grow with the number of guilds
+SHOP_LEVEL_BRACKETS = [(1, 4), (5, 9), (10, 19), (20, 49), (50, 10**9)]
+SHOP_POOL_BATCHES = 3       # AI calls per bracket per day
+SHOP_POOL_BATCH_ITEMS = 8   # items asked for per call
+SHOP_LARGE_GUILD_PLAYERS = 200  # guilds with at least this many players get their own AI shop
+
+# Encounters are generated locally (rpg_engine); the AI only renames/describes them
+ENCOUNTER_AI_FLAVOR = True
+ENCOUNTER_AI_TIMEOUT = 3.0  # seconds before falling back to the procedural text
+
+# Speculative prefetch of shop + next encounter when the menu opens
+PREFETCH_TTL = 180          # seconds a prefetched result is kept if unused
+PREFETCH_MAX_AI_INFLIGHT = 8  # above this many AI calls in flight, prefetch is skipped/cancelled
+
+LEADERBOARD_TTL = 15        # seconds a computed top-10 is reused
+
+# Near the guild's daily budget (DOWNGRADE), AI calls move to the cheaper route for their
+# task; flavor is already the cheapest. Only REFUSE skips them.
+DOWNGRADE_TASKS = {"structured": "structured_lite"}
+
+# Economy tick: HP regenerates toward a level-based cap and, optionally, recently active
+# players get passive income. Applied with set-based UPDATEs, ECONOMY_CHUNK_ROWS players
+# per transaction, so the write lock is never held long even on very large guilds.
+ECONOMY_TICK_MINUTES = float(os.getenv("ECONOMY_TICK_MINUTES", "10"))
+HP_CAP_BASE = 20            # regen cap at level 1
+HP_CAP_PER_LEVEL = 5        # extra cap per level above 1
+HP_REGEN_PCT = 10           # percent of the cap restored per tick (at least 1 HP)
+PASSIVE_INCOME = int(os.getenv("PASSIVE_INCOME", "0"))  # coins per tick; 0 = off
+PASSIVE_ACTIVE_WINDOW = 3600  # seconds since the last mine/train/adventure/gamble to count as active
+ECONOMY_CHUNK_ROWS = 5000
+ECONOMY_CHUNK_PAUSE = 0.01  # seconds between chunks, so queued writers get the lock
+
+# Inventory is shown one keyset page at a time. Each sort is (label, ORDER BY, condition
+# for rows after the anchor row, reversed ORDER BY, condition for rows before it); the
+# anchor (:qty, :iid) is carried in the page buttons' custom_id.
+INV_PAGE_SIZE = 10
+INV_SORTS = {
+    "name": ("A–Z", "inv.name, inv.item_id",
+             "(inv.name, inv.item_id) > ((SELECT name FROM rpg_items WHERE item_id = :iid), :iid)",
+             "inv.name DESC, inv.item_id DESC",
+             "(inv.name, inv.item_id) < ((SELECT name FROM rpg_items WHERE item_id = :iid), :iid)"),
+    "qty": ("Most owned", "inv.qty DESC, inv.item_id",
+            "(inv.qty < :qty OR (inv.qty = :qty AND inv.item_id > :iid))",
+            "inv.qty, inv.item_id DESC",
+            "(inv.qty > :qty OR (inv.qty = :qty AND inv.item_id < :iid))"),
+    "new": ("Newest", "inv.acquired_at DESC, inv.item_id DESC",
+            "(inv.acquired_at, inv.item_id) < ((SELECT acquired_at FROM rpg_inventory "
+            "WHERE user_id = :uid AND guild_id = :gid AND item_id = :iid), :iid)",
+            "inv.acquired_at, inv.item_id",
+            "(inv.acquired_at, inv.item_id) > ((SELECT acquired_at FROM rpg_inventory "
+            "WHERE user_id = :uid AND guild_id = :gid AND item_id = :iid), :iid)"),
+}
+
+# =========================
+# AI response schemas
+# =========================
+ITEM_STATS = ("hp", "atk", "def", "xp")
+
+SHOP_SCHEMA = Schema("shop", Object({
+    "items": ListOf(Object({
+        "name": Str(50, default="Mysterious Trinket"),
+        "description": Str(120, default="An odd curio."),
+        "cost": Int(10, 300, default=lambda: random.randint(30, 100)),
+        "effects": ListOf(Object({
+            "stat": Enum(ITEM_STATS),
+            "amount": Int(1, MAX_ITEM_BONUS, default=1),
+        }), max_items=4, default=lambda: [{"stat": "hp", "amount": 2}]),
+    }), max_items=12, default=list),
+}))
+
+ENCOUNTER_SCHEMA = Schema("encounter", Object({
+    "name": Str(60, default=""),
+    "description": Str(180, default=""),
+    "scene": Str(140, default=""),
+}))
+
+LINE_SCHEMA = Schema("line", Object({"line": Str(200)}))
+
 # =========================
 # DB Setup
 # =========================
@@ -49,14 +136,27 @@ CREATE TABLE IF NOT EXISTS rpg_users (
 );
 """
 
+# Item catalog: one row per distinct (name, effects); inventories reference it by id
+CREATE_ITEMS = """
+CREATE TABLE IF NOT EXISTS rpg_items (
+    item_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    effects_json TEXT NOT NULL DEFAULT '[]',
+    UNIQUE (name, effects_json)
+);
+"""
+
 CREATE_INV = """
 CREATE TABLE IF NOT EXISTS rpg_inventory (
     user_id TEXT NOT NULL,
     guild_id TEXT NOT NULL,
-    item TEXT NOT NULL,
+    item_id INTEGER NOT NULL REFERENCES rpg_items (item_id),
     qty INTEGER NOT NULL DEFAULT 0,
-    PRIMARY KEY (user_id, guild_id, item)
-);
+    name TEXT NOT NULL DEFAULT '',  -- copy of rpg_items.name (catalog names never change), for the indexed A–Z sort
+    acquired_at INTEGER NOT NULL DEFAULT 0,  -- unix time the player last got one; 0 = before this was tracked
+    PRIMARY KEY (user_id, guild_id, item_id)
+) WITHOUT ROWID;
 """
 
 CREATE_SHOP_CACHE = """
@@ -68,16 +168,120 @@ CREATE TABLE IF NOT EXISTS rpg_shop_cache (
 );
 """
 
+CREATE_SHOP_POOL = """
+CREATE TABLE IF NOT EXISTS rpg_shop_pool (
+    yyyymmdd TEXT NOT NULL,
+    bracket INTEGER NOT NULL,
+    data_json TEXT NOT NULL,
+    PRIMARY KEY (yyyymmdd, bracket)
+);
+"""
+
+# Small key/value store for bot-level state (e.g. when the economy last ticked)
+CREATE_META = """
+CREATE TABLE IF NOT EXISTS rpg_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
 def _connect():
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
     return conn
 
+def _effects_key(effects: List[Dict[str, Any]]) -> str:
+    """Canonical JSON for an effects list, used for catalog de-duplication."""
+    return json.dumps(effects, sort_keys=True, separators=(",", ":"))
+
+def _migrate_inventory(c: sqlite3.Connection):
+    """
+    One-time move from name-keyed inventory rows to catalog ids. Item details are
+    recovered from any cached shop that sold an item with that name; unknown items
+    get an empty description/effects.
+    """
+    cols = [r[1] for r in c.execute("PRAGMA table_info(rpg_inventory)")]
+    if "item" not in cols:
+        return
+
+    known: Dict[str, Dict[str, Any]] = {}
+    for row in c.execute("SELECT data_json FROM rpg_shop_cache ORDER BY yyyymmdd"):
+        try:
+            for it in json.loads(row[0]):
+                known.setdefault(it["name"], it)
+        except Exception:
+            continue
+
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        ids: Dict[str, int] = {}
+        for (name,) in c.execute("SELECT DISTINCT item FROM rpg_inventory").fetchall():
+            it = known.get(name, {})
+            effects = _effects_key(it.get("effects", []))
+            c.execute("INSERT OR IGNORE INTO rpg_items (name, description, effects_json) VALUES (?, ?, ?)",
+                      (name, it.get("description", ""), effects))
+            ids[name] = c.execute("SELECT item_id FROM rpg_items WHERE name=? AND effects_json=?", (name, effects)).fetchone()[0]
+
+        c.execute("ALTER TABLE rpg_inventory RENAME TO rpg_inventory_old")
+        c.execute(CREATE_INV)
+        c.executemany(
+            "INSERT INTO rpg_inventory (user_id, guild_id, item_id, qty, name) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (user_id, guild_id, item_id) DO UPDATE SET qty = qty + excluded.qty",
+            ((u, g, ids[name], q, name) for u, g, name, q in
+             c.execute("SELECT user_id, guild_id, item, qty FROM rpg_inventory_old").fetchall())
+        )
+        c.execute("DROP TABLE rpg_inventory_old")
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+
+def _migrate_inventory_names(c: sqlite3.Connection):
+    """Adds rpg_inventory.name (for the A–Z page index) and fills it from the catalog."""
+    cols = [r[1] for r in c.execute("PRAGMA table_info(rpg_inventory)")]
+    if "name" in cols:
+        return
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        c.execute("ALTER TABLE rpg_inventory ADD COLUMN name TEXT NOT NULL DEFAULT ''")
+        c.execute("UPDATE rpg_inventory SET name = (SELECT name FROM rpg_items i WHERE i.item_id = rpg_inventory.item_id)")
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+
+def _migrate_inventory_acquired(c: sqlite3.Connection):
+    """
+    Adds rpg_inventory.acquired_at for the Newest sort. Existing rows keep 0: when they
+    were acquired is unknown, so they sort after anything newer, by catalog id.
+    """
+    cols = [r[1] for r in c.execute("PRAGMA table_info(rpg_inventory)")]
+    if "acquired_at" in cols:
+        return
+    c.execute("ALTER TABLE rpg_inventory ADD COLUMN acquired_at INTEGER NOT NULL DEFAULT 0")
+
 def _init_db():
     with _connect() as c:
+        c.execute("PRAGMA journal_mode=WAL")
         c.execute(CREATE_USERS)
+        c.execute(CREATE_ITEMS)
         c.execute(CREATE_INV)
         c.execute(CREATE_SHOP_CACHE)
+        c.execute(CREATE_SHOP_POOL)
+        c.execute(CREATE_META)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_rpg_users_guild ON rpg_users (guild_id, lvl)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_rpg_users_guild_rowid ON rpg_users (guild_id)")  # economy tick walk
+    c = sqlite3.connect(DB_FILE, isolation_level=None)
+    try:
+        _migrate_inventory(c)
+        _migrate_inventory_names(c)
+        _migrate_inventory_acquired(c)
+        # After the migrations: older databases lack item_id / name / acquired_at until then
+        c.execute("CREATE INDEX IF NOT EXISTS idx_rpg_inventory_qty ON rpg_inventory (user_id, guild_id, qty DESC, item_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_rpg_inventory_name ON rpg_inventory (user_id, guild_id, name, item_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_rpg_inventory_new ON rpg_inventory (user_id, guild_id, acquired_at, item_id)")
+    finally:
+        c.close()
 _init_db()
 
 def _now() -> int:
@@ -86,6 +290,83 @@ def _now() -> int:
 def _today_key() -> str:
     return time.strftime("%Y%m%d", time.gmtime())
 
+def _level_bracket(lvl: int) -> int:
+    for i, (lo, hi) in enumerate(SHOP_LEVEL_BRACKETS):
+        if lo <= lvl <= hi:
+            return i
+    return 0
+
+# =========================
+# Economy tick (blocking; run in a thread)
+# =========================
+HP_CAP_SQL = f"({HP_CAP_BASE} + {HP_CAP_PER_LEVEL} * (lvl - 1))"
+
+def _meta_get(key: str) -> Optional[str]:
+    with _connect() as c:
+        row = c.execute("SELECT value FROM rpg_meta WHERE key=?", (key,)).fetchone()
+    return row["value"] if row else None
+
+def _meta_set(key: str, value: str) -> None:
+    with _connect() as c:
+        c.execute("INSERT INTO rpg_meta (key, value) VALUES (?, ?) "
+                  "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, value))
+        c.commit()
+
+def _player_guilds() -> List[str]:
+    with _connect() as c:
+        return [r[0] for r in c.execute("SELECT DISTINCT guild_id FROM rpg_users")]
+
+def tick_guild(guild_id: str, now: int) -> Tuple[int, int]:
+    """
+    Regenerates HP (and pays PASSIVE_INCOME) for one guild; returns (players healed,
+    players paid). The guild is walked in rowid order along idx_rpg_users_guild_rowid,
+    ECONOMY_CHUNK_ROWS players per IMMEDIATE transaction, each chunk being one or two
+    set-based UPDATEs. rowid never changes, so players leveling up between chunks are
+    still visited exactly once; the level-based cap is read inside the UPDATE.
+    """
+    healed = paid = 0
+    lo = 0   # rowids start at 1
+    c = sqlite3.connect(DB_FILE, isolation_level=None)
+    try:
+        while True:
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                row = c.execute(
+                    "SELECT rowid FROM rpg_users WHERE guild_id=? AND rowid > ? "
+                    "ORDER BY rowid LIMIT 1 OFFSET ?",
+                    (guild_id, lo, ECONOMY_CHUNK_ROWS - 1)
+                ).fetchone()
+                hi = row[0] if row else None
+                chunk = "guild_id=? AND rowid > ?" + (" AND rowid <= ?" if hi is not None else "")
+                args = (guild_id, lo) + ((hi,) if hi is not None else ())
+                healed += c.execute(
+                    f"UPDATE rpg_users SET hp = MIN({HP_CAP_SQL}, hp + MAX(1, {HP_CAP_SQL} * {HP_REGEN_PCT} / 100)) "
+                    f"WHERE {chunk} AND hp < {HP_CAP_SQL}",
+                    args
+                ).rowcount
+                if PASSIVE_INCOME > 0:
+                    paid += c.execute(
+                        f"UPDATE rpg_users SET coins = coins + ? "
+                        f"WHERE {chunk} AND MAX(last_mine, last_train, last_adventure, last_gamble) >= ?",
+                        (PASSIVE_INCOME, *args, now - PASSIVE_ACTIVE_WINDOW)
+                    ).rowcount
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+            if hi is None:
+                return healed, paid
+            lo = hi
+            time.sleep(ECONOMY_CHUNK_PAUSE)
+    finally:
+        c.close()
+
+FALLBACK_SHOP = [
+    {"name": "Health Potion", "description": "A simple red potion that restores vitality.", "cost": 25, "effects": [{"stat":"hp","amount":3}]},
+    {"name": "Iron Sword", "description": "A sturdy blade to improve your strikes.", "cost": 70, "effects": [{"stat":"atk","amount":2}]},
+    {"name": "Leather Vest", "description": "Worn but comfy (+1 DEF).", "cost": 60, "effects": [{"stat":"def","amount":1}]},
+]
+
 # =========================
 # Cog
 # =========================
@@ -94,6 +375,14 @@ class RPGCog(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self._ai_inflight = 0
+        self._shop_inflight: Dict[str, asyncio.Task] = {}      # guild_id -> shop generation
+        self._shop_wanted: set = set()                          # guilds a real request is waiting on
+        self._pool_inflight: Dict[Tuple[str, int], asyncio.Task] = {}  # (day, bracket) -> pool generation
+        self._shop_mem: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}  # guild_id -> (day, items)
+        self._lb_cache: Dict[Tuple[str, str], Tuple[float, int, List[sqlite3.Row]]] = {}  # (guild_id, metric) -> (expires, limit, rows)
+        self._prefetch: Dict[Tuple[str, str], Dict[str, Any]] = {}  # (user_id, guild_id) -> slot
+        self._inv_counts: Dict[Tuple[str, str], int] = {}  # (user_id, guild_id) -> distinct items owned
 
     # ---------- Core utils ----------
     def _client(self):
@@ -121,27 +410,72 @@ class RPGCog(commands.Cog):
             c.execute(f"UPDATE rpg_users SET {keys} WHERE user_id=? AND guild_id=?", vals)
             c.commit()
 
-    def inv_add(self, user_id: int, guild_id: int, item: str, qty: int = 1):
+    def catalog_ids(self, items: List[Dict[str, Any]]) -> List[int]:
+        """Catalog id for each shop item, inserting new (name, effects) pairs."""
+        ids = []
         with _connect() as c:
-            row = c.execute(
-                "SELECT qty FROM rpg_inventory WHERE user_id=? AND guild_id=? AND item=?",
-                (str(user_id), str(guild_id), item)
-            ).fetchone()
-            if row:
-                c.execute("UPDATE rpg_inventory SET qty=qty+? WHERE user_id=? AND guild_id=? AND item=?",
-                          (qty, str(user_id), str(guild_id), item))
-            else:
-                c.execute("INSERT INTO rpg_inventory (user_id, guild_id, item, qty) VALUES (?, ?, ?, ?)",
-                          (str(user_id), str(guild_id), item, qty))
+            for it in items:
+                effects = _effects_key(it["effects"])
+                c.execute("INSERT OR IGNORE INTO rpg_items (name, description, effects_json) VALUES (?, ?, ?)",
+                          (it["name"], it.get("description", ""), effects))
+                ids.append(c.execute("SELECT item_id FROM rpg_items WHERE name=? AND effects_json=?",
+                                     (it["name"], effects)).fetchone()["item_id"])
             c.commit()
+        return ids
 
-    def inv_all(self, user_id: int, guild_id: int) -> List[Tuple[str, int]]:
+    def inv_add(self, user_id: int, guild_id: int, item_id: int, qty: int = 1):
+        self._inv_counts.pop((str(user_id), str(guild_id)), None)
         with _connect() as c:
-            rows = c.execute(
-                "SELECT item, qty FROM rpg_inventory WHERE user_id=? AND guild_id=? ORDER BY item",
+            c.execute(
+                "INSERT INTO rpg_inventory (user_id, guild_id, item_id, qty, name, acquired_at) "
+                "VALUES (?, ?, ?, ?, (SELECT name FROM rpg_items WHERE item_id = ?), ?) "
+                "ON CONFLICT (user_id, guild_id, item_id) DO UPDATE SET "
+                "qty = qty + excluded.qty, acquired_at = excluded.acquired_at",
+                (str(user_id), str(guild_id), item_id, qty, item_id, _now())
+            )
+            c.commit()
+
+    def inv_all(self, user_id: int, guild_id: int) -> List[sqlite3.Row]:
+        """Rows of (item_id, name, effects_json, qty), ordered by name."""
+        with _connect() as c:
+            return c.execute(
+                "SELECT i.item_id, i.name, i.effects_json, inv.qty FROM rpg_inventory inv "
+                "JOIN rpg_items i ON i.item_id = inv.item_id "
+                "WHERE inv.user_id=? AND inv.guild_id=? ORDER BY inv.name",
                 (str(user_id), str(guild_id))
             ).fetchall()
-        return [(r["item"], r["qty"]) for r in rows]
+
+    def inv_count(self, user_id: int, guild_id: int) -> int:
+        """Distinct items owned. Cached; inv_add and the resets invalidate it."""
+        key = (str(user_id), str(guild_id))
+        count = self._inv_counts.get(key)
+        if count is None:
+            with _connect() as c:
+                count = c.execute("SELECT COUNT(*) FROM rpg_inventory WHERE user_id=? AND guild_id=?", key).fetchone()[0]
+            self._inv_counts[key] = count
+        return count
+
+    def inv_page(self, user_id: int, guild_id: int, sort: str = "name",
+                 anchor: Optional[Tuple[int, int]] = None, forward: bool = True) -> List[sqlite3.Row]:
+        """
+        One page of (item_id, name, effects_json, qty) in `sort` order: the rows after the
+        (qty, item_id) anchor, or before it when not `forward`. No anchor = first page.
+        """
+        _, order, after, order_back, before = INV_SORTS.get(sort, INV_SORTS["name"])
+        params = {"uid": str(user_id), "gid": str(guild_id), "qty": 0, "iid": 0, "n": INV_PAGE_SIZE}
+        cond = ""
+        if anchor is not None:
+            params["qty"], params["iid"] = anchor
+            cond = " AND " + (after if forward else before)
+        with _connect() as c:
+            rows = c.execute(
+                "SELECT i.item_id, i.name, i.effects_json, inv.qty FROM rpg_inventory inv "
+                "JOIN rpg_items i ON i.item_id = inv.item_id "
+                f"WHERE inv.user_id = :uid AND inv.guild_id = :gid{cond} "
+                f"ORDER BY {order if forward else order_back} LIMIT :n",
+                params
+            ).fetchall()
+        return rows if forward else rows[::-1]
 
     # ---------- Embeds ----------
     def embed_profile(self, user_id: int, guild_id: int) -> discord.Embed:
@@ -156,49 +490,83 @@ class RPGCog(commands.Cog):
         e.set_footer(text="Use the menu below.")
         return e
 
-    def embed_inventory(self, user_id: int, guild_id: int) -> discord.Embed:
-        items = self.inv_all(user_id, guild_id)
-        desc = "_Empty._" if not items else "\n".join([f"• **{n}** ×{q}" for n, q in items])
-        return discord.Embed(title="🎒 Inventory", description=desc, color=discord.Color.dark_teal())
+    def embed_inventory(self, rows: List[sqlite3.Row], sort: str, page: int, count: int) -> discord.Embed:
+        lines = []
+        for r in rows:
+            eff_txt = ", ".join([f"{e['stat'].upper()}+{e['amount']}" for e in json.loads(r["effects_json"])])
+            lines.append(f"• **{r['name']}** ×{r['qty']}" + (f" — _{eff_txt}_" if eff_txt else ""))
+        desc = "_Empty._" if not lines else "\n".join(lines)
+        e = discord.Embed(title="🎒 Inventory", description=desc, color=discord.Color.dark_teal())
+        if count:
+            pages = max(1, -(-count // INV_PAGE_SIZE))
+            e.set_footer(text=f"Page {min(page, pages)}/{pages} · {count} items · sorted {INV_SORTS[sort][0]}")
+        return e
+
+    def inventory_screen(self, user_id: int, guild_id: int, sort: str = "name", page: int = 1,
+                         anchor: Optional[Tuple[int, int]] = None,
+                         forward: bool = True) -> Tuple[discord.Embed, discord.ui.View]:
+        """Embed + view for one inventory page; reads only that page (and the cached count)."""
+        sort = sort if sort in INV_SORTS else "name"
+        rows = self.inv_page(user_id, guild_id, sort, anchor, forward)
+        if not rows and anchor is not None:
+            # Anchor rows went away (reset, etc.): start over from the first page
+            page, rows = 1, self.inv_page(user_id, guild_id, sort)
+        count = self.inv_count(user_id, guild_id)
+        return self.embed_inventory(rows, sort, page, count), self.inventory_view(user_id, sort, page, rows, count)
 
     # ---------- AI glue ----------
-    async def _ai_chat_json(self, sys_prompt: str, user_prompt: str) -> Optional[Dict[str, Any]]:
+    async def _ai_chat_json(self, sys_prompt: str, user_prompt: str, schema: Schema,
+                            task: str = "flavor") -> Optional[Dict[str, Any]]:
         """
-        Calls your openai_client.chat.completions.create and asks for a JSON object.
-        Returns parsed dict or None on failure.
+        Asks the model routed for `task` ("flavor" lines or "structured" documents) for a JSON object,
+        on the task's cheaper route when the guild is near its daily budget.
+        Returns the response decoded through `schema` (clamped, defaults filled), or None on failure.
         """
         client = self._client()
         if not client:
             return None
+        state = USAGE.budget_state()
+        if state == REFUSE:
+            return None   # over the guild's daily budget: callers use their fallbacks
+        if state == DOWNGRADE and task in DOWNGRADE_TASKS:
+            METRICS.incr("rpg.ai_downgraded")
+            task = DOWNGRADE_TASKS[task]
+        if task == "flavor" and OVERLOAD.tier() >= TIER_FLAVOR:
+            METRICS.incr("rpg.flavor_shed")
+            return None
+        self._ai_inflight += 1
         try:
-            resp = await asyncio.to_thread(
-                lambda: client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    response_format={"type": "json_object"},
-                    messages=[
-                        {"role": "system", "content": sys_prompt},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    temperature=0.9,
-                    max_tokens=700,
-                )
+            resp, _ = await ROUTER.complete(
+                client, task,
+                [
+                    {"role": "system", "content": sys_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                response_format={"type": "json_object"},
             )
             content = resp.choices[0].message.content
-            return json.loads(content)
         except Exception:
             return None
+        finally:
+            self._ai_inflight -= 1
+        return schema.decode(content)
 
     # ---------- Shop (AI rotating per-guild per-day) ----------
     def _shop_cache_get(self, guild_id: int) -> Optional[List[Dict[str, Any]]]:
         k = _today_key()
+        mem = self._shop_mem.get(str(guild_id))
+        if mem and mem[0] == k:
+            return mem[1]
         with _connect() as c:
             row = c.execute("SELECT data_json FROM rpg_shop_cache WHERE guild_id=? AND yyyymmdd=?",
                             (str(guild_id), k)).fetchone()
             if row:
                 try:
-                    return json.loads(row["data_json"])
+                    items = json.loads(row["data_json"])
                 except Exception:
                     return None
+                self._shop_mem[str(guild_id)] = (k, items)
+                return items
         return None
 
     def _shop_cache_set(self, guild_id: int, items: List[Dict[str, Any]]):
@@ -207,13 +575,112 @@ class RPGCog(commands.Cog):
             c.execute("INSERT OR REPLACE INTO rpg_shop_cache (guild_id, yyyymmdd, data_json) VALUES (?, ?, ?)",
                       (str(guild_id), k, json.dumps(items)))
             c.commit()
+        for g in [g for g, (day, _) in self._shop_mem.items() if day != k]:
+            del self._shop_mem[g]
+        self._shop_mem[str(guild_id)] = (k, items)
 
     async def get_ai_shop(self, guild_id: int, avg_player_lvl: int) -> List[Dict[str, Any]]:
+        """Today's shop. Concurrent callers (including a prefetch) share one generation."""
+        cached = self._shop_cache_get(guild_id)
+        if cached:
+            return cached
+        key = str(guild_id)
+        self._shop_wanted.add(key)
+        try:
+            return await asyncio.shield(self._shop_task(guild_id, avg_player_lvl))
+        finally:
+            self._shop_wanted.discard(key)
+
+    def _shop_task(self, guild_id: int, avg_player_lvl: int) -> asyncio.Task:
+        key = str(guild_id)
+        task = self._shop_inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._generate_shop(guild_id, avg_player_lvl))
+            self._shop_inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._shop_inflight.pop(k, None) if self._shop_inflight.get(k) is t else None)
+        return task
+
+    async def _generate_shop(self, guild_id: int, avg_player_lvl: int) -> List[Dict[str, Any]]:
         cached = self._shop_cache_get(guild_id)
         if cached:
             return cached
 
-        n_items = random.randint(*SHOP_ITEMS_PER_DAY)
+        players, guild_lvl = self.guild_level_stats(guild_id)
+        if players:
+            avg_player_lvl = guild_lvl
+        if players >= SHOP_LARGE_GUILD_PLAYERS:
+            items = await self._ai_shop_items(random.randint(*SHOP_ITEMS_PER_DAY), avg_player_lvl)
+            METRICS.incr("rpg.shop_per_guild")
+        else:
+            pool = await self._shop_pool(_level_bracket(avg_player_lvl))
+            items = self._sample_pool(pool, guild_id)
+            METRICS.incr("rpg.shop_from_pool")
+
+        items = self._finalize_shop(items)
+        self._shop_cache_set(guild_id, items)
+        return items
+
+    def guild_level_stats(self, guild_id: int) -> Tuple[int, int]:
+        """(player count, rounded average level) for a guild."""
+        with _connect() as c:
+            n, avg = c.execute("SELECT COUNT(*), AVG(lvl) FROM rpg_users WHERE guild_id=?", (str(guild_id),)).fetchone()
+        return n, round(avg or 1)
+
+    @staticmethod
+    def _sample_pool(pool: List[Dict[str, Any]], guild_id: int) -> List[Dict[str, Any]]:
+        """Deterministic per-guild, per-day sample, so guilds sharing a pool still see different shops."""
+        rng = random.Random(zlib.crc32(f"{guild_id}:{_today_key()}".encode()))
+        n = min(rng.randint(*SHOP_ITEMS_PER_DAY), len(pool))
+        return [dict(it) for it in rng.sample(pool, n)]
+
+    # ---------- Shared shop pool ----------
+    def _pool_get(self, day: str, bracket: int) -> Optional[List[Dict[str, Any]]]:
+        with _connect() as c:
+            row = c.execute("SELECT data_json FROM rpg_shop_pool WHERE yyyymmdd=? AND bracket=?", (day, bracket)).fetchone()
+        if row:
+            try:
+                return json.loads(row["data_json"])
+            except Exception:
+                return None
+        return None
+
+    async def _shop_pool(self, bracket: int) -> List[Dict[str, Any]]:
+        """Today's item pool for a level bracket; concurrent guilds share one generation."""
+        day = _today_key()
+        pool = self._pool_get(day, bracket)
+        if pool:
+            return pool
+        key = (day, bracket)
+        task = self._pool_inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._generate_pool(day, bracket))
+            self._pool_inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._pool_inflight.pop(k, None) if self._pool_inflight.get(k) is t else None)
+        return await asyncio.shield(task)
+
+    async def _generate_pool(self, day: str, bracket: int) -> List[Dict[str, Any]]:
+        lo, hi = SHOP_LEVEL_BRACKETS[bracket]
+        lvl = lo if hi >= 10**9 else (lo + hi) // 2
+        batches = await asyncio.gather(*(self._ai_shop_items(SHOP_POOL_BATCH_ITEMS, lvl) for _ in range(SHOP_POOL_BATCHES)))
+        pool: List[Dict[str, Any]] = []
+        seen = set()
+        for it in (it for batch in batches for it in batch):
+            if it["name"].lower() not in seen:
+                seen.add(it["name"].lower())
+                pool.append(it)
+        if not pool:
+            # AI unavailable: serve the basics without persisting, so a later call can retry
+            return [dict(it) for it in FALLBACK_SHOP]
+        with _connect() as c:
+            c.execute("INSERT OR REPLACE INTO rpg_shop_pool (yyyymmdd, bracket, data_json) VALUES (?, ?, ?)",
+                      (day, bracket, json.dumps(pool)))
+            c.execute("DELETE FROM rpg_shop_pool WHERE yyyymmdd < ?", (day,))
+            c.commit()
+        METRICS.incr("rpg.shop_pool_generated")
+        return pool
+
+    async def _ai_shop_items(self, n_items: int, avg_player_lvl: int) -> List[Dict[str, Any]]:
+        """One AI call for n_items shop items, clamped to the balance limits. [] if the AI fails."""
         sys_p = (
             "You design balanced, whimsical RPG shop items for a text RPG. "
             "Return JSON: {items:[{name:str, description:str<=120, cost:int(20..160), "
@@ -224,26 +691,10 @@ class RPGCog(commands.Cog):
             "Keep effects small, fair, and interesting. Prefer 1-2 effects. Avoid pure XP items."
         )
 
-        data = await self._ai_chat_json(sys_p, user_p)
-        items: List[Dict[str, Any]] = []
-        if data and isinstance(data.get("items"), list):
-            for it in data["items"]:
-                name = str(it.get("name", "Mysterious Trinket"))[:50]
-                desc = str(it.get("description", "An odd curio."))[:120]
-                cost = int(it.get("cost", random.randint(30, 100)))
-                cost = max(10, min(cost, 300))
-                effects = []
-                for eff in it.get("effects", []):
-                    stat = str(eff.get("stat", "hp"))
-                    if stat not in ("hp", "atk", "def", "xp"):
-                        continue
-                    amt = int(eff.get("amount", 1))
-                    amt = max(1, min(amt, MAX_ITEM_BONUS))
-                    effects.append({"stat": stat, "amount": amt})
-                if not effects:
-                    effects = [{"stat": "hp", "amount": 2}]
-                items.append({"name": name, "description": desc, "cost": cost, "effects": effects})
+        data = await self._ai_chat_json(sys_p, user_p, SHOP_SCHEMA, task="structured")
+        return data["items"] if data else []
 
+    def _finalize_shop(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         # --- Guarantee essentials ---
         has_hp = any(any(e["stat"] == "hp" for e in it["effects"]) for it in items)
         has_atk = any(any(e["stat"] == "atk" for e in it["effects"]) for it in items)
@@ -265,13 +716,10 @@ class RPGCog(commands.Cog):
 
         # --- Fallback if AI completely failed ---
         if not items:
-            items = [
-                {"name": "Health Potion", "description": "A simple red potion that restores vitality.", "cost": 25, "effects": [{"stat":"hp","amount":3}]},
-                {"name": "Iron Sword", "description": "A sturdy blade to improve your strikes.", "cost": 70, "effects": [{"stat":"atk","amount":2}]},
-                {"name": "Leather Vest", "description": "Worn but comfy (+1 DEF).", "cost": 60, "effects": [{"stat":"def","amount":1}]},
-            ]
+            items = [dict(it) for it in FALLBACK_SHOP]
 
-        self._shop_cache_set(guild_id, items)
+        for it, item_id in zip(items, self.catalog_ids(items)):
+            it["item_id"] = item_id
         return items
 
     def embed_shop(self, user_id: int, guild_id: int, items: List[Dict[str, Any]]) -> discord.Embed:
@@ -331,10 +779,11 @@ class RPGCog(commands.Cog):
         line = "You chip away at a glittering seam and pocket a few nuggets."
         data = await self._ai_chat_json(
             "You write one short vivid line for a fantasy mine/work action. Return JSON {line:str}.",
-            "Give one line describing the scene."
+            "Give one line describing the scene.",
+            LINE_SCHEMA
         )
-        if data and "line" in data:
-            line = str(data["line"])[:200]
+        if data:
+            line = data["line"]
 
         return discord.Embed(title="⛏️ Mine", description=f"{line}\n\nYou earn **{payout}** coins.", color=discord.Color.dark_teal())
 
@@ -363,10 +812,11 @@ class RPGCog(commands.Cog):
         coach = "The grizzled coach nods with approval."
         data = await self._ai_chat_json(
             "You are a colorful RPG trainer. Return JSON {line:str}.",
-            f"Player increased {stat.upper()} by {gain}. Give one energetic line."
+            f"Player increased {stat.upper()} by {gain}. Give one energetic line.",
+            LINE_SCHEMA
         )
-        if data and "line" in data:
-            coach = str(data["line"])[:200]
+        if data:
+            coach = data["line"]
 
         return discord.Embed(title="🏋️ Training Complete", description=f"{coach}\n{xp_text}", color=discord.Color.orange())
 
@@ -392,10 +842,11 @@ class RPGCog(commands.Cog):
         dealer = "The dealer taps the table, unreadable."
         data = await self._ai_chat_json(
             "You are a dry, witty casino dealer NPC. Return JSON {line:str}.",
-            f"Player rolled {roll}. Emote a short one-liner."
+            f"Player rolled {roll}. Emote a short one-liner.",
+            LINE_SCHEMA
         )
-        if data and "line" in data:
-            dealer = str(data["line"])[:200]
+        if data:
+            dealer = data["line"]
 
         desc = f"You rolled **d20 = {roll}**.\n"
         desc += f"{'Winner! You receive **' + str(payout) + '** coins.' if payout > 0 else 'No luck this time.'}\n\n{dealer}"
@@ -418,10 +869,11 @@ class RPGCog(commands.Cog):
         quip = "The coin dances end over end."
         data = await self._ai_chat_json(
             "You narrate coinflips wryly. Return JSON {line:str}.",
-            f"The coin shows {side}. Player {'wins' if win else 'loses'}."
+            f"The coin shows {side}. Player {'wins' if win else 'loses'}.",
+            LINE_SCHEMA
         )
-        if data and "line" in data:
-            quip = str(data["line"])[:200]
+        if data:
+            quip = data["line"]
 
         return discord.Embed(
             title="🪙 Coinflip",
@@ -429,6 +881,107 @@ class RPGCog(commands.Cog):
             color=discord.Color.purple()
         )
 
+    async def _flavor_encounter(self, enc: Dict[str, Any]) -> None:
+        """Let the AI rename/describe a procedural enemy in place. Stats are never touched."""
+        enemy = enc["enemy"]
+        try:
+            data = await asyncio.wait_for(self._ai_chat_json(
+                "You name and describe enemies for a text RPG. "
+                "Return JSON: {name:str<=60, description:str<=180, scene:str<=140}",
+                f"A {enc['tier']} enemy ({enemy['name']}) with ATK {enemy['atk']}, DEF {enemy['def']}. "
+                f"Setting: {enc['scene']}",
+                ENCOUNTER_SCHEMA
+            ), timeout=ENCOUNTER_AI_TIMEOUT)
+        except asyncio.TimeoutError:
+            return
+        if not data:
+            return
+        # Empty strings mean the field was missing or unusable: keep the procedural text
+        if data["name"]:
+            enemy["name"] = data["name"]
+        if data["description"]:
+            enemy["description"] = data["description"]
+        if data["scene"]:
+            enc["scene"] = data["scene"]
+
+    async def _prepare_encounter(self, u: sqlite3.Row, user_id: int, guild_id: int) -> Dict[str, Any]:
+        # Seeded by the last adventure time: the same "next encounter" until it is fought
+        enc = generate_encounter(u, encounter_rng(user_id, guild_id, u["last_adventure"]))
+        if ENCOUNTER_AI_FLAVOR:
+            await self._flavor_encounter(enc)
+        return enc
+
+    # ---------- Speculative prefetch ----------
+    @staticmethod
+    def _prefetch_stats(u: sqlite3.Row) -> Tuple[int, ...]:
+        return (u["lvl"], u["atk"], u["def"], u["last_adventure"])
+
+    def prefetch_for_menu(self, user_id: int, guild_id: int):
+        """
+        Called when the menu opens: start today's shop and this player's next encounter
+        in the background so choosing Shop/Adventure can answer without waiting on AI.
+        Skipped (and outstanding prefetches cancelled) when the AI backlog is high.
+        """
+        if self._ai_inflight >= PREFETCH_MAX_AI_INFLIGHT:
+            METRICS.incr("rpg.prefetch_skipped")
+            self.cancel_prefetches()
+            return
+        key = (str(user_id), str(guild_id))
+        u = self.get_user(user_id, guild_id)
+        slot = self._prefetch.get(key)
+        if slot and slot["stats"] == self._prefetch_stats(u) and "encounter" in slot:
+            return  # still valid (e.g. the player pressed Back)
+        self._drop_prefetch(key)
+
+        slot = {
+            "stats": self._prefetch_stats(u),
+            "encounter": asyncio.create_task(self._prepare_encounter(u, user_id, guild_id)),
+        }
+        if not self._shop_cache_get(guild_id):
+            slot["shop"] = self._shop_task(guild_id, u["lvl"])
+        slot["timer"] = asyncio.get_running_loop().call_later(PREFETCH_TTL, self._drop_prefetch, key, slot)
+        self._prefetch[key] = slot
+        METRICS.incr("rpg.prefetch_started")
+
+    def _drop_prefetch(self, key: Tuple[str, str], expected: Optional[Dict[str, Any]] = None):
+        slot = self._prefetch.get(key)
+        if slot is None or (expected is not None and slot is not expected):
+            return
+        del self._prefetch[key]
+        slot["timer"].cancel()
+        task = slot.get("encounter")
+        if task and not task.done():
+            task.cancel()
+            METRICS.incr("rpg.prefetch_discarded")
+        shop = slot.get("shop")
+        if shop and not shop.done() and key[1] not in self._shop_wanted:
+            shop.cancel()
+
+    def cancel_prefetches(self):
+        for key in list(self._prefetch):
+            self._drop_prefetch(key)
+
+    def encounter_ready(self, user_id: int, guild_id: int) -> bool:
+        slot = self._prefetch.get((str(user_id), str(guild_id)))
+        task = slot.get("encounter") if slot else None
+        if not (task and task.done() and not task.cancelled() and task.exception() is None):
+            return False
+        return slot["stats"] == self._prefetch_stats(self.get_user(user_id, guild_id))
+
+    async def _take_prefetched_encounter(self, user_id: int, guild_id: int, u: sqlite3.Row) -> Optional[Dict[str, Any]]:
+        slot = self._prefetch.get((str(user_id), str(guild_id)))
+        if not slot or slot["stats"] != self._prefetch_stats(u):
+            return None
+        task = slot.pop("encounter", None)
+        if task is None:
+            return None
+        try:
+            enc = await task
+        except (asyncio.CancelledError, Exception):
+            return None
+        METRICS.incr("rpg.prefetch_used")
+        return enc
+
     async def do_adventure(self, user_id: int, guild_id: int) -> discord.Embed:
         u = self.get_user(user_id, guild_id)
         now = _now()
@@ -436,42 +989,25 @@ class RPGCog(commands.Cog):
         if cd > 0:
             return discord.Embed(title="🗺️ Resting", description=f"Adventure in **{cd}s**.", color=discord.Color.red())
 
-        sys_p = (
-            "You are a balanced encounter generator for a text RPG. "
-            "Return JSON: {enemy:{name:str, hp:int, atk:int, def:int, description:str<=180}, scene:str<=140}"
-        )
-        user_p = f"Player stats: HP {u['hp']}, ATK {u['atk']}, DEF {u['def']}, LVL {u['lvl']}."
-        data = await self._ai_chat_json(sys_p, user_p)
+        enc = await self._take_prefetched_encounter(user_id, guild_id, u)
+        if enc is None:
+            enc = await self._prepare_encounter(u, user_id, guild_id)
+        enemy, scene = enc["enemy"], enc["scene"]
 
-        enemy = {"name":"Mischief Slime","hp":14,"atk":4,"def":2,"description":"A gelatinous prankster wobbles into view."}
-        scene = "A crooked path through mossy stones."
-        if data:
-            if isinstance(data.get("enemy"), dict):
-                e = data["enemy"]
-                enemy["name"] = str(e.get("name", enemy["name"]))[:60]
-                enemy["hp"] = max(MIN_ENEMY_HP, min(int(e.get("hp", enemy["hp"])), MAX_ENEMY_HP))
-                enemy["atk"] = max(1, min(int(e.get("atk", enemy["atk"])), MAX_ENEMY_STAT))
-                enemy["def"] = max(0, min(int(e.get("def", enemy["def"])), MAX_ENEMY_STAT))
-                enemy["description"] = str(e.get("description", enemy["description"]))[:180]
-            if isinstance(data.get("scene"), str):
-                scene = str(data["scene"])[:140]
-
-        p_roll = random.randint(1, 20) + u["atk"]
-        e_roll = random.randint(1, 20) + enemy["atk"]
-        p_score = max(1, p_roll - enemy["def"])
-        e_score = max(1, e_roll - u["def"])
+        fight = resolve_fight(u, enemy, random)
+        p_roll, e_roll, p_score, e_score = fight["p_roll"], fight["e_roll"], fight["p_score"], fight["e_score"]
 
         lines = [
             f"**Scene:** {scene}",
-            f"You encounter **{enemy['name']}** — {enemy['description']}",
+            f"You encounter **{enemy['name']}** ({enc['tier']}) — {enemy['description']}",
             f"Your strike total: **{p_roll} - {enemy['def']} = {p_score}**",
             f"{enemy['name']} strike total: **{e_roll} - {u['def']} = {e_score}**",
         ]
 
         coins = u["coins"]
-        if p_score >= e_score:
-            xp_reward = random.randint(16, 26)
-            coin_gain = random.randint(12, 26)
+        if fight["won"]:
+            xp_reward = random.randint(*enc["xp_range"])
+            coin_gain = random.randint(*enc["coin_range"])
             coins += coin_gain
             self.set_user(user_id, guild_id, coins=coins, last_adventure=now)
             xp_text = await self.add_xp_and_level(user_id, guild_id, xp_reward)
@@ -492,11 +1028,87 @@ class RPGCog(commands.Cog):
             "xp":    "lvl DESC, xp DESC, coins DESC",
             "coins": "coins DESC, lvl DESC, xp DESC",
         }.get(metric, "lvl DESC, xp DESC, coins DESC")
+        key = (str(guild_id), metric)
+        cached = self._lb_cache.get(key)
+        if cached and cached[0] > time.monotonic() and cached[1] >= limit:
+            return cached[2][:limit]
+        fetch = max(limit, 10)
         with _connect() as c:
-            return c.execute(
+            rows = c.execute(
                 f"SELECT user_id, coins, hp, atk, def, lvl, xp FROM rpg_users WHERE guild_id=? ORDER BY {order} LIMIT ?",
-                (str(guild_id), limit)
+                (str(guild_id), fetch)
             ).fetchall()
+        self._lb_cache[key] = (time.monotonic() + LEADERBOARD_TTL, fetch, rows)
+        return rows[:limit]
+
+    def _invalidate_leaderboards(self, guild_id: int):
+        for key in [k for k in self._lb_cache if k[0] == str(guild_id)]:
+            del self._lb_cache[key]
+
+    # ---------- Economy tick ----------
+    async def run_economy_tick(self) -> Dict[str, int]:
+        """
+        One tick over every guild. The time of the last tick is kept in rpg_meta, so a
+        restart inside the interval doesn't regenerate twice.
+        """
+        now = _now()
+        last = await asyncio.to_thread(_meta_get, "economy_tick_at")
+        if last and now - int(last) < ECONOMY_TICK_MINUTES * 60 * 0.9:
+            return {}
+        totals = {"guilds": 0, "healed": 0, "paid": 0}
+        with METRICS.span("rpg.tick"):
+            for g in await asyncio.to_thread(_player_guilds):
+                healed, paid = await asyncio.to_thread(tick_guild, g, now)
+                if paid:
+                    self._invalidate_leaderboards(g)
+                totals["guilds"] += 1
+                totals["healed"] += healed
+                totals["paid"] += paid
+            await asyncio.to_thread(_meta_set, "economy_tick_at", str(now))
+        METRICS.incr("rpg.tick.healed", totals["healed"])
+        METRICS.incr("rpg.tick.paid", totals["paid"])
+        return totals
+
+    @tasks.loop(minutes=10)
+    async def economy_tick(self):
+        try:
+            await self.run_economy_tick()
+        except Exception as e:
+            print(f"⚠ Economy tick failed: {e}")
+
+    @economy_tick.before_loop
+    async def _before_economy_tick(self):
+        await self.bot.wait_until_ready()
+
+    # ---------- Startup warm-up ----------
+    def warm(self, guild_ids: List[str], budget: WarmupBudget) -> Dict[str, int]:
+        """
+        Blocking (run in a thread). Loads today's shops into memory and precomputes
+        leaderboards for the given guilds, most recently active first, within `budget`.
+        """
+        k = _today_key()
+        done = {"shops": 0, "leaderboards": 0}
+        with _connect() as c:
+            for g, data_json in c.execute("SELECT guild_id, data_json FROM rpg_shop_cache WHERE yyyymmdd=?", (k,)):
+                if not budget.ok():
+                    return done
+                try:
+                    self._shop_mem[g] = (k, json.loads(data_json))
+                except Exception:
+                    continue
+                budget.charge(len(data_json))
+                done["shops"] += 1
+            for (g,) in c.execute("SELECT DISTINCT guild_id FROM rpg_shop_cache WHERE yyyymmdd=?", (k,)).fetchall():
+                if g not in guild_ids:
+                    guild_ids.append(g)
+        for g in guild_ids:
+            for metric in ("level", "coins"):
+                if not budget.ok():
+                    return done
+                rows = self.top_players(int(g), metric, 10)
+                budget.charge(200 * len(rows))
+                done["leaderboards"] += 1
+        return done
 
     def embed_leaderboard(self, guild_id: int, metric: str = "level") -> discord.Embed:
         label = {"level":"Level","xp":"XP","coins":"Coins"}.get(metric, "Level")
@@ -518,6 +1130,8 @@ class RPGCog(commands.Cog):
         return e
 
     def reset_user_progress(self, user_id: int, guild_id: int):
+        self._invalidate_leaderboards(guild_id)
+        self._inv_counts.pop((str(user_id), str(guild_id)), None)
         with _connect() as c:
             c.execute("DELETE FROM rpg_inventory WHERE user_id=? AND guild_id=?", (str(user_id), str(guild_id)))
             c.execute("""
@@ -528,6 +1142,9 @@ class RPGCog(commands.Cog):
             c.commit()
 
     def reset_server_progress(self, guild_id: int):
+        self._invalidate_leaderboards(guild_id)
+        for key in [k for k in self._inv_counts if k[1] == str(guild_id)]:
+            del self._inv_counts[key]
         with _connect() as c:
             c.execute("DELETE FROM rpg_inventory WHERE guild_id=?", (str(guild_id),))
             c.execute("""
@@ -539,254 +1156,154 @@ class RPGCog(commands.Cog):
 
     # =========================
     # Views (Menu / Shop / Train / Gamble / Leaderboard / Reset)
+    # Every component is a DynamicItem whose custom_id carries its state (user id,
+    # shop day, metric). They are registered once in cog_load, so nothing is kept per
+    # open menu and buttons keep working across restarts.
     # =========================
-    class MainView(discord.ui.View):
-        def __init__(self, cog: "RPGCog", user_id: int):
-            super().__init__(timeout=180)
-            self.cog = cog
-            self.user_id = str(user_id)
-
-        async def interaction_check(self, interaction: discord.Interaction) -> bool:
-            return str(interaction.user.id) == self.user_id
-
-        @discord.ui.select(
-            placeholder="Choose an activity…",
-            min_values=1, max_values=1,
-            options=[
-                discord.SelectOption(label="Profile", description="View your stats & wallet", emoji="🧙"),
-                discord.SelectOption(label="Inventory", description="Your items", emoji="🎒"),
-                discord.SelectOption(label="Shop", description="AI-rotating stock", emoji="🛒"),
-                discord.SelectOption(label="Training Ring", description="Boost a stat", emoji="🥊"),
-                discord.SelectOption(label="Mine / Work", description="Earn wages", emoji="⛏️"),
-                discord.SelectOption(label="Gambling", description="d20 / coinflip", emoji="🎲"),
-                discord.SelectOption(label="Adventure", description="AI encounter", emoji="🗺️"),
-                discord.SelectOption(label="Leaderboard", description="Top players (Level/XP/Coins)", emoji="🏆"),
-                discord.SelectOption(label="Reset (Self)", description="Reset your stats & inventory", emoji="🗑️"),
-            ]
+    def main_view(self, user_id: int) -> discord.ui.View:
+        return _persistent_view(MenuSelect(user_id))
+
+    def shop_view(self, user_id: int, day: str) -> discord.ui.View:
+        return _persistent_view(*(BuyButton(user_id, day, idx) for idx in range(5)), BackButton(user_id))
+
+    def inventory_view(self, user_id: int, sort: str, page: int,
+                       rows: List[sqlite3.Row], count: int) -> discord.ui.View:
+        first, last = (rows[0], rows[-1]) if rows else (None, None)
+        return _persistent_view(
+            InventoryPageButton(user_id, sort, page - 1, "prev", first, disabled=page <= 1 or not rows),
+            InventoryPageButton(user_id, sort, page + 1, "next", last, disabled=page * INV_PAGE_SIZE >= count or not rows),
+            *(InventorySortButton(user_id, s, current=s == sort) for s in INV_SORTS),
+            BackButton(user_id),
         )
-        async def select_menu(self, interaction: discord.Interaction, select: discord.ui.Select):
-            choice = select.values[0]
-
-            if choice == "Profile":
-                await interaction.response.edit_message(embed=self.cog.embed_profile(interaction.user.id, interaction.guild_id), view=self)
-
-            elif choice == "Inventory":
-                await interaction.response.edit_message(embed=self.cog.embed_inventory(interaction.user.id, interaction.guild_id), view=self)
-
-            elif choice == "Shop":
-                # Defer first so AI/cache can load without timeout
-                await interaction.response.defer(thinking=True)
-                u = self.cog.get_user(interaction.user.id, interaction.guild_id)
-                items = await self.cog.get_ai_shop(interaction.guild_id, avg_player_lvl=u["lvl"])
-                shop_view = RPGCog.ShopView(self.cog, self.user_id, items)
-                await interaction.edit_original_response(
-                    embed=self.cog.embed_shop(interaction.user.id, interaction.guild_id, items),
-                    view=shop_view
-                )
 
-            elif choice == "Training Ring":
-                await interaction.response.edit_message(
-                    embed=discord.Embed(
-                        title="🥊 Training Ring",
-                        description="Pay **15** coins to train (+1~+3 to a random stat). 45s cooldown.",
-                        color=discord.Color.orange(),
-                    ),
-                    view=RPGCog.TrainView(self.cog, self.user_id)
-                )
+    def train_view(self, user_id: int) -> discord.ui.View:
+        return _persistent_view(TrainButton(user_id), BackButton(user_id))
 
-            elif choice == "Mine / Work":
-                await interaction.response.defer(thinking=True)
-                result = await self.cog.do_mine(interaction.user.id, interaction.guild_id)
-                await interaction.edit_original_response(embed=result, view=self)
+    def gamble_view(self, user_id: int) -> discord.ui.View:
+        return _persistent_view(GambleButton(user_id, "d20"), GambleButton(user_id, "flip"), BackButton(user_id))
 
-            elif choice == "Gambling":
-                embed = discord.Embed(
-                    title="🎲 Gambling Hall",
-                    description="• Roll d20 (bet 10): 15+ pays 25, 20 pays 50.\n• Coinflip (bet 10): Win pays 20.\n10s cooldown.",
-                    color=discord.Color.purple()
-                )
-                await interaction.response.edit_message(embed=embed, view=RPGCog.GambleView(self.cog, self.user_id))
+    def leaderboard_view(self, user_id: int) -> discord.ui.View:
+        return _persistent_view(*(LeaderboardButton(m) for m in ("level", "xp", "coins")), BackButton(user_id))
 
-            elif choice == "Adventure":
-                await interaction.response.defer(thinking=True)
-                result = await self.cog.do_adventure(interaction.user.id, interaction.guild_id)
-                await interaction.edit_original_response(embed=result, view=self)
+    def reset_view(self, user_id: int) -> discord.ui.View:
+        return _persistent_view(ResetButton(user_id, "confirm"), ResetButton(user_id, "cancel"))
 
-            elif choice == "Leaderboard":
-                await interaction.response.defer(thinking=False)
-                embed = self.cog.embed_leaderboard(interaction.guild_id, "level")
-                await interaction.edit_original_response(embed=embed, view=RPGCog.LeaderboardView(self.cog, self.user_id, "level"))
+    async def cog_load(self):
+        self.bot.add_dynamic_items(*PERSISTENT_ITEMS)
+        self.economy_tick.change_interval(minutes=ECONOMY_TICK_MINUTES)
+        self.economy_tick.start()
 
-            elif choice == "Reset (Self)":
-                await interaction.response.edit_message(
-                    embed=discord.Embed(
-                        title="⚠️ Reset Your Progress?",
-                        description="This will reset your stats and inventory. **This cannot be undone.**",
-                        color=discord.Color.red()
-                    ),
-                    view=RPGCog.ResetSelfView(self.cog, self.user_id)
-                )
+    async def cog_unload(self):
+        self.economy_tick.cancel()
+        self.bot.remove_dynamic_items(*PERSISTENT_ITEMS)
+        self.cancel_prefetches()
 
-    class ShopView(discord.ui.View):
-        def __init__(self, cog: "RPGCog", user_id: str, items: List[Dict[str, Any]]):
-            super().__init__(timeout=150)
-            self.cog = cog
-            self.user_id = user_id
-            self.items = items or []
+    async def handle_menu(self, interaction: discord.Interaction, choice: str):
+        uid, gid = interaction.user.id, interaction.guild_id
 
-        async def interaction_check(self, interaction: discord.Interaction) -> bool:
-            return str(interaction.user.id) == self.user_id
+        if choice == "Profile":
+            await interaction.response.edit_message(embed=self.embed_profile(uid, gid), view=self.main_view(uid))
 
-        async def _buy(self, interaction: discord.Interaction, idx: int):
-            if not self.items:
-                await interaction.response.send_message("Shop is empty today. Try again later.", ephemeral=True)
-                return
-            if idx >= len(self.items):
-                await interaction.response.send_message("That slot is empty today.", ephemeral=True)
-                return
+        elif choice == "Inventory":
+            embed, view = self.inventory_screen(uid, gid)
+            await interaction.response.edit_message(embed=embed, view=view)
 
-            item = self.items[idx]
-            u = self.cog.get_user(interaction.user.id, interaction.guild_id)
-            if u["coins"] < item["cost"]:
-                await interaction.response.send_message("You don't have enough coins.", ephemeral=True)
+        elif choice == "Shop":
+            items = self._shop_cache_get(gid)
+            if items:
+                # Already generated today (often by the menu's prefetch): answer instantly
+                await interaction.response.edit_message(
+                    embed=self.embed_shop(uid, gid, items),
+                    view=self.shop_view(uid, _today_key())
+                )
                 return
+            # Defer first so AI/cache can load without timeout
+            await interaction.response.defer(thinking=True)
+            u = self.get_user(uid, gid)
+            items = await self.get_ai_shop(gid, avg_player_lvl=u["lvl"])
+            await interaction.edit_original_response(
+                embed=self.embed_shop(uid, gid, items),
+                view=self.shop_view(uid, _today_key())
+            )
 
-            self.cog.set_user(interaction.user.id, interaction.guild_id, coins=u["coins"] - item["cost"])
-            self.cog.inv_add(interaction.user.id, interaction.guild_id, item["name"], 1)
-            self.cog.apply_effects(interaction.user.id, interaction.guild_id, item["effects"])
-
-            embed = self.cog.embed_inventory_after_buy(interaction.user.id, interaction.guild_id, item["name"], item["cost"], item["effects"])
-            await interaction.response.edit_message(embed=embed, view=self)
-
-        @discord.ui.button(label="Buy #1", style=discord.ButtonStyle.primary)
-        async def buy1(self, interaction: discord.Interaction, _): await self._buy(interaction, 0)
-        @discord.ui.button(label="Buy #2", style=discord.ButtonStyle.primary)
-        async def buy2(self, interaction: discord.Interaction, _): await self._buy(interaction, 1)
-        @discord.ui.button(label="Buy #3", style=discord.ButtonStyle.primary)
-        async def buy3(self, interaction: discord.Interaction, _): await self._buy(interaction, 2)
-        @discord.ui.button(label="Buy #4", style=discord.ButtonStyle.secondary)
-        async def buy4(self, interaction: discord.Interaction, _): await self._buy(interaction, 3)
-        @discord.ui.button(label="Buy #5", style=discord.ButtonStyle.secondary)
-        async def buy5(self, interaction: discord.Interaction, _): await self._buy(interaction, 4)
-        @discord.ui.button(label="Back", style=discord.ButtonStyle.secondary)
-        async def back(self, interaction: discord.Interaction, _):
+        elif choice == "Training Ring":
             await interaction.response.edit_message(
-                embed=self.cog.embed_profile(interaction.user.id, interaction.guild_id),
-                view=RPGCog.MainView(self.cog, interaction.user.id)
+                embed=discord.Embed(
+                    title="🥊 Training Ring",
+                    description="Pay **15** coins to train (+1~+3 to a random stat). 45s cooldown.",
+                    color=discord.Color.orange(),
+                ),
+                view=self.train_view(uid)
             )
 
-    def embed_inventory_after_buy(self, user_id: int, guild_id: int, item_name: str, cost: int, effs: List[Dict[str,int]]) -> discord.Embed:
-        eff_txt = ", ".join([f"{e['stat'].upper()}+{e['amount']}" for e in effs])
-        u = self.get_user(user_id, guild_id)
-        desc = f"Purchased **{item_name}** for **{cost}** coins.\nApplied: _{eff_txt}_\n\nCoins left: **{u['coins']}**"
-        return discord.Embed(title="🛒 Purchase Complete", description=desc, color=discord.Color.green())
-
-    class TrainView(discord.ui.View):
-        def __init__(self, cog: "RPGCog", user_id: str):
-            super().__init__(timeout=120)
-            self.cog = cog
-            self.user_id = user_id
-
-        async def interaction_check(self, interaction: discord.Interaction) -> bool:
-            return str(interaction.user.id) == self.user_id
-
-        @discord.ui.button(label="Train (15c)", style=discord.ButtonStyle.success, emoji="🏋️")
-        async def train(self, interaction: discord.Interaction, _):
+        elif choice == "Mine / Work":
             await interaction.response.defer(thinking=True)
-            embed = await self.cog.do_train(interaction.user.id, interaction.guild_id)
-            await interaction.edit_original_response(embed=embed, view=self)
-
-        @discord.ui.button(label="Back", style=discord.ButtonStyle.secondary)
-        async def back(self, interaction: discord.Interaction, _):
-            await interaction.response.edit_message(
-                embed=self.cog.embed_profile(interaction.user.id, interaction.guild_id),
-                view=RPGCog.MainView(self.cog, interaction.user.id)
+            result = await self.do_mine(uid, gid)
+            await interaction.edit_original_response(embed=result, view=self.main_view(uid))
+
+        elif choice == "Gambling":
+            embed = discord.Embed(
+                title="🎲 Gambling Hall",
+                description="• Roll d20 (bet 10): 15+ pays 25, 20 pays 50.\n• Coinflip (bet 10): Win pays 20.\n10s cooldown.",
+                color=discord.Color.purple()
             )
+            await interaction.response.edit_message(embed=embed, view=self.gamble_view(uid))
 
-    class GambleView(discord.ui.View):
-        def __init__(self, cog: "RPGCog", user_id: str):
-            super().__init__(timeout=120)
-            self.cog = cog
-            self.user_id = user_id
-
-        async def interaction_check(self, interaction: discord.Interaction) -> bool:
-            return str(interaction.user.id) == self.user_id
-
-        @discord.ui.button(label="Roll d20 (10c)", style=discord.ButtonStyle.primary, emoji="🎲")
-        async def d20(self, interaction: discord.Interaction, _):
-            await interaction.response.defer(thinking=False)
-            embed = await self.cog.do_roll(interaction.user.id, interaction.guild_id)
-            await interaction.edit_original_response(embed=embed, view=self)
+        elif choice == "Adventure":
+            if self.encounter_ready(uid, gid):
+                result = await self.do_adventure(uid, gid)
+                await interaction.response.edit_message(embed=result, view=self.main_view(uid))
+                return
+            await interaction.response.defer(thinking=True)
+            result = await self.do_adventure(uid, gid)
+            await interaction.edit_original_response(embed=result, view=self.main_view(uid))
 
-        @discord.ui.button(label="Coinflip (10c)", style=discord.ButtonStyle.primary, emoji="🪙")
-        async def coinflip(self, interaction: discord.Interaction, _):
+        elif choice == "Leaderboard":
             await interaction.response.defer(thinking=False)
-            embed = await self.cog.do_coinflip(interaction.user.id, interaction.guild_id)
-            await interaction.edit_original_response(embed=embed, view=self)
-
-        @discord.ui.button(label="Back", style=discord.ButtonStyle.secondary)
-        async def back(self, interaction: discord.Interaction, _):
-            await interaction.response.edit_message(
-                embed=self.cog.embed_profile(interaction.user.id, interaction.guild_id),
-                view=RPGCog.MainView(self.cog, interaction.user.id)
-            )
-
-    class LeaderboardView(discord.ui.View):
-        def __init__(self, cog: "RPGCog", user_id: int, metric: str = "level"):
-            super().__init__(timeout=120)
-            self.cog = cog
-            self.user_id = str(user_id)
-            self.metric = metric
+            embed = self.embed_leaderboard(gid, "level")
+            await interaction.edit_original_response(embed=embed, view=self.leaderboard_view(uid))
 
-        async def interaction_check(self, interaction: discord.Interaction) -> bool:
-            return True  # anyone can switch metric
+        elif choice == "Reset (Self)":
+            await interaction.response.edit_message(embed=self.embed_reset_confirm(), view=self.reset_view(uid))
 
-        @discord.ui.button(label="Level", style=discord.ButtonStyle.primary)
-        async def lb_level(self, interaction: discord.Interaction, _):
-            await interaction.response.edit_message(embed=self.cog.embed_leaderboard(interaction.guild_id, "level"), view=self)
-
-        @discord.ui.button(label="XP", style=discord.ButtonStyle.secondary)
-        async def lb_xp(self, interaction: discord.Interaction, _):
-            await interaction.response.edit_message(embed=self.cog.embed_leaderboard(interaction.guild_id, "xp"), view=self)
-
-        @discord.ui.button(label="Coins", style=discord.ButtonStyle.secondary)
-        async def lb_coins(self, interaction: discord.Interaction, _):
-            await interaction.response.edit_message(embed=self.cog.embed_leaderboard(interaction.guild_id, "coins"), view=self)
+    async def handle_buy(self, interaction: discord.Interaction, day: str, idx: int):
+        if day != _today_key():
+            await interaction.response.send_message("The shop has rotated since this menu was opened. Open the Shop again.", ephemeral=True)
+            return
+        items = self._shop_cache_get(interaction.guild_id) or []
+        if not items:
+            await interaction.response.send_message("Shop is empty today. Try again later.", ephemeral=True)
+            return
+        if idx >= len(items):
+            await interaction.response.send_message("That slot is empty today.", ephemeral=True)
+            return
 
-        @discord.ui.button(label="Back", style=discord.ButtonStyle.secondary)
-        async def back(self, interaction: discord.Interaction, _):
-            await interaction.response.edit_message(
-                embed=self.cog.embed_profile(interaction.user.id, interaction.guild_id),
-                view=RPGCog.MainView(self.cog, interaction.user.id)
-            )
+        item = items[idx]
+        u = self.get_user(interaction.user.id, interaction.guild_id)
+        if u["coins"] < item["cost"]:
+            await interaction.response.send_message("You don't have enough coins.", ephemeral=True)
+            return
 
-    class ResetSelfView(discord.ui.View):
-        def __init__(self, cog: "RPGCog", user_id: int):
-            super().__init__(timeout=60)
-            self.cog = cog
-            self.user_id = str(user_id)
+        self.set_user(interaction.user.id, interaction.guild_id, coins=u["coins"] - item["cost"])
+        item_id = item.get("item_id") or self.catalog_ids([item])[0]
+        self.inv_add(interaction.user.id, interaction.guild_id, item_id, 1)
+        self.apply_effects(interaction.user.id, interaction.guild_id, item["effects"])
 
-        async def interaction_check(self, interaction: discord.Interaction) -> bool:
-            return str(interaction.user.id) == self.user_id
+        embed = self.embed_inventory_after_buy(interaction.user.id, interaction.guild_id, item["name"], item["cost"], item["effects"])
+        await interaction.response.edit_message(embed=embed, view=self.shop_view(interaction.user.id, day))
 
-        @discord.ui.button(label="Confirm Reset", style=discord.ButtonStyle.danger, emoji="🗑️")
-        async def confirm(self, interaction: discord.Interaction, _):
-            self.cog.reset_user_progress(interaction.user.id, interaction.guild_id)
-            await interaction.response.edit_message(
-                embed=discord.Embed(
-                    title="✅ Reset Complete",
-                    description="Your stats and inventory were reset to defaults.",
-                    color=discord.Color.green()
-                ),
-                view=None
-            )
+    def embed_inventory_after_buy(self, user_id: int, guild_id: int, item_name: str, cost: int, effs: List[Dict[str,int]]) -> discord.Embed:
+        eff_txt = ", ".join([f"{e['stat'].upper()}+{e['amount']}" for e in effs])
+        u = self.get_user(user_id, guild_id)
+        desc = f"Purchased **{item_name}** for **{cost}** coins.\nApplied: _{eff_txt}_\n\nCoins left: **{u['coins']}**"
+        return discord.Embed(title="🛒 Purchase Complete", description=desc, color=discord.Color.green())
 
-        @discord.ui.button(label="Cancel", style=discord.ButtonStyle.secondary)
-        async def cancel(self, interaction: discord.Interaction, _):
-            await interaction.response.edit_message(
-                embed=self.cog.embed_profile(interaction.user.id, interaction.guild_id),
-                view=RPGCog.MainView(self.cog, interaction.user.id)
-            )
+    def embed_reset_confirm(self) -> discord.Embed:
+        return discord.Embed(
+            title="⚠️ Reset Your Progress?",
+            description="This will reset your stats and inventory. **This cannot be undone.**",
+            color=discord.Color.red()
+        )
 
     # =========================
     # Slash Commands
@@ -794,13 +1311,18 @@ class RPGCog(commands.Cog):
     @app_commands.command(name="rpg", description="Open the RPG menu.")
     @app_commands.guild_only()
     async def rpg(self, interaction: discord.Interaction):
-        await interaction.response.defer()
-        embed = self.embed_profile(interaction.user.id, interaction.guild_id)
-        await interaction.followup.send(
-            embed=embed,
-            view=RPGCog.MainView(self, interaction.user.id),
-            allowed_mentions=interaction.client.allowed_mentions
-        )
+        with TRACER.span("rpg.open", interaction.user.id, interaction.guild_id):
+            await interaction.response.defer()
+            embed = self.embed_profile(interaction.user.id, interaction.guild_id)
+            await interaction.followup.send(
+                embed=embed,
+                view=self.main_view(interaction.user.id),
+                allowed_mentions=interaction.client.allowed_mentions
+            )
+        # Outside the span (its trace event is already written), but under the same usage
+        # scope, so the prefetched calls are budgeted and billed to this guild and command
+        with request_scope("rpg.open", interaction.guild_id):
+            self.prefetch_for_menu(interaction.user.id, interaction.guild_id)
 
     @app_commands.command(name="rpg_leaderboard", description="Show the RPG leaderboard.")
     @app_commands.describe(metric="Sort by: level, xp, or coins")
@@ -812,19 +1334,15 @@ class RPGCog(commands.Cog):
         embed = self.embed_leaderboard(interaction.guild_id, metric)
         await interaction.followup.send(
             embed=embed,
-            view=RPGCog.LeaderboardView(self, interaction.user.id, metric),
+            view=self.leaderboard_view(interaction.user.id),
             allowed_mentions=interaction.client.allowed_mentions
         )
 
     @app_commands.command(name="rpg_reset", description="Reset YOUR RPG progress (confirmation required).")
     async def rpg_reset(self, interaction: discord.Interaction):
         await interaction.response.send_message(
-            embed=discord.Embed(
-                title="⚠️ Reset Your Progress?",
-                description="This will reset your stats and inventory. **This cannot be undone.**",
-                color=discord.Color.red()
-            ),
-            view=RPGCog.ResetSelfView(self, interaction.user.id),
+            embed=self.embed_reset_confirm(),
+            view=self.reset_view(interaction.user.id),
             ephemeral=True
         )
 
@@ -846,5 +1364,255 @@ class RPGCog(commands.Cog):
             self.reset_server_progress(interaction.guild_id)
             await interaction.response.send_message("✅ Reset **all** players in this server.", ephemeral=True)
 
+# =========================
+# Persistent components
+# =========================
+def _rpg(interaction: discord.Interaction) -> RPGCog:
+    return interaction.client.get_cog("RPGCog")
+
+def _persistent_view(*items: discord.ui.Item) -> discord.ui.View:
+    view = discord.ui.View(timeout=None)
+    for item in items:
+        view.add_item(item)
+    return view
+
+MENU_OPTIONS = [
+    discord.SelectOption(label="Profile", description="View your stats & wallet", emoji="🧙"),
+    discord.SelectOption(label="Inventory", description="Your items", emoji="🎒"),
+    discord.SelectOption(label="Shop", description="AI-rotating stock", emoji="🛒"),
+    discord.SelectOption(label="Training Ring", description="Boost a stat", emoji="🥊"),
+    discord.SelectOption(label="Mine / Work", description="Earn wages", emoji="⛏️"),
+    discord.SelectOption(label="Gambling", description="d20 / coinflip", emoji="🎲"),
+    discord.SelectOption(label="Adventure", description="AI encounter", emoji="🗺️"),
+    discord.SelectOption(label="Leaderboard", description="Top players (Level/XP/Coins)", emoji="🏆"),
+    discord.SelectOption(label="Reset (Self)", description="Reset your stats & inventory", emoji="🗑️"),
+]
+
+class MenuSelect(discord.ui.DynamicItem[discord.ui.Select], template=r"rpg:menu:(?P<uid>\d+)"):
+    def __init__(self, user_id: int):
+        super().__init__(discord.ui.Select(
+            custom_id=f"rpg:menu:{user_id}",
+            placeholder="Choose an activity…",
+            min_values=1, max_values=1,
+            options=MENU_OPTIONS,
+        ))
+        self.user_id = user_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Select, match, /):
+        return cls(int(match["uid"]))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.user_id
+
+    async def callback(self, interaction: discord.Interaction):
+        choice = self.item.values[0]
+        with METRICS.span(f"btn.rpg.menu:{choice}"), \
+                TRACER.span(f"rpg.menu:{choice}", interaction.user.id, interaction.guild_id):
+            await _rpg(interaction).handle_menu(interaction, choice)
+
+class BuyButton(discord.ui.DynamicItem[discord.ui.Button], template=r"rpg:buy:(?P<uid>\d+):(?P<day>\d{8}):(?P<idx>\d)"):
+    def __init__(self, user_id: int, day: str, idx: int):
+        super().__init__(discord.ui.Button(
+            label=f"Buy #{idx + 1}",
+            style=discord.ButtonStyle.primary if idx < 3 else discord.ButtonStyle.secondary,
+            custom_id=f"rpg:buy:{user_id}:{day}:{idx}",
+            row=0,
+        ))
+        self.user_id, self.day, self.idx = user_id, day, idx
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match, /):
+        return cls(int(match["uid"]), match["day"], int(match["idx"]))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.user_id
+
+    @traced("rpg.buy")
+    async def callback(self, interaction: discord.Interaction):
+        await _rpg(interaction).handle_buy(interaction, self.day, self.idx)
+
+class BackButton(discord.ui.DynamicItem[discord.ui.Button], template=r"rpg:back:(?P<uid>\d+)"):
+    def __init__(self, user_id: int):
+        super().__init__(discord.ui.Button(
+            label="Back", style=discord.ButtonStyle.secondary, custom_id=f"rpg:back:{user_id}", row=1,
+        ))
+        self.user_id = user_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match, /):
+        return cls(int(match["uid"]))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.user_id
+
+    @traced("rpg.back")
+    async def callback(self, interaction: discord.Interaction):
+        cog = _rpg(interaction)
+        await interaction.response.edit_message(
+            embed=cog.embed_profile(interaction.user.id, interaction.guild_id),
+            view=cog.main_view(interaction.user.id)
+        )
+
+class InventoryPageButton(discord.ui.DynamicItem[discord.ui.Button],
+                          template=r"rpg:inv:(?P<uid>\d+):(?P<sort>name|qty|new):(?P<page>\d+):(?P<dir>prev|next):(?P<qty>-?\d+):(?P<iid>\d+)"):
+    """Prev/Next: the custom_id carries the keyset anchor (qty, item_id) of the current page's first/last row."""
+
+    def __init__(self, user_id: int, sort: str, page: int, direction: str, anchor_row=None, *,
+                 qty: int = 0, item_id: int = 0, disabled: bool = False):
+        if anchor_row is not None:
+            qty, item_id = anchor_row["qty"], anchor_row["item_id"]
+        super().__init__(discord.ui.Button(
+            label="◀ Prev" if direction == "prev" else "Next ▶",
+            style=discord.ButtonStyle.secondary,
+            custom_id=f"rpg:inv:{user_id}:{sort}:{page}:{direction}:{qty}:{item_id}",
+            disabled=disabled,
+            row=0,
+        ))
+        self.user_id, self.sort, self.page, self.direction = user_id, sort, page, direction
+        self.anchor = (qty, item_id)
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match, /):
+        return cls(int(match["uid"]), match["sort"], int(match["page"]), match["dir"],
+                   qty=int(match["qty"]), item_id=int(match["iid"]))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.user_id
+
+    @traced("rpg.inv")
+    async def callback(self, interaction: discord.Interaction):
+        embed, view = _rpg(interaction).inventory_screen(
+            interaction.user.id, interaction.guild_id, self.sort, max(1, self.page),
+            anchor=self.anchor, forward=self.direction == "next",
+        )
+        await interaction.response.edit_message(embed=embed, view=view)
+
+class InventorySortButton(discord.ui.DynamicItem[discord.ui.Button], template=r"rpg:invsort:(?P<uid>\d+):(?P<sort>name|qty|new)"):
+    def __init__(self, user_id: int, sort: str, current: bool = False):
+        super().__init__(discord.ui.Button(
+            label=INV_SORTS[sort][0],
+            style=discord.ButtonStyle.primary if current else discord.ButtonStyle.secondary,
+            custom_id=f"rpg:invsort:{user_id}:{sort}",
+            row=1,
+        ))
+        self.user_id, self.sort = user_id, sort
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match, /):
+        return cls(int(match["uid"]), match["sort"])
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.user_id
+
+    @traced("rpg.inv")
+    async def callback(self, interaction: discord.Interaction):
+        embed, view = _rpg(interaction).inventory_screen(interaction.user.id, interaction.guild_id, self.sort)
+        await interaction.response.edit_message(embed=embed, view=view)
+
+class TrainButton(discord.ui.DynamicItem[discord.ui.Button], template=r"rpg:train:(?P<uid>\d+)"):
+    def __init__(self, user_id: int):
+        super().__init__(discord.ui.Button(
+            label="Train (15c)", style=discord.ButtonStyle.success, emoji="🏋️", custom_id=f"rpg:train:{user_id}",
+        ))
+        self.user_id = user_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match, /):
+        return cls(int(match["uid"]))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.user_id
+
+    @traced("rpg.train")
+    async def callback(self, interaction: discord.Interaction):
+        cog = _rpg(interaction)
+        await interaction.response.defer(thinking=True)
+        embed = await cog.do_train(interaction.user.id, interaction.guild_id)
+        await interaction.edit_original_response(embed=embed, view=cog.train_view(interaction.user.id))
+
+class GambleButton(discord.ui.DynamicItem[discord.ui.Button], template=r"rpg:gamble:(?P<uid>\d+):(?P<game>d20|flip)"):
+    def __init__(self, user_id: int, game: str):
+        label, emoji = ("Roll d20 (10c)", "🎲") if game == "d20" else ("Coinflip (10c)", "🪙")
+        super().__init__(discord.ui.Button(
+            label=label, style=discord.ButtonStyle.primary, emoji=emoji, custom_id=f"rpg:gamble:{user_id}:{game}",
+        ))
+        self.user_id, self.game = user_id, game
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match, /):
+        return cls(int(match["uid"]), match["game"])
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.user_id
+
+    @traced("rpg.gamble")
+    async def callback(self, interaction: discord.Interaction):
+        cog = _rpg(interaction)
+        await interaction.response.defer(thinking=False)
+        if self.game == "d20":
+            embed = await cog.do_roll(interaction.user.id, interaction.guild_id)
+        else:
+            embed = await cog.do_coinflip(interaction.user.id, interaction.guild_id)
+        await interaction.edit_original_response(embed=embed, view=cog.gamble_view(interaction.user.id))
+
+class LeaderboardButton(discord.ui.DynamicItem[discord.ui.Button], template=r"rpg:lb:(?P<metric>level|xp|coins)"):
+    def __init__(self, metric: str):
+        super().__init__(discord.ui.Button(
+            label={"level": "Level", "xp": "XP", "coins": "Coins"}[metric],
+            style=discord.ButtonStyle.primary if metric == "level" else discord.ButtonStyle.secondary,
+            custom_id=f"rpg:lb:{metric}",
+        ))
+        self.metric = metric
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match, /):
+        return cls(match["metric"])
+
+    @traced("rpg.lb")
+    async def callback(self, interaction: discord.Interaction):
+        # Anyone can switch metric; the message's existing components are kept as-is
+        await interaction.response.edit_message(embed=_rpg(interaction).embed_leaderboard(interaction.guild_id, self.metric))
+
+class ResetButton(discord.ui.DynamicItem[discord.ui.Button], template=r"rpg:reset:(?P<uid>\d+):(?P<action>confirm|cancel)"):
+    def __init__(self, user_id: int, action: str):
+        if action == "confirm":
+            button = discord.ui.Button(label="Confirm Reset", style=discord.ButtonStyle.danger, emoji="🗑️",
+                                       custom_id=f"rpg:reset:{user_id}:confirm")
+        else:
+            button = discord.ui.Button(label="Cancel", style=discord.ButtonStyle.secondary,
+                                       custom_id=f"rpg:reset:{user_id}:cancel")
+        super().__init__(button)
+        self.user_id, self.action = user_id, action
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match, /):
+        return cls(int(match["uid"]), match["action"])
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.user_id
+
+    @traced("rpg.reset")
+    async def callback(self, interaction: discord.Interaction):
+        cog = _rpg(interaction)
+        if self.action == "confirm":
+            cog.reset_user_progress(interaction.user.id, interaction.guild_id)
+            await interaction.response.edit_message(
+                embed=discord.Embed(
+                    title="✅ Reset Complete",
+                    description="Your stats and inventory were reset to defaults.",
+                    color=discord.Color.green()
+                ),
+                view=None
+            )
+        else:
+            await interaction.response.edit_message(
+                embed=cog.embed_profile(interaction.user.id, interaction.guild_id),
+                view=cog.main_view(interaction.user.id)
+            )
+
+PERSISTENT_ITEMS = (MenuSelect, BuyButton, BackButton, InventoryPageButton, InventorySortButton,
+                    TrainButton, GambleButton, LeaderboardButton, ResetButton)
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(RPGCog(bot))
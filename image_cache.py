@@ -0,0 +1,111 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+# ====== Config ======
+IMAGE_CACHE_DIR = "image_cache"
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Discord attachment links are signed and expire after roughly a day.
+CDN_URL_TTL = 20 * 3600
+
+
+class CachedImage(NamedTuple):
+    key: str
+    size: int
+    cdn_url: Optional[str]
+
+
+class ImageCache:
+    """
+    Content-addressed disk cache for generated images.
+    Files live at <dir>/<key>.png; a small SQLite index tracks size, last use and the
+    Discord CDN link from the first upload. Least-recently-used files are evicted
+    once the total passes max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.db"), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                key TEXT PRIMARY KEY,
+                bytes INTEGER NOT NULL,
+                last_used INTEGER NOT NULL,
+                cdn_url TEXT,
+                cdn_saved_at INTEGER
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_images_last_used ON images (last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def key(prompt: str, model: str, size: str) -> str:
+        normalized = " ".join(prompt.lower().split())
+        return hashlib.sha256(f"{model}\x00{size}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def get(self, key: str) -> Optional[CachedImage]:
+        now = int(time.time())
+        with self._lock:
+            row = self._db.execute("SELECT bytes, cdn_url, cdn_saved_at FROM images WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            if not os.path.exists(self._path(key)):
+                self._db.execute("DELETE FROM images WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE images SET last_used = ? WHERE key = ?", (time.time_ns(), key))
+            self._db.commit()
+        size, cdn_url, saved_at = row
+        if cdn_url and (saved_at or 0) + CDN_URL_TTL < now:
+            cdn_url = None
+        return CachedImage(key, size, cdn_url)
+
+    def read(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def put(self, key: str, image_bytes: bytes) -> None:
+        tmp = self._path(key) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(image_bytes)
+        os.replace(tmp, self._path(key))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO images (key, bytes, last_used, cdn_url, cdn_saved_at) VALUES (?, ?, ?, NULL, NULL)",
+                (key, len(image_bytes), time.time_ns())
+            )
+            self._db.commit()
+            self._evict()
+
+    def set_cdn_url(self, key: str, url: str) -> None:
+        with self._lock:
+            self._db.execute("UPDATE images SET cdn_url = ?, cdn_saved_at = ? WHERE key = ?", (url, int(time.time()), key))
+            self._db.commit()
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM images").fetchone()[0]
+
+    def _evict(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM images").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, bytes FROM images ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM images WHERE key = ?", (key,))
+            total -= size
+        self._db.commit()
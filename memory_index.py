@@ -0,0 +1,337 @@
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # retrieval mode is optional
+    np = None
+
+from usage import USAGE, BudgetExceeded, request_scope
+
+# ====== Config ======
+INDEX_DIR = "memory_index"
+EMBED_MODEL = "text-embedding-3-small"
+EMBED_DIM = 256              # requested via the embeddings `dimensions` param
+REBUILD_BATCH = 256          # rows embedded per API call while rebuilding
+SEARCH_CHUNK = 65536         # rows scored at a time so big guilds never load whole
+
+
+class MemoryIndex:
+    """
+    Per-guild on-disk vector index over `memory` rows.
+
+    Each guild has two append-only files:
+    - <guild>.vec: float16 unit vectors, EMBED_DIM per row
+    - <guild>.ids: int64 memory row ids, same order
+    Both are memory-mapped for search. memory.db stays the source of truth; a missing
+    or inconsistent index is rebuilt from it in the background, and rows missing from
+    the tail are appended in the background too. Search only ever embeds the query.
+    Background embedding is billed to the guild ("memory.index") and stops once the
+    guild is over its daily budget; the next ensure() picks it up again.
+    """
+
+    def __init__(self, db_file: str, embed_fn: Callable[[List[str]], List[Sequence[float]]],
+                 index_dir: str = INDEX_DIR, dim: int = EMBED_DIM):
+        self.db_file = db_file
+        self.embed_fn = embed_fn
+        self.index_dir = index_dir
+        self.dim = dim
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._checked: Set[str] = set()
+        self._rebuilding: Set[str] = set()
+        self._catching_up: Set[str] = set()
+        self._generation: Dict[str, int] = {}
+        os.makedirs(index_dir, exist_ok=True)
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    # ---------- Files ----------
+    def _paths(self, guild_key: str) -> Tuple[str, str]:
+        base = os.path.join(self.index_dir, guild_key)
+        return base + ".vec", base + ".ids"
+
+    def _lock(self, guild_key: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(guild_key)
+            if lock is None:
+                lock = self._locks[guild_key] = threading.Lock()
+            return lock
+
+    def _row_count(self, guild_key: str) -> Optional[int]:
+        """Rows in the index, or None if the files are missing or disagree."""
+        vec_path, ids_path = self._paths(guild_key)
+        if not (os.path.exists(vec_path) and os.path.exists(ids_path)):
+            return None
+        n_vec, rem = divmod(os.path.getsize(vec_path), self.dim * 2)
+        n_ids, rem_ids = divmod(os.path.getsize(ids_path), 8)
+        if rem or rem_ids or n_vec != n_ids:
+            return None
+        return n_ids
+
+    def _last_id(self, guild_key: str, n_rows: int) -> int:
+        if not n_rows:
+            return 0
+        _, ids_path = self._paths(guild_key)
+        with open(ids_path, "rb") as f:
+            f.seek((n_rows - 1) * 8)
+            return int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+
+    def _embed(self, texts: List[str]) -> "np.ndarray":
+        vecs = np.asarray(self.embed_fn(texts), dtype=np.float32).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vecs / norms).astype(np.float16)
+
+    def _write(self, guild_key: str, ids: Sequence[int], vecs: "np.ndarray", mode: str = "ab") -> None:
+        vec_path, ids_path = self._paths(guild_key)
+        with open(vec_path, mode) as fv, open(ids_path, mode) as fi:
+            fv.write(vecs.tobytes())
+            fi.write(np.asarray(ids, dtype=np.int64).tobytes())
+
+    def _append_locked(self, guild_key: str, ids: List[int], vecs: "np.ndarray") -> None:
+        """Appends rows newer than the index's last id; caller holds the guild lock."""
+        n_rows = self._row_count(guild_key) or 0
+        last_id = self._last_id(guild_key, n_rows)
+        keep = [i for i, row_id in enumerate(ids) if row_id > last_id]
+        if keep:
+            self._write(guild_key, [ids[i] for i in keep], vecs[keep])
+
+    # ---------- Maintenance ----------
+    # Embedding calls happen outside the guild lock so searches aren't held up behind them.
+    # drop() and remove() bump the guild's generation; a rebuild or catch-up that read its
+    # rows under an older generation throws its vectors away instead of writing them.
+    def _generation_of(self, guild_key: str) -> int:
+        with self._lock(guild_key):
+            return self._generation.get(guild_key, 0)
+
+    def append(self, guild_key: str, rows: List[Tuple[int, str]]) -> None:
+        """Embed and append new memory rows (id, content). Blocking; run off the loop."""
+        if not rows or not self.available() or guild_key in self._catching_up:
+            return
+        vecs = self._embed([r[1] for r in rows])
+        with self._lock(guild_key):
+            if guild_key in self._catching_up:
+                return   # the running catch-up reads these rows from the DB
+            if self._row_count(guild_key) is None:
+                conn = sqlite3.connect(self.db_file)
+                try:
+                    older = conn.execute(
+                        "SELECT COUNT(*) FROM memory WHERE guild_id = ? AND id < ?",
+                        (guild_key, min(r[0] for r in rows))
+                    ).fetchone()[0]
+                finally:
+                    conn.close()
+                if older:
+                    # Lost/torn index: leave it to ensure() to rebuild from the DB.
+                    self._checked.discard(guild_key)
+                    return
+                self._write(guild_key, [r[0] for r in rows], vecs, mode="wb")
+                return
+            self._append_locked(guild_key, [r[0] for r in rows], vecs)
+
+    def rebuild(self, guild_key: str) -> None:
+        """Re-embed every stored row for a guild and atomically swap the files in."""
+        vec_path, ids_path = self._paths(guild_key)
+        tmp_key = guild_key + ".rebuild"
+        tmp_vec, tmp_ids = self._paths(tmp_key)
+        for p in (tmp_vec, tmp_ids):
+            if os.path.exists(p):
+                os.remove(p)
+        open(tmp_vec, "wb").close()
+        open(tmp_ids, "wb").close()
+
+        generation = self._generation_of(guild_key)
+        conn = sqlite3.connect(self.db_file)
+        try:
+            last_id = 0
+            while True:
+                batch = conn.execute(
+                    "SELECT id, content FROM memory WHERE guild_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (guild_key, last_id, REBUILD_BATCH)
+                ).fetchall()
+                if not batch:
+                    break
+                USAGE.check(guild_key)
+                self._write(tmp_key, [r[0] for r in batch], self._embed([r[1] or "" for r in batch]))
+                last_id = batch[-1][0]
+        finally:
+            conn.close()
+
+        with self._lock(guild_key):
+            if self._generation.get(guild_key, 0) != generation:
+                # Rows were forgotten while we embedded: the snapshot may hold them
+                os.remove(tmp_vec)
+                os.remove(tmp_ids)
+                self._checked.discard(guild_key)
+                return
+            os.replace(tmp_vec, vec_path)
+            os.replace(tmp_ids, ids_path)
+        self._catch_up(guild_key)
+
+    def _catch_up(self, guild_key: str) -> None:
+        """
+        Append rows written to the DB after the index's last id (e.g. after a crash).
+        While it runs, append() leaves new rows to it so the files stay in id order.
+        """
+        with self._lock(guild_key):
+            self._catching_up.add(guild_key)
+            generation = self._generation.get(guild_key, 0)
+        try:
+            while True:
+                with self._lock(guild_key):
+                    n_rows = self._row_count(guild_key)
+                    if self._generation.get(guild_key, 0) != generation or n_rows is None:
+                        self._checked.discard(guild_key)   # revalidate on the next ensure()
+                        return
+                    conn = sqlite3.connect(self.db_file)
+                    try:
+                        batch = conn.execute(
+                            "SELECT id, content FROM memory WHERE guild_id = ? AND id > ? ORDER BY id LIMIT ?",
+                            (guild_key, self._last_id(guild_key, n_rows), REBUILD_BATCH)
+                        ).fetchall()
+                    finally:
+                        conn.close()
+                    if not batch:
+                        self._catching_up.discard(guild_key)
+                        return
+                USAGE.check(guild_key)
+                vecs = self._embed([r[1] or "" for r in batch])
+                with self._lock(guild_key):
+                    if self._generation.get(guild_key, 0) != generation or self._row_count(guild_key) is None:
+                        self._checked.discard(guild_key)
+                        return
+                    self._append_locked(guild_key, [r[0] for r in batch], vecs)
+        finally:
+            self._catching_up.discard(guild_key)
+
+    def _catch_up_in_background(self, guild_key: str) -> None:
+        try:
+            with request_scope("memory.index", guild_key):
+                self._catch_up(guild_key)
+        except BudgetExceeded:
+            self._checked.discard(guild_key)
+        except Exception as e:
+            print(f"⚠ Memory index catch-up failed for {guild_key}: {e}")
+            self._checked.discard(guild_key)
+        finally:
+            self._catching_up.discard(guild_key)
+
+    def _rebuild_in_background(self, guild_key: str) -> None:
+        try:
+            with request_scope("memory.index", guild_key):
+                self.rebuild(guild_key)
+        except BudgetExceeded:
+            self._checked.discard(guild_key)
+        except Exception as e:
+            print(f"⚠ Memory index rebuild failed for {guild_key}: {e}")
+            self._checked.discard(guild_key)
+        finally:
+            self._rebuilding.discard(guild_key)
+
+    def ensure(self, guild_key: str) -> bool:
+        """
+        Returns True when the guild's index can be searched. The first touch per process
+        validates the files: a lost/torn index is rebuilt in a background thread (not
+        searchable until done); otherwise rows missing from the tail are appended in a
+        background thread while searches use what is already indexed.
+        """
+        if guild_key in self._rebuilding:
+            return False
+        if guild_key in self._checked:
+            return True
+        if self._row_count(guild_key) is not None:
+            self._checked.add(guild_key)
+            self._catching_up.add(guild_key)
+            threading.Thread(target=self._catch_up_in_background, args=(guild_key,), daemon=True).start()
+            return True
+        self._rebuilding.add(guild_key)
+        self._checked.add(guild_key)
+        threading.Thread(target=self._rebuild_in_background, args=(guild_key,), daemon=True).start()
+        return False
+
+    def drop(self, guild_key: Optional[str] = None) -> None:
+        """Delete one guild's index (or all of them) after its memory was forgotten."""
+        keys = [guild_key] if guild_key else {
+            f[:-4] for f in os.listdir(self.index_dir) if f.endswith(".ids")
+        } | self._rebuilding | self._catching_up
+        for key in keys:
+            with self._lock(key):
+                self._generation[key] = self._generation.get(key, 0) + 1
+                for p in self._paths(key):
+                    if os.path.exists(p):
+                        os.remove(p)
+                self._checked.discard(key)
+
+    def remove(self, guild_key: str, removed_ids: Sequence[int]) -> int:
+        """
+        Drop forgotten rows' vectors so they stop taking top-k slots. Rewrites the
+        guild's files without them (chunked, atomic swap). Blocking; returns rows dropped.
+        """
+        if not removed_ids or not self.available():
+            return 0
+        with self._lock(guild_key):
+            self._generation[guild_key] = self._generation.get(guild_key, 0) + 1
+            n_rows = self._row_count(guild_key)
+            if not n_rows:
+                return 0
+            vec_path, ids_path = self._paths(guild_key)
+            tmp_vec, tmp_ids = self._paths(guild_key + ".prune")
+            vecs = np.memmap(vec_path, dtype=np.float16, mode="r", shape=(n_rows, self.dim))
+            ids = np.memmap(ids_path, dtype=np.int64, mode="r", shape=(n_rows,))
+            removed = np.asarray(sorted(set(removed_ids)), dtype=np.int64)
+            kept = 0
+            with open(tmp_vec, "wb") as fv, open(tmp_ids, "wb") as fi:
+                for start in range(0, n_rows, SEARCH_CHUNK):
+                    chunk_ids = ids[start:start + SEARCH_CHUNK]
+                    keep = ~np.isin(chunk_ids, removed, assume_unique=True)
+                    fv.write(np.ascontiguousarray(vecs[start:start + SEARCH_CHUNK][keep]).tobytes())
+                    fi.write(np.ascontiguousarray(chunk_ids[keep]).tobytes())
+                    kept += int(keep.sum())
+            del vecs, ids
+            if kept == n_rows:
+                os.remove(tmp_vec)
+                os.remove(tmp_ids)
+                return 0
+            os.replace(tmp_vec, vec_path)
+            os.replace(tmp_ids, ids_path)
+            return n_rows - kept
+
+    # ---------- Search ----------
+    def search(self, guild_key: str, query: str, k: int) -> List[int]:
+        """
+        Ids of the k rows most similar to `query` (best first), over whatever is indexed
+        right now. Blocking (one embedding call for the query); run off the loop.
+        """
+        if not self.available() or not self.ensure(guild_key):
+            return []
+        # Map both files under the lock so appends / swaps can't tear the snapshot;
+        # the maps stay valid after the lock is released even if the files are replaced
+        with self._lock(guild_key):
+            n_rows = self._row_count(guild_key)
+            if not n_rows:
+                return []
+            vec_path, ids_path = self._paths(guild_key)
+            vecs = np.memmap(vec_path, dtype=np.float16, mode="r", shape=(n_rows, self.dim))
+            ids = np.memmap(ids_path, dtype=np.int64, mode="r", shape=(n_rows,))
+        q = self._embed([query])[0].astype(np.float32)
+
+        best_scores = np.empty(0, dtype=np.float32)
+        best_ids = np.empty(0, dtype=np.int64)
+        for start in range(0, n_rows, SEARCH_CHUNK):
+            scores = vecs[start:start + SEARCH_CHUNK].astype(np.float32) @ q
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(len(scores))
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_ids = np.concatenate([best_ids, ids[start:start + SEARCH_CHUNK][top]])
+            if len(best_scores) > k:
+                keep = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_ids = best_scores[keep], best_ids[keep]
+        order = np.argsort(-best_scores)
+        return [int(i) for i in best_ids[order]]
@@ -0,0 +1,75 @@
+import functools
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class Metrics:
+    """Tiny in-process counters + rolling timings shared by the bot and its cogs."""
+
+    def __init__(self, window: int = 512):
+        self._lock = threading.Lock()
+        self._window = window
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.timings: Dict[str, deque] = {}
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            samples = self.timings.get(name)
+            if samples is None:
+                samples = self.timings[name] = deque(maxlen=self._window)
+            samples.append(value)
+
+    def get(self, name: str) -> int:
+        return self.counters.get(name, 0)
+
+    def ratio(self, numerator: str, denominator: str) -> Optional[float]:
+        den = self.get(denominator)
+        if not den:
+            return None
+        return self.get(numerator) / den
+
+    def percentile(self, name: str, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.timings.get(name, ()))
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[idx]
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+    def span_names(self) -> list:
+        with self._lock:
+            return sorted(k[5:] for k in self.timings if k.startswith("span."))
+
+    @contextmanager
+    def span(self, name: str):
+        """Times the enclosed block (ms) under span.<name>."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"span.{name}", (time.perf_counter() - started) * 1000)
+
+
+def timed(name: str):
+    """Decorator form of METRICS.span for async handlers."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with METRICS.span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+METRICS = Metrics()
@@ -1,15 +1,29 @@
 import os
 import sqlite3
 import discord
-import requests
 import asyncio
 import json
+import re
+import time
+from datetime import datetime, timezone
 from io import BytesIO
 from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
 from openai import OpenAI
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
+
+import ai_schema
+from ai_router import ROUTER
+from ambient import AmbientReplies, AMBIENT_POOL_SIZE
+from overload import OVERLOAD, TierGate, TIER_CHAT
+from metrics import METRICS
+from tracing import TRACER
+from transport import HTTP_CLIENT, DEFAULT_TIMEOUT, task_timeout, prewarm_connections, connection_summary
+from usage import USAGE, OK, BudgetExceeded
+from warmup import WarmupBudget, WARMUP_ENABLED, WARMUP_GUILDS, WARMUP_CHANNELS, WARMUP_SCAN_ROWS
+from memory_index import MemoryIndex, EMBED_MODEL, EMBED_DIM
+from image_cache import ImageCache
 
 # ====== Blocklist for memory safety ======
 BLOCKLIST = [
@@ -80,7 +94,9 @@ bot = commands.Bot(
 
 INSTANT_SYNC_GUILD_ID = 1304124705896136744
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# One client on the shared transport; cogs use bot.openai_client rather than importing it
+# max_retries=0: the router's failover between models is the only retry layer
+openai_client = OpenAI(api_key=OPENAI_API_KEY, http_client=HTTP_CLIENT, timeout=DEFAULT_TIMEOUT, max_retries=0)
 
 bot.openai_client = openai_client
 
@@ -103,10 +119,24 @@ def sanitize_mentions(text: str) -> str:
 
 # ====== SQLite Setup ======
 DB_FILE = "memory.db"
+# Largest memory.db switched to incremental auto-vacuum at startup; the switch is a full
+# VACUUM (file rewrite under the write lock), so bigger files wait for /compact_memory
+AUTO_VACUUM_CONVERT_MAX_MB = int(os.getenv("AUTO_VACUUM_CONVERT_MAX_MB", "64"))
+
+def convert_auto_vacuum() -> None:
+    """One-time switch to incremental auto-vacuum so /forget can hand pages back in small steps. Blocking."""
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
 
 def init_db() -> None:
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
+    # WAL lets online backups read a stable snapshot without blocking writers
+    c.execute("PRAGMA journal_mode=WAL")
     c.execute("""
         CREATE TABLE IF NOT EXISTS memory (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -114,35 +144,466 @@ def init_db() -> None:
             guild_id TEXT,
             role TEXT,
             content TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            channel_id TEXT
         )
     """)
+    if "channel_id" not in {r[1] for r in c.execute("PRAGMA table_info(memory)")}:
+        # Older databases: rows stored before this keep channel_id NULL and are only seen via the guild fallback
+        c.execute("ALTER TABLE memory ADD COLUMN channel_id TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_memory_guild ON memory (guild_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_memory_user ON memory (user_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_memory_channel ON memory (channel_id, id)")
     conn.commit()
+    incremental = c.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
     conn.close()
+    if not incremental:
+        size_mb = os.path.getsize(DB_FILE) / 1_048_576
+        if size_mb <= AUTO_VACUUM_CONVERT_MAX_MB:
+            print(f"🧹 Switching {DB_FILE} to incremental auto-vacuum ({size_mb:.0f} MiB rewrite)…")
+            convert_auto_vacuum()
+        else:
+            print(f"⚠ {DB_FILE} is {size_mb:.0f} MiB, too big to switch to incremental auto-vacuum at startup; "
+                  f"/forget won't shrink the file until the owner runs /compact_memory.")
 
 init_db()
 
-def add_to_memory(user_id: int, guild_id: Optional[int], role: str, content: str) -> None:
+# ====== Full-text index ======
+# External-content FTS5 table over memory, kept in sync by triggers. guild_id/user_id are
+# indexed as columns so scoping a search is a posting-list intersection, not a row filter.
+# Rows that predate the index are filled in by a chunked backfill job; until it finishes,
+# the delete/update triggers skip the not-yet-indexed id range (memory_meta holds the cursor).
+FTS_BACKFILL_ROWS = 2000     # rows indexed per backfill transaction
+FTS_MAX_TERMS = 8            # query words used per search
+
+_FTS_INDEXED = """
+    old.id <= COALESCE((SELECT value FROM memory_meta WHERE key = 'fts_backfill_pos'), old.id)
+    OR old.id > COALESCE((SELECT value FROM memory_meta WHERE key = 'fts_backfill_end'), old.id)
+"""
+FTS_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS memory_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    """CREATE VIRTUAL TABLE memory_fts USING fts5(
+        content, guild_id, user_id, content='memory', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    # Rank on message text only
+    "INSERT INTO memory_fts (memory_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0, 0.0)')",
+    """CREATE TRIGGER memory_fts_ai AFTER INSERT ON memory BEGIN
+        INSERT INTO memory_fts (rowid, content, guild_id, user_id) VALUES (new.id, new.content, new.guild_id, new.user_id);
+    END""",
+    f"""CREATE TRIGGER memory_fts_ad AFTER DELETE ON memory WHEN {_FTS_INDEXED} BEGIN
+        INSERT INTO memory_fts (memory_fts, rowid, content, guild_id, user_id)
+        VALUES ('delete', old.id, old.content, old.guild_id, old.user_id);
+    END""",
+    f"""CREATE TRIGGER memory_fts_au AFTER UPDATE ON memory WHEN {_FTS_INDEXED} BEGIN
+        INSERT INTO memory_fts (memory_fts, rowid, content, guild_id, user_id)
+        VALUES ('delete', old.id, old.content, old.guild_id, old.user_id);
+        INSERT INTO memory_fts (rowid, content, guild_id, user_id) VALUES (new.id, new.content, new.guild_id, new.user_id);
+    END""",
+]
+
+
+def init_fts() -> bool:
+    """Creates the FTS index on first run and queues a backfill of existing rows. False if FTS5 is unavailable."""
+    conn = sqlite3.connect(DB_FILE, isolation_level=None)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'memory_fts'").fetchone():
+            return True
+        conn.execute("BEGIN IMMEDIATE")
+        for stmt in FTS_SCHEMA:
+            conn.execute(stmt)
+        end = conn.execute("SELECT COALESCE(MAX(id), 0) FROM memory").fetchone()[0]
+        conn.executemany("INSERT OR REPLACE INTO memory_meta (key, value) VALUES (?, ?)",
+                         [("fts_backfill_pos", 0), ("fts_backfill_end", end)])
+        conn.execute("COMMIT")
+        return True
+    except sqlite3.OperationalError as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        print(f"⚠ Full-text search unavailable: {e}")
+        return False
+    finally:
+        conn.close()
+
+FTS_ENABLED = init_fts()
+
+USAGE.start()
+
+# ====== Prompt layout ======
+# Guild history is fed to the model in fixed-size blocks: the older window only moves
+# once a whole block has filled, so the front of the prompt stays byte-identical
+# between calls and the provider's prefix cache can reuse it.
+HISTORY_BLOCK_SIZE = 10      # guild rows per block
+HISTORY_STABLE_BLOCKS = 2    # aligned blocks kept in front of the live tail
+RECENT_USER_TURNS = 6        # caller's own latest rows, appended after the guild tail
+OVERLOAD_HISTORY_ROWS = 4    # overload tier 2: only this many recent rows, no older window
+
+# Optional relevance retrieval (needs numpy): top-k similar rows + the last few turns
+MEMORY_RETRIEVAL = os.getenv("MEMORY_RETRIEVAL", "0") == "1"
+RETRIEVAL_TOP_K = 8
+RETRIEVAL_RECENT_TURNS = 6
+
+# Keyword-matched older rows (FTS) added ahead of the recent turns; 0 disables
+MEMORY_KEYWORD_ROWS = int(os.getenv("MEMORY_KEYWORD_ROWS", "0"))
+
+# History comes from the current channel/thread when it has at least MEMORY_CHANNEL_MIN_ROWS
+# rows of its own, otherwise from the whole guild. MEMORY_SCOPE=guild restores guild-wide history.
+MEMORY_SCOPE = os.getenv("MEMORY_SCOPE", "channel")
+MEMORY_CHANNEL_MIN_ROWS = int(os.getenv("MEMORY_CHANNEL_MIN_ROWS", "4"))
+
+_guild_row_counts: Dict[str, int] = {}
+_channel_row_counts: Dict[str, int] = {}
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    response = openai_client.embeddings.create(model=EMBED_MODEL, input=texts, dimensions=EMBED_DIM)
+    USAGE.record(EMBED_MODEL, response)
+    return [d.embedding for d in response.data]
+
+
+memory_index = MemoryIndex(DB_FILE, embed_texts) if MEMORY_RETRIEVAL and MemoryIndex.available() else None
+
+
+def _guild_key(guild_id: Optional[int]) -> str:
+    return str(guild_id) if guild_id else "DM"
+
+
+def _row_count(cache: Dict[str, int], column: str, key: str) -> int:
+    count = cache.get(key)
+    if count is None:
+        conn = sqlite3.connect(DB_FILE)
+        count = conn.execute(f"SELECT COUNT(*) FROM memory WHERE {column} = ?", (key,)).fetchone()[0]
+        conn.close()
+        cache[key] = count
+    return count
+
+
+def guild_row_count(guild_key: str) -> int:
+    """Rows stored for a guild. Cached in-process and bumped by add_to_memory."""
+    return _row_count(_guild_row_counts, "guild_id", guild_key)
+
+
+def channel_row_count(channel_key: str) -> int:
+    """Rows stored for a channel or thread. Cached like guild_row_count."""
+    return _row_count(_channel_row_counts, "channel_id", channel_key)
+
+
+def invalidate_memory_caches(guild_key: Optional[str] = None, drop_index: bool = False) -> None:
+    if guild_key is None:
+        _guild_row_counts.clear()
+    else:
+        _guild_row_counts.pop(guild_key, None)
+    _channel_row_counts.clear()   # not keyed by guild; cheap to recount
+    if drop_index and memory_index:
+        memory_index.drop(guild_key)
+
+
+def add_to_memory(user_id: int, guild_id: Optional[int], role: str, content: str,
+                  channel_id: Optional[int] = None) -> int:
     safe_content = sanitize_content(content)
+    guild_key = _guild_key(guild_id)
+    channel_key = str(channel_id) if channel_id else None
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
     c.execute(
-        "INSERT INTO memory (user_id, guild_id, role, content) VALUES (?, ?, ?, ?)",
-        (str(user_id), str(guild_id) if guild_id else "DM", role, safe_content)
+        "INSERT INTO memory (user_id, guild_id, role, content, channel_id) VALUES (?, ?, ?, ?, ?)",
+        (str(user_id), guild_key, role, safe_content, channel_key)
     )
+    row_id = c.lastrowid
     conn.commit()
     conn.close()
+    if guild_key in _guild_row_counts:
+        _guild_row_counts[guild_key] += 1
+    if channel_key in _channel_row_counts:
+        _channel_row_counts[channel_key] += 1
+    return row_id
+
+
+async def remember_exchange(user_id: int, guild_id: Optional[int], prompt: str, reply: str,
+                            channel_id: Optional[int] = None) -> None:
+    """Store a user/assistant turn pair and, in retrieval mode, index it off the loop."""
+    user_row = add_to_memory(user_id, guild_id, "user", prompt, channel_id)
+    bot_row = add_to_memory(user_id, guild_id, "assistant", reply, channel_id)
+    if memory_index:
+        rows = [(user_row, sanitize_content(prompt)), (bot_row, sanitize_content(reply))]
+        try:
+            await asyncio.to_thread(memory_index.append, _guild_key(guild_id), rows)
+        except Exception as e:
+            print(f"⚠ Failed to index memory rows: {e}")
+
+
+def get_relevant_memory(guild_key: str, query: str) -> Optional[Tuple[List[dict], List[dict]]]:
+    """Top-k rows similar to `query`, plus the guild's last few turns. None if the index isn't ready."""
+    try:
+        ids = memory_index.search(guild_key, query, RETRIEVAL_TOP_K + RETRIEVAL_RECENT_TURNS)
+    except Exception as e:
+        print(f"⚠ Memory retrieval failed: {e}")
+        return None
+    if not ids:
+        return None
+
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    c.execute("SELECT id, role, content FROM memory WHERE guild_id = ? ORDER BY id DESC LIMIT ?", (guild_key, RETRIEVAL_RECENT_TURNS))
+    recent_rows = list(reversed(c.fetchall()))
+    recent_ids = {r[0] for r in recent_rows}
+    picked = [i for i in ids if i not in recent_ids][:RETRIEVAL_TOP_K]
+    relevant_rows = []
+    if picked:
+        marks = ",".join("?" * len(picked))
+        c.execute(f"SELECT id, role, content FROM memory WHERE guild_id = ? AND id IN ({marks}) ORDER BY id", (guild_key, *picked))
+        relevant_rows = c.fetchall()
+    conn.close()
+
+    relevant_history = [{"role": r, "content": ct} for _, r, ct in relevant_rows]
+    recent_history = [{"role": r, "content": ct} for _, r, ct in recent_rows]
+    return relevant_history, recent_history
+
+
+def fts_query(text: str, guild_key: str, user_id: Optional[str] = None, any_term: bool = False) -> Optional[str]:
+    """
+    FTS5 MATCH expression for free text, scoped to a guild (and optionally a user).
+    Words are quoted, so user input can't inject query syntax.
+    """
+    words = list(dict.fromkeys(w for w in re.findall(r"\w+", text.lower()) if len(w) > 1))[:FTS_MAX_TERMS]
+    if not words:
+        return None
+    terms = (" OR " if any_term else " ").join(f'"{w}"' for w in words)
+    scope = f'guild_id:"{guild_key}"' + (f' AND user_id:"{user_id}"' if user_id else "")
+    return f"{scope} AND ({terms})"
+
 
+RECALL_MAX_RESULTS = 200     # ranked ids snapshotted per /recall session
+
+def search_memory_ids(guild_key: str, query: str, user_id: Optional[str] = None,
+                      limit: int = RECALL_MAX_RESULTS) -> List[int]:
+    """
+    Ids of the best full-text matches, best first. Taken once per /recall session: bm25
+    ranks shift as rows are added, so paging re-ranked results could skip or repeat rows.
+    """
+    match = fts_query(query, guild_key, user_id)
+    if not FTS_ENABLED or not match:
+        return []
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        rows = conn.execute(
+            "SELECT rowid FROM memory_fts WHERE memory_fts MATCH ? ORDER BY rank, rowid LIMIT ?",
+            (match, limit)
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        print(f"⚠ Memory search failed: {e}")
+        return []
+    finally:
+        conn.close()
+    return [r[0] for r in rows]
+
+
+def search_memory(guild_key: str, query: str, ids: List[int],
+                  user_id: Optional[str] = None) -> List[sqlite3.Row]:
+    """
+    One page of search results for `ids` (from search_memory_ids), in that order; rows
+    forgotten since are skipped. Rows: id, user_id, role, timestamp, snippet.
+    """
+    match = fts_query(query, guild_key, user_id)
+    if not FTS_ENABLED or not match or not ids:
+        return []
+    conn = sqlite3.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT m.id, m.user_id, m.role, m.timestamp,
+                   snippet(memory_fts, 0, '**', '**', '…', 16) AS snippet
+            FROM memory_fts JOIN memory m ON m.id = memory_fts.rowid
+            WHERE memory_fts MATCH ? AND memory_fts.rowid IN ({",".join("?" * len(ids))})
+            """,
+            (match, *ids)
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        print(f"⚠ Memory search failed: {e}")
+        return []
+    finally:
+        conn.close()
+    order = {row_id: i for i, row_id in enumerate(ids)}
+    return sorted(rows, key=lambda r: order[r["id"]])
+
+
+def get_keyword_memory(guild_key: str, query: str, exclude: set, limit: int) -> List[tuple]:
+    """Best keyword matches for `query` in the guild as (id, role, content), skipping ids in `exclude`."""
+    match = fts_query(query, guild_key, any_term=True)
+    if not FTS_ENABLED or not match:
+        return []
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        rows = conn.execute(
+            "SELECT m.id, m.role, m.content FROM memory_fts JOIN memory m ON m.id = memory_fts.rowid "
+            "WHERE memory_fts MATCH ? ORDER BY memory_fts.rank LIMIT ?",
+            (match, limit + len(exclude))
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+    return [r for r in rows if r[0] not in exclude][:limit]
+
+
+def _fts_backfill_chunk() -> Optional[int]:
+    """Indexes the next FTS_BACKFILL_ROWS pre-existing rows. Returns ids left to cover, or None when done."""
+    conn = sqlite3.connect(DB_FILE, isolation_level=None)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM memory_meta WHERE key LIKE 'fts_backfill_%'").fetchall())
+        if len(meta) < 2:
+            return None
+        pos, end = meta["fts_backfill_pos"], meta["fts_backfill_end"]
+        conn.execute("BEGIN IMMEDIATE")
+        upto = conn.execute(
+            "SELECT MAX(id) FROM (SELECT id FROM memory WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)",
+            (pos, end, FTS_BACKFILL_ROWS)
+        ).fetchone()[0]
+        if upto is None:
+            conn.execute("DELETE FROM memory_meta WHERE key LIKE 'fts_backfill_%'")
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "INSERT INTO memory_fts (rowid, content, guild_id, user_id) "
+            "SELECT id, content, guild_id, user_id FROM memory WHERE id > ? AND id <= ?",
+            (pos, upto)
+        )
+        conn.execute("UPDATE memory_meta SET value = ? WHERE key = 'fts_backfill_pos'", (upto,))
+        conn.execute("COMMIT")
+        return end - upto
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+_fts_backfill_task: Optional[asyncio.Task] = None
+
+async def run_fts_backfill() -> None:
+    started = False
+    try:
+        while (left := await asyncio.to_thread(_fts_backfill_chunk)) is not None:
+            if not started:
+                print(f"🔎 Indexing existing memory for /recall (~{left} rows left)…")
+                started = True
+            await asyncio.sleep(0.05)
+        if started:
+            print("🔎 Memory full-text index is up to date.")
+    except Exception as e:
+        print(f"⚠ Memory FTS backfill stopped: {e}")
+
+
+def fts_backfill_pending() -> bool:
+    return _fts_backfill_task is not None and not _fts_backfill_task.done()
+
+
+def _history_scope(guild_key: str, channel_id: Optional[int]) -> Tuple[str, str, int]:
+    """(column, key, row count) that the history window is read from: the channel if it has enough rows, else the guild."""
+    if channel_id and MEMORY_SCOPE == "channel":
+        channel_key = str(channel_id)
+        total = channel_row_count(channel_key)
+        if total >= MEMORY_CHANNEL_MIN_ROWS:
+            return "channel_id", channel_key, total
+        METRICS.incr("memory.guild_fallbacks")
+    return "guild_id", guild_key, guild_row_count(guild_key)
+
+
+def get_memory(user_id: int, guild_id: Optional[int], query: Optional[str] = None,
+               channel_id: Optional[int] = None) -> Tuple[List[dict], List[dict]]:
+    """
+    Returns (stable_history, recent_history).
+    - stable_history: the channel's (or guild's, see _history_scope) older window, aligned
+      to HISTORY_BLOCK_SIZE boundaries (or, in retrieval mode, the rows most relevant to `query`)
+    - recent_history: rows past the last boundary plus the caller's own latest turns in that
+      scope, preceded by up to MEMORY_KEYWORD_ROWS older guild rows matching `query`
+    """
+    guild_key = _guild_key(guild_id)
+    if memory_index and query:
+        retrieved = get_relevant_memory(guild_key, query)
+        if retrieved:
+            return retrieved
+    column, key, total = _history_scope(guild_key, channel_id)
+    boundary = (total // HISTORY_BLOCK_SIZE) * HISTORY_BLOCK_SIZE
+    start = max(0, boundary - HISTORY_STABLE_BLOCKS * HISTORY_BLOCK_SIZE)
 
-def get_memory(user_id: int, guild_id: Optional[int], limit_user: int = 10, limit_server: int = 20):
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
-    c.execute("SELECT role, content FROM memory WHERE user_id = ? ORDER BY id DESC LIMIT ?", (str(user_id), limit_user))
-    user_history = [{"role": r, "content": ct} for r, ct in reversed(c.fetchall())]
-    c.execute("SELECT role, content FROM memory WHERE guild_id = ? ORDER BY id DESC LIMIT ?", (str(guild_id) if guild_id else "DM", limit_server))
-    server_history = [{"role": r, "content": ct} for r, ct in reversed(c.fetchall())]
+    c.execute(f"SELECT id, role, content FROM memory WHERE {column} = ? ORDER BY id DESC LIMIT ?", (key, total - start))
+    guild_rows = list(reversed(c.fetchall()))
+    if column == "channel_id":
+        c.execute("SELECT id, role, content FROM memory WHERE channel_id = ? AND user_id = ? ORDER BY id DESC LIMIT ?",
+                  (key, str(user_id), RECENT_USER_TURNS))
+    else:
+        c.execute("SELECT id, role, content FROM memory WHERE user_id = ? ORDER BY id DESC LIMIT ?", (str(user_id), RECENT_USER_TURNS))
+    user_rows = c.fetchall()
     conn.close()
-    return user_history, server_history
+
+    split = max(0, len(guild_rows) - (total - boundary))
+    stable_rows = guild_rows[:split]
+    stable_ids = {r[0] for r in stable_rows}
+    recent_rows = {r[0]: r for r in guild_rows[split:]}
+    for r in user_rows:
+        if r[0] not in stable_ids:
+            recent_rows.setdefault(r[0], r)
+
+    keyword_rows = []
+    if MEMORY_KEYWORD_ROWS and query:
+        keyword_rows = get_keyword_memory(guild_key, query, stable_ids | set(recent_rows), MEMORY_KEYWORD_ROWS)
+
+    stable_history = [{"role": r, "content": ct} for _, r, ct in stable_rows]
+    recent_history = [{"role": r, "content": ct} for _, r, ct in sorted(keyword_rows) + sorted(recent_rows.values())]
+    return stable_history, recent_history
+
+
+def build_messages(personality: str, user_id: int, guild_id: Optional[int], prompt: str,
+                   channel_id: Optional[int] = None) -> List[dict]:
+    """Most stable content first: personality, aligned history window, recent turns, prompt."""
+    stable_hist, recent_hist = get_memory(user_id, guild_id, query=prompt, channel_id=channel_id)
+    if OVERLOAD.tier() >= TIER_CHAT:
+        stable_hist, recent_hist = [], recent_hist[-OVERLOAD_HISTORY_ROWS:]
+    messages = [{"role": "system", "content": personality}]
+    messages.extend(stable_hist)
+    messages.extend(recent_hist)
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def record_prompt_cache_usage(response) -> None:
+    """Track how much of each prompt the provider served from its prefix cache."""
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    METRICS.incr("chat.requests")
+    METRICS.incr("chat.prompt_tokens", usage.prompt_tokens or 0)
+    METRICS.incr("chat.cached_tokens", cached)
+    if cached:
+        METRICS.incr("chat.cache_hits")
+
+
+CHAT_MAX_TOKENS_DOWNGRADED = 200   # near the daily budget or overloaded; otherwise the "chat" route decides
+
+
+async def generate_reply(personality: str, user_id: int, guild_id: Optional[int], prompt: str,
+                         channel_id: Optional[int] = None) -> str:
+    """
+    Memory reads and the model call run in worker threads, so a slow reply never stalls
+    the loop. The whole reply counts as in-flight work for the overload tiers, including
+    time spent queued for a thread. Raises BudgetExceeded once the guild has spent its
+    daily budget.
+    """
+    state = USAGE.check(_guild_key(guild_id))
+    with OVERLOAD.track("chat", ROUTER.route("chat").timeout):
+        messages = await asyncio.to_thread(build_messages, personality, user_id, guild_id, prompt, channel_id)
+        response, _ = await ROUTER.complete(
+            openai_client, "chat", messages,
+            max_tokens=None if state == OK and OVERLOAD.tier() < TIER_CHAT else CHAT_MAX_TOKENS_DOWNGRADED
+        )
+    record_prompt_cache_usage(response)
+    return response.choices[0].message.content
 
 # ====== Pick Personality ======
 def get_personality(user_id: int, last_message: Optional[str] = None) -> str:
@@ -162,63 +623,151 @@ def prepend_mention_if_scathing(personality: str, user: discord.User, reply: str
         return f"{user.mention} {reply}"
     return reply
 
+# ====== Ambient replies (bare pings) ======
+# Only personalities a bare ping can get: with no text there is no insult, so never scathing
+AMBIENT_PERSONALITIES = {
+    "default": BOT_PERSONALITY,
+    "special_1": SPECIAL_PERSONALITY_1,
+    "special_2": SPECIAL_PERSONALITY_2,
+}
+_AMBIENT_NAMES = {text: name for name, text in AMBIENT_PERSONALITIES.items()}
+
+AMBIENT_SCHEMA = ai_schema.Schema("ambient", ai_schema.Object({
+    "lines": ai_schema.List(ai_schema.Str(300), max_items=AMBIENT_POOL_SIZE),
+}))
+
+
+async def generate_ambient(personality: str, n: int) -> List[str]:
+    response, _ = await ROUTER.complete(
+        openai_client, "ambient",
+        [
+            {"role": "system", "content": personality},
+            {"role": "user", "content": (
+                f"People sometimes ping you without saying anything. Write {n} different short things you "
+                "might say back. Each stands alone in one or two sentences, with no names or @mentions. "
+                'Return JSON {"lines": [str]}.'
+            )},
+        ],
+        response_format={"type": "json_object"},
+    )
+    data = AMBIENT_SCHEMA.decode(response.choices[0].message.content)
+    return data["lines"] if data else []
+
+
+ambient_replies = AmbientReplies(AMBIENT_PERSONALITIES, generate_ambient)
+
 # ====== /chat command ======
 @bot.tree.command(name="chat", description="Talk to the bot with personality")
 @app_commands.describe(prompt="What you want the bot to say")
 async def chat(interaction: discord.Interaction, prompt: str):
     await interaction.response.defer()
     personality = get_personality(interaction.user.id, last_message=prompt)
-    try:
-        async with interaction.channel.typing():
-            user_hist, server_hist = get_memory(interaction.user.id, interaction.guild_id)
-            messages = [{"role": "system", "content": personality}]
-            messages.extend(user_hist)
-            messages.extend(server_hist)
-            messages.append({"role": "user", "content": prompt})
-            response = openai_client.chat.completions.create(
-                model="gpt-4o-mini", messages=messages, max_tokens=500
-            )
-        bot_reply = prepend_mention_if_scathing(personality, interaction.user, response.choices[0].message.content)
-        bot_reply = sanitize_mentions(bot_reply)  # NEW
-        await interaction.followup.send(bot_reply, allowed_mentions=default_allowed_mentions)  # NEW
-        add_to_memory(interaction.user.id, interaction.guild_id, "user", prompt)
-        add_to_memory(interaction.user.id, interaction.guild_id, "assistant", bot_reply)
-    except Exception as e:
-        await interaction.followup.send(f"⚠ Error: {e}", allowed_mentions=default_allowed_mentions)  # NEW
+    with TRACER.span("chat", interaction.user.id, interaction.guild_id, prompt_chars=len(prompt)) as ev:
+        try:
+            async with interaction.channel.typing():
+                reply = await generate_reply(personality, interaction.user.id, interaction.guild_id, prompt,
+                                             interaction.channel_id)
+            bot_reply = prepend_mention_if_scathing(personality, interaction.user, reply)
+            bot_reply = sanitize_mentions(bot_reply)  # NEW
+            ev["reply_chars"] = len(bot_reply)
+            await interaction.followup.send(bot_reply, allowed_mentions=default_allowed_mentions)  # NEW
+            await remember_exchange(interaction.user.id, interaction.guild_id, prompt, bot_reply,
+                                    interaction.channel_id)
+        except Exception as e:
+            ev["ok"] = False
+            await interaction.followup.send(f"⚠ Error: {e}", allowed_mentions=default_allowed_mentions)  # NEW
+
+# ====== /image command ======
+IMAGE_MODEL = "gpt-image-1"
+IMAGE_SIZE = "1024x1024"
+IMAGE_TIMEOUT = task_timeout(180)            # generation can take a minute or more
+IMAGE_DOWNLOAD_TIMEOUT = task_timeout(30)
+
+image_cache = ImageCache()
+
+# Concurrent generations per overload tier; at tier 3 they run one at a time
+image_gate = TierGate(OVERLOAD, {0: 4, 1: 4, 2: 2, 3: 1})
+IMAGE_QUEUE_MAX = 5              # waiting requests beyond this are turned away
+IMAGE_ETA_DEFAULT_MS = 20_000    # per generation, until image.gen_ms has samples
 
 @bot.tree.command(name="image", description="Generate an image with DALL·E 3")
-@app_commands.describe(prompt="What you want the image to be of")
-async def image(interaction: discord.Interaction, prompt: str):
+@app_commands.describe(
+    prompt="What you want the image to be of",
+    reuse="Reuse a cached result for the same prompt if there is one (default: yes)"
+)
+async def image(interaction: discord.Interaction, prompt: str, reuse: bool = True):
     await interaction.response.defer()
-    try:
-        import base64, requests
-
-        async with interaction.channel.typing():
-            result = openai_client.images.generate(
-                model="gpt-image-1",
-                prompt=prompt,
-                size="1024x1024"
-            )
-
-            # Prefer URL if available
-            image_url = getattr(result.data[0], "url", None)
-            if image_url:
-                resp = requests.get(image_url)
-                resp.raise_for_status()
-                image_bytes = resp.content
+    cache_key = ImageCache.key(prompt, IMAGE_MODEL, IMAGE_SIZE)
+    with TRACER.span("image", interaction.user.id, interaction.guild_id, prompt_chars=len(prompt), reuse=reuse) as ev:
+        try:
+            import base64
+
+            # The cache does SQLite lookups, LRU eviction and multi-MB file I/O: keep it off the loop
+            cached = await asyncio.to_thread(image_cache.get, cache_key) if reuse else None
+            if cached:
+                METRICS.incr("image.cache_hits")
+                ev["cache"] = "hit"
+                METRICS.incr("image.bytes_saved", cached.size)
+                if cached.cdn_url:
+                    # Already on Discord's CDN: serve by link, no re-upload
+                    METRICS.incr("image.upload_bytes_saved", cached.size)
+                    embed = discord.Embed(color=discord.Color.blurple()).set_image(url=cached.cdn_url)
+                    await interaction.followup.send(content=f"🎨 Prompt: `{prompt}` (cached)", embed=embed)
+                    return
+                image_bytes = await asyncio.to_thread(image_cache.read, cache_key)
             else:
-                # Fallback to base64 if no URL
-                image_b64 = getattr(result.data[0], "b64_json", None)
-                if not image_b64:
-                    raise ValueError(f"OpenAI returned no usable image: {result.data[0]}")
-                image_bytes = base64.b64decode(image_b64)
+                METRICS.incr("image.cache_misses")
+                ev["cache"] = "miss"
+                # Near the daily budget: low quality, and kept out of the cache so it isn't reused
+                state = USAGE.check(_guild_key(interaction.guild_id))
+                if image_gate.must_wait():
+                    position = image_gate.waiting + 1
+                    if position > IMAGE_QUEUE_MAX:
+                        METRICS.incr("image.rejected")
+                        ev["ok"] = False
+                        await interaction.followup.send("🚦 Image generation is overloaded right now — please try again in a few minutes.")
+                        return
+                    METRICS.incr("image.queued")
+                    per_image = METRICS.percentile("image.gen_ms", 50) or IMAGE_ETA_DEFAULT_MS
+                    eta = position * per_image / 1000 / image_gate.limit()
+                    await interaction.followup.send(f"🚦 Busy — you're **#{position}** in the image queue (about {eta:.0f}s).")
+                async with image_gate, interaction.channel.typing():
+                    started = time.perf_counter()
+                    result = await asyncio.to_thread(
+                        openai_client.images.generate,
+                        model=IMAGE_MODEL,
+                        prompt=prompt,
+                        size=IMAGE_SIZE,
+                        quality="auto" if state == OK else "low",
+                        timeout=IMAGE_TIMEOUT
+                    )
+                    METRICS.observe("image.gen_ms", (time.perf_counter() - started) * 1000)
+                    TRACER.record_llm(result, started)
+                    USAGE.record(IMAGE_MODEL, result)
+
+                    # Prefer URL if available
+                    image_url = getattr(result.data[0], "url", None)
+                    if image_url:
+                        resp = await asyncio.to_thread(HTTP_CLIENT.get, image_url, timeout=IMAGE_DOWNLOAD_TIMEOUT)
+                        resp.raise_for_status()
+                        image_bytes = resp.content
+                    else:
+                        # Fallback to base64 if no URL
+                        image_b64 = getattr(result.data[0], "b64_json", None)
+                        if not image_b64:
+                            raise ValueError(f"OpenAI returned no usable image: {result.data[0]}")
+                        image_bytes = base64.b64decode(image_b64)
+                if state == OK:
+                    await asyncio.to_thread(image_cache.put, cache_key, image_bytes)
 
             file = discord.File(BytesIO(image_bytes), filename="generated.png")
+            msg = await interaction.followup.send(content=f"🎨 Prompt: `{prompt}`", file=file)
+            if msg and msg.attachments:
+                await asyncio.to_thread(image_cache.set_cdn_url, cache_key, msg.attachments[0].url)
 
-        await interaction.followup.send(content=f"🎨 Prompt: `{prompt}`", file=file)
-
-    except Exception as e:
-        await interaction.followup.send(f"⚠ Error generating image: `{e}`", ephemeral=True)
+        except Exception as e:
+            ev["ok"] = False
+            await interaction.followup.send(f"⚠ Error generating image: `{e}`", ephemeral=True)
 
 
 # ====== Mention reply ======
@@ -234,30 +783,111 @@ async def on_message(message: discord.Message):
     if bot.user and bot.user.mentioned_in(message):
         # Even if the bot is mentioned alongside @everyone/@here, we already returned above (NEW)
         prompt = message.content.replace(f"<@{bot.user.id}>", "").strip() if bot.user else ""
+        personality = get_personality(message.author.id, last_message=prompt)
+        guild_id = message.guild.id if message.guild else None
         if not prompt:
+            # Bare ping: answer from the pre-generated pool; no history, no model call
+            ambient = ambient_replies.take(_AMBIENT_NAMES.get(personality, "default"))
+            if ambient is not None:
+                with TRACER.span("mention.ambient", message.author.id, guild_id) as ev:
+                    bot_reply = sanitize_mentions(ambient)
+                    ev["reply_chars"] = len(bot_reply)
+                    await message.channel.send(bot_reply, allowed_mentions=default_allowed_mentions)
+                await bot.process_commands(message)
+                return
             prompt = "Say something in character."
-        personality = get_personality(message.author.id, last_message=prompt)
-        async with message.channel.typing():
-            user_hist, server_hist = get_memory(message.author.id, message.guild.id if message.guild else None)
-            messages = [{"role": "system", "content": personality}]
-            messages.extend(user_hist)
-            messages.extend(server_hist)
-            messages.append({"role": "user", "content": prompt})
-            response = openai_client.chat.completions.create(
-                model="gpt-4o-mini", messages=messages, max_tokens=500
-            )
-        bot_reply = prepend_mention_if_scathing(personality, message.author, response.choices[0].message.content)
-        bot_reply = sanitize_mentions(bot_reply)  # NEW
-        await message.channel.send(bot_reply, allowed_mentions=default_allowed_mentions)  # NEW
-        add_to_memory(message.author.id, message.guild.id if message.guild else None, "user", prompt)
-        add_to_memory(message.author.id, message.guild.id if message.guild else None, "assistant", bot_reply)
+        with TRACER.span("mention", message.author.id, guild_id, prompt_chars=len(prompt)) as ev:
+            try:
+                async with message.channel.typing():
+                    reply = await generate_reply(personality, message.author.id, guild_id, prompt, message.channel.id)
+            except BudgetExceeded as e:
+                ev["ok"] = False
+                reply = None
+                await message.channel.send(f"⚠ {e}.", allowed_mentions=default_allowed_mentions)
+            if reply is not None:
+                bot_reply = prepend_mention_if_scathing(personality, message.author, reply)
+                bot_reply = sanitize_mentions(bot_reply)  # NEW
+                ev["reply_chars"] = len(bot_reply)
+                await message.channel.send(bot_reply, allowed_mentions=default_allowed_mentions)  # NEW
+                await remember_exchange(message.author.id, guild_id, prompt, bot_reply, message.channel.id)
 
     await bot.process_commands(message)
 
 
+# ====== Startup warm-up ======
+def _recent_guilds(limit: int) -> List[str]:
+    """Guild keys ordered by their most recent memory row."""
+    conn = sqlite3.connect(DB_FILE)
+    rows = conn.execute(
+        "SELECT guild_id FROM memory WHERE guild_id != 'DM' GROUP BY guild_id ORDER BY MAX(id) DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+    conn.close()
+    return [r[0] for r in rows]
+
+
+def _recent_channels(limit: int) -> List[Tuple[str, str]]:
+    """(guild key, channel key) of the channels in the newest WARMUP_SCAN_ROWS rows, most recent first."""
+    conn = sqlite3.connect(DB_FILE)
+    rows = conn.execute(
+        "SELECT guild_id, channel_id, MAX(id) AS last FROM "
+        "(SELECT id, guild_id, channel_id FROM memory ORDER BY id DESC LIMIT ?) "
+        "WHERE channel_id IS NOT NULL AND guild_id != 'DM' GROUP BY channel_id ORDER BY last DESC LIMIT ?",
+        (WARMUP_SCAN_ROWS, limit)
+    ).fetchall()
+    conn.close()
+    return [(r[0], r[1]) for r in rows]
+
+
+def _warm_memory(guild_keys: List[str], budget: WarmupBudget) -> int:
+    """
+    Row counts and history windows for the configured MEMORY_SCOPE (the windows chat will
+    read), which also pulls their pages into SQLite's cache.
+    """
+    if MEMORY_SCOPE == "channel":
+        scopes = [(int(g), int(ch)) for g, ch in _recent_channels(WARMUP_CHANNELS)]
+    else:
+        scopes = [(int(g), None) for g in guild_keys]
+    warmed = 0
+    for guild_id, channel_id in scopes:
+        if not budget.ok():
+            break
+        stable, recent = get_memory(0, guild_id, channel_id=channel_id)
+        budget.charge(sum(len(m["content"]) for m in stable + recent))
+        warmed += 1
+    return warmed
+
+
+async def warm_caches():
+    """
+    Runs once at startup, concurrently with the gateway connect. Every step is blocking
+    SQLite work, so it runs in a worker thread and stops when the budget runs out.
+    """
+    budget = WarmupBudget()
+    done: Dict[str, int] = {}
+    try:
+        guild_keys = await asyncio.to_thread(_recent_guilds, WARMUP_GUILDS)
+        done["windows"] = await asyncio.to_thread(_warm_memory, guild_keys, budget)
+        rpg = bot.get_cog("RPGCog")
+        if rpg is not None and budget.ok():
+            done.update(await asyncio.to_thread(rpg.warm, list(guild_keys), budget))
+        await asyncio.to_thread(image_cache.total_bytes)
+    except Exception as e:
+        print(f"⚠ Warm-up stopped early: {e}")
+    for k, n in done.items():
+        METRICS.incr(f"warmup.{k}", n)
+    METRICS.observe("warmup.seconds", budget.elapsed())
+    summary = ", ".join(f"{n} {k}" for k, n in done.items()) or "nothing"
+    print(f"🔥 Warm-up: {summary} in {budget.elapsed():.1f}s ({budget.used_bytes / 1_048_576:.1f} MiB)")
+
+
 # ====== Bot Ready ======
 @bot.event
 async def on_ready():
+    global _fts_backfill_task
+    if FTS_ENABLED and _fts_backfill_task is None:
+        _fts_backfill_task = asyncio.create_task(run_fts_backfill())
+    ambient_replies.warm()
     try:
         # Always instantly sync for the specific guild
         guild = discord.Object(id=INSTANT_SYNC_GUILD_ID)
@@ -304,30 +934,283 @@ async def manual_sync(interaction: discord.Interaction, guild_id: Optional[str]
     except Exception as e:
         await interaction.followup.send(f"⚠ Failed to sync commands: {e}", ephemeral=True)
 
-@bot.tree.command(name="forget", description="Forget stored memory.")
+# ====== Stats ======
+@bot.tree.command(name="stats", description="Admin: show bot runtime metrics.")
+async def stats(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("⛔ You must be an admin to use this command.", ephemeral=True)
+        return
+
+    hit_ratio = METRICS.ratio("chat.cached_tokens", "chat.prompt_tokens")
+    image_cache_bytes = await asyncio.to_thread(image_cache.total_bytes)
+    lines = [
+        f"Chat requests: **{METRICS.get('chat.requests')}**",
+        f"Prompt tokens: **{METRICS.get('chat.prompt_tokens')}** (cached: **{METRICS.get('chat.cached_tokens')}**)",
+        f"Prompt cache hit ratio: **{hit_ratio:.1%}**" if hit_ratio is not None else "Prompt cache hit ratio: _n/a_",
+        f"Requests with a cache hit: **{METRICS.get('chat.cache_hits')}**",
+        f"Image cache: **{METRICS.get('image.cache_hits')}** hits / **{METRICS.get('image.cache_misses')}** misses, "
+        f"**{METRICS.get('image.bytes_saved') / 1_048_576:.1f} MiB** not regenerated, "
+        f"**{METRICS.get('image.upload_bytes_saved') / 1_048_576:.1f} MiB** not re-uploaded "
+        f"({image_cache_bytes / 1_048_576:.1f} MiB on disk)",
+    ]
+    schema_lines = ai_schema.failure_summary()
+    if schema_lines:
+        lines.append("AI JSON responses:")
+        lines.extend(f"• {line}" for line in schema_lines)
+    model_lines = ROUTER.summary()
+    if model_lines:
+        lines.append("Models:")
+        lines.extend(f"• {line}" for line in model_lines)
+    connection_lines = connection_summary()
+    if connection_lines:
+        lines.append("Connections:")
+        lines.extend(f"• {line}" for line in connection_lines)
+    embed = discord.Embed(title="📊 Bot Stats", description="\n".join(lines), color=discord.Color.blurple())
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# ====== Usage ======
+def _usage_line(name: str, r: sqlite3.Row) -> str:
+    return (f"`{name}` — **${r['cost_micros'] / 1e6:.4f}** · {r['calls']} calls · "
+            f"{r['prompt_tokens']:,} in ({r['cached_tokens']:,} cached) / {r['completion_tokens']:,} out")
+
+
+@bot.tree.command(name="usage", description="Admin: model tokens and cost for this server (or all servers).")
+@app_commands.describe(days="How many days back to report (1–30)", scope="This server, or all servers (owner only)")
+@app_commands.choices(scope=[
+    app_commands.Choice(name="Server", value="server"),
+    app_commands.Choice(name="All servers (owner)", value="all"),
+])
+async def usage(interaction: discord.Interaction, days: app_commands.Range[int, 1, 30] = 1,
+                scope: Optional[app_commands.Choice[str]] = None):
+    all_guilds = scope is not None and scope.value == "all"
+    if all_guilds and not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("⛔ Only the bot owner can see usage for all servers.", ephemeral=True)
+        return
+    if not all_guilds and not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("⛔ You must be an admin to use this command.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    guild_key = _guild_key(interaction.guild_id)
+    rows = await asyncio.to_thread(USAGE.report, days, None if all_guilds else guild_key)
+    lines = [_usage_line(r["name"], r) for r in rows] or ["_No model calls recorded._"]
+    if not all_guilds:
+        budget = USAGE.budget_usd(guild_key)
+        spent = USAGE.spent_usd(guild_key)
+        lines.append("")
+        lines.append(f"Today (UTC): **${spent:.4f}**" + (f" of **${budget:.2f}** daily budget" if budget > 0 else ""))
+    title = f"💸 Usage — last {days} day{'s' if days != 1 else ''}" + (" (all servers)" if all_guilds else "")
+    embed = discord.Embed(title=title, description="\n".join(lines)[:4096], color=discord.Color.blurple())
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+# ====== Recall ======
+RECALL_PAGE_SIZE = 5
+
+def _recall_embed(query: str, rows: List[sqlite3.Row], page: int, server_scope: bool) -> discord.Embed:
+    lines = []
+    for r in rows:
+        when = ""
+        try:
+            when = f"<t:{int(datetime.strptime(r['timestamp'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp())}:d> "
+        except (TypeError, ValueError):
+            pass
+        who = "🤖" if r["role"] == "assistant" else (f"<@{r['user_id']}>" if server_scope else "🗣️")
+        lines.append(f"{when}{who} {r['snippet']}")
+    embed = discord.Embed(
+        title=f"🔎 Recall: {query[:80]}",
+        description="\n\n".join(lines) if lines else "_No matches._",
+        color=discord.Color.blurple(),
+    )
+    footer = f"Page {page}"
+    if fts_backfill_pending():
+        footer += " · older messages are still being indexed"
+    embed.set_footer(text=footer)
+    return embed
+
+
+class RecallView(discord.ui.View):
+    """Pages through a snapshot of ranked ids taken on the first load, so pages stay stable."""
+
+    def __init__(self, author_id: int, guild_key: str, query: str, user_id: Optional[str]):
+        super().__init__(timeout=300)
+        self.author_id = author_id
+        self.guild_key = guild_key
+        self.query = query
+        self.user_id = user_id
+        self.ids: Optional[List[int]] = None
+        self.page = 1
+
+    async def load(self) -> discord.Embed:
+        if self.ids is None:
+            self.ids = await asyncio.to_thread(search_memory_ids, self.guild_key, self.query, self.user_id)
+        start = (self.page - 1) * RECALL_PAGE_SIZE
+        rows = await asyncio.to_thread(search_memory, self.guild_key, self.query,
+                                       self.ids[start:start + RECALL_PAGE_SIZE], self.user_id)
+        self.prev_page.disabled = self.page == 1
+        self.next_page.disabled = start + RECALL_PAGE_SIZE >= len(self.ids)
+        return _recall_embed(self.query, rows, self.page, self.user_id is None)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author_id
+
+    @discord.ui.button(label="Prev", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(1, self.page - 1)
+        await interaction.response.edit_message(embed=await self.load(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(embed=await self.load(), view=self)
+
+
+@bot.tree.command(name="recall", description="Search past conversations with the bot.")
 @app_commands.describe(
-    scope="What to forget: user, server, or all",
-    target_id="Optional ID of the user or server to target."
+    query="Words to look for",
+    scope="Your own messages, or the whole server (admin)"
 )
+@app_commands.choices(scope=[
+    app_commands.Choice(name="Me", value="me"),
+    app_commands.Choice(name="Server", value="server"),
+])
+async def recall(interaction: discord.Interaction, query: str, scope: Optional[app_commands.Choice[str]] = None):
+    if not FTS_ENABLED:
+        await interaction.response.send_message("⚠ Search isn't available on this bot's database.", ephemeral=True)
+        return
+    server_scope = scope is not None and scope.value == "server" and interaction.guild is not None
+    if server_scope and not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("⛔ You must be an admin to search the whole server.", ephemeral=True)
+        return
 
-
+    view = RecallView(
+        interaction.user.id,
+        _guild_key(interaction.guild_id),
+        query,
+        None if server_scope else str(interaction.user.id),
+    )
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    embed = await view.load()
+    await interaction.followup.send(embed=embed, view=view, ephemeral=True)
 
 
 # ============== FORGET ===============
+FORGET_CHUNK_ROWS = 500          # rows deleted per transaction
+FORGET_PROGRESS_EVERY = 20       # chunks between progress updates
+VACUUM_STEP_PAGES = 2000         # pages released per incremental_vacuum step
+
+# Running forget jobs keyed by target, so repeats don't stack and tasks aren't GC'd
+_forget_jobs: Dict[str, asyncio.Task] = {}
+
+
+def _delete_memory_chunk(where: str, params: tuple) -> List[Tuple[int, str]]:
+    """Deletes up to FORGET_CHUNK_ROWS matching rows; returns their (id, guild_id)."""
+    conn = sqlite3.connect(DB_FILE, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(f"SELECT id, guild_id FROM memory {where} LIMIT ?", (*params, FORGET_CHUNK_ROWS)).fetchall()
+        if rows:
+            conn.execute(f"DELETE FROM memory WHERE id IN ({','.join('?' * len(rows))})", [r[0] for r in rows])
+        conn.execute("COMMIT")
+        return rows
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+async def _forget_vectors(removed: Dict[str, List[int]]) -> None:
+    """Drops deleted rows from the retrieval index of each guild they belonged to."""
+    if not memory_index:
+        return
+    for guild_key, ids in removed.items():
+        try:
+            await asyncio.to_thread(memory_index.remove, guild_key, ids)
+        except Exception as e:
+            print(f"⚠ Failed to drop forgotten rows from the memory index for {guild_key}: {e}")
+
+
+def _incremental_vacuum_step() -> int:
+    """Release up to VACUUM_STEP_PAGES free pages; returns pages still on the freelist (0 if not incremental)."""
+    conn = sqlite3.connect(DB_FILE)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.close()
+        return 0   # not converted yet: freed pages are reused in place
+    # executescript steps the pragma to completion; execute() would free a single page
+    conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});")
+    remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.close()
+    return remaining
+
+
+async def _run_forget_job(interaction: discord.Interaction, job_key: str, label: str,
+                          where: str, params: tuple, guild_key: Optional[str], drop_index: bool):
+    deleted = 0
+    chunks = 0
+    removed: Dict[str, List[int]] = {}   # guild -> deleted ids, for indexes that are kept
+    try:
+        while True:
+            rows = await asyncio.to_thread(_delete_memory_chunk, where, params)
+            n = len(rows)
+            deleted += n
+            chunks += 1
+            if not drop_index:
+                for row_id, g in rows:
+                    removed.setdefault(g, []).append(row_id)
+            if n < FORGET_CHUNK_ROWS:
+                break
+            if chunks % FORGET_PROGRESS_EVERY == 0:
+                try:
+                    await interaction.edit_original_response(content=f"🧹 Forgetting {label}… **{deleted}** rows removed so far.")
+                except discord.HTTPException:
+                    pass  # interaction token expired; keep deleting
+            await asyncio.sleep(0)
+
+        invalidate_memory_caches(guild_key, drop_index=drop_index)
+        await _forget_vectors(removed)
+        while await asyncio.to_thread(_incremental_vacuum_step) > 0:
+            await asyncio.sleep(0)
+
+        done = f"🧹 Forgotten memory for {label} (**{deleted}** rows)."
+    except Exception as e:
+        invalidate_memory_caches(guild_key, drop_index=drop_index)
+        await _forget_vectors(removed)
+        done = f"⚠ Forget job for {label} stopped after **{deleted}** rows: {e}"
+    finally:
+        _forget_jobs.pop(job_key, None)
+
+    try:
+        await interaction.edit_original_response(content=done)
+    except discord.HTTPException:
+        print(done)
+
+
+async def _start_forget_job(interaction: discord.Interaction, job_key: str, label: str,
+                            where: str, params: tuple, guild_key: Optional[str] = None, drop_index: bool = False):
+    if job_key in _forget_jobs:
+        await interaction.response.send_message(f"⏳ Already forgetting {label}.", ephemeral=True)
+        return
+    await interaction.response.send_message(f"🧹 Forgetting {label}… this runs in the background.", ephemeral=True)
+    _forget_jobs[job_key] = asyncio.create_task(
+        _run_forget_job(interaction, job_key, label, where, params, guild_key, drop_index)
+    )
+
 
+@bot.tree.command(name="forget", description="Forget stored memory.")
+@app_commands.describe(
+    scope="What to forget: user, server, or all",
+    target_id="Optional ID of the user or server to target."
+)
 async def forget_memory(interaction: discord.Interaction, scope: str, target_id: Optional[str] = None):
     """
     Forget memory from the database based on scope:
     - user: Forget your own memory (target_id requires admin in that server)
     - server: Forget current server (target_id requires bot owner)
     - all: Forget ALL memory (bot owner only)
+    Deletes run as a background job in small chunks so the bot stays responsive.
     """
     scope = scope.lower()
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-
-    app_info = await bot.application_info()
-    bot_owner_id = app_info.owner.id
 
     # Forget user memory
     if scope == "user":
@@ -335,58 +1218,84 @@ async def forget_memory(interaction: discord.Interaction, scope: str, target_id:
             # Admin-only if targeting another user
             if not interaction.user.guild_permissions.administrator:
                 await interaction.response.send_message("⛔ Only an admin can forget another user's memory.", ephemeral=True)
-                conn.close()
                 return
             uid = target_id
         else:
             uid = str(interaction.user.id)
 
-        c.execute("DELETE FROM memory WHERE user_id = ?", (uid,))
-        conn.commit()
-        await interaction.response.send_message(f"🧹 Forgotten memory for user ID `{uid}`.", ephemeral=True)
+        await _start_forget_job(interaction, f"user:{uid}", f"user ID `{uid}`", "WHERE user_id = ?", (uid,))
 
     # Forget server memory
     elif scope == "server":
         if target_id:
-            # Owner-only if targeting another server
-            if interaction.user.id != bot_owner_id:
+            # Owner-only if targeting another server (owner id is fetched once and cached by the bot)
+            if not await bot.is_owner(interaction.user):
                 await interaction.response.send_message("⛔ Only the bot owner can forget memory for another server.", ephemeral=True)
-                conn.close()
                 return
             gid = target_id
         else:
             if not interaction.user.guild_permissions.administrator:
                 await interaction.response.send_message("⛔ Only an admin can forget this server's memory.", ephemeral=True)
-                conn.close()
                 return
             gid = str(interaction.guild.id)
 
-        c.execute("DELETE FROM memory WHERE guild_id = ?", (gid,))
-        conn.commit()
-        await interaction.response.send_message(f"🧹 Forgotten memory for server ID `{gid}`.", ephemeral=True)
+        await _start_forget_job(interaction, f"server:{gid}", f"server ID `{gid}`", "WHERE guild_id = ?", (gid,),
+                                guild_key=gid, drop_index=True)
 
     # Forget all memory (bot owner only)
     elif scope == "all":
-        if interaction.user.id != bot_owner_id:
+        if not await bot.is_owner(interaction.user):
             await interaction.response.send_message("⛔ Only the bot owner can forget ALL memory.", ephemeral=True)
-            conn.close()
             return
-        c.execute("DELETE FROM memory")
-        conn.commit()
-        await interaction.response.send_message("💣 All memory has been wiped from the database.", ephemeral=True)
+        await _start_forget_job(interaction, "all", "**all** servers and users", "", (), drop_index=True)
 
     else:
         await interaction.response.send_message("❌ Invalid scope. Use `user`, `server`, or `all`.", ephemeral=True)
 
-    conn.close()
+@bot.tree.command(name="compact_memory", description="Owner: switch memory.db to incremental auto-vacuum (full rewrite).")
+async def compact_memory(interaction: discord.Interaction):
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("⛔ Only the bot owner can compact memory.", ephemeral=True)
+        return
+    if _forget_jobs:
+        await interaction.response.send_message("⏳ A forget job is running; try again when it's done.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    before = os.path.getsize(DB_FILE)
+    started = time.perf_counter()
+    try:
+        # Writers wait (or fail with "database is locked") while the file is rewritten
+        await asyncio.to_thread(convert_auto_vacuum)
+    except sqlite3.Error as e:
+        await interaction.followup.send(f"⚠ Compaction failed: {e}", ephemeral=True)
+        return
+    after = os.path.getsize(DB_FILE)
+    await interaction.followup.send(
+        f"🧹 memory.db rewritten in {time.perf_counter() - started:.1f}s: "
+        f"{before / 1_048_576:.1f} → {after / 1_048_576:.1f} MiB, incremental auto-vacuum on.",
+        ephemeral=True
+    )
 
 # ====== Start ======
 async def load_cogs():
     await bot.load_extension("cogs.poem")
     await bot.load_extension("cogs.rpg")
+    await bot.load_extension("cogs.backup")
+    await bot.load_extension("cogs.health")
+
+# Fire-and-forget startup jobs; the loop only keeps weak references to tasks
+_startup_tasks: set = set()
+
+def _start_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    _startup_tasks.add(task)
+    task.add_done_callback(_startup_tasks.discard)
 
 async def main():
     await load_cogs()
+    if WARMUP_ENABLED:
+        _start_background(warm_caches())  # overlaps the gateway connect
+    _start_background(prewarm_connections())
     await bot.start(DISCORD_TOKEN)
 
 if __name__ == "__main__":
@@ -0,0 +1,231 @@
+# overload.py
+"""
+Overload controller with explicit degradation tiers.
+
+Signals are the amount of model work in flight and its p90 latency over the last
+LATENCY_WINDOW seconds, both fed through OVERLOAD.track(). ai_router tracks every call
+from the moment it queues for a worker thread; /chat and mentions track the whole reply
+from the moment the handler starts waiting (history reads included), so a chat backlog
+shows up in the depth signal. Latency is kept per task class and measured against that
+route's timeout, so a slow background batch can't push interactive replies into a
+higher tier; background batches are left out of it. Each signal maps to a tier through
+its thresholds and the higher one wins:
+
+    0  normal
+    1  RPG flavor lines are skipped (the built-in fallback strings are used)
+    2  /chat and mentions get a short history window and a smaller max_tokens
+    3  /image runs one at a time: callers are queued with an ETA, or rejected when the queue is full
+
+Tiers go up immediately and come down one step at a time once the signals have stayed
+below the current tier for STEP_DOWN_AFTER seconds. Transitions are logged, counted in
+METRICS and kept for /loop_health.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from metrics import METRICS
+
+INFLIGHT_TIERS = (8, 16, 24)                # calls in flight at which tiers 1 / 2 / 3 start
+LATENCY_TIERS = (0.15, 0.30, 0.45)          # p90 latency / route timeout at which tiers 1 / 2 / 3 start
+LATENCY_WINDOW = 30.0                       # seconds of call latencies considered
+LATENCY_MIN_SAMPLES = 5                     # calls a task class needs in the window before its p90 counts
+LATENCY_EXCLUDED = frozenset({"ambient", "structured", "structured_lite"})  # background / batch generations
+STEP_DOWN_AFTER = 10.0                      # seconds below a tier before stepping down
+EVALUATE_EVERY = 1.0                        # seconds between tier evaluations
+TRANSITIONS_KEPT = 20
+FORCE_TIER = os.getenv("OVERLOAD_TIER")     # pin a tier (testing / manual shedding)
+
+TIER_FLAVOR, TIER_CHAT, TIER_IMAGE = 1, 2, 3
+
+# Set while a track() block is open, so nested tracking (handler → router) counts once
+_tracked: contextvars.ContextVar[bool] = contextvars.ContextVar("overload_tracked", default=False)
+
+
+def _tier_for(value: float, thresholds: Tuple[float, ...]) -> int:
+    return sum(1 for t in thresholds if value >= t)
+
+
+class OverloadController:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self._latencies: Dict[str, Deque[Tuple[float, float]]] = {}   # task -> (monotonic, ms)
+        self._timeouts: Dict[str, float] = {}                          # task -> route timeout (s)
+        self._listeners: List[Callable[[int], None]] = []
+        self._tier = 0
+        self._evaluated_at = 0.0
+        self._calm_since: Optional[float] = None
+        self.transitions: Deque[Dict] = deque(maxlen=TRANSITIONS_KEPT)
+
+    # ---------- signals ----------
+    @contextmanager
+    def track(self, task: str = "other", timeout: Optional[float] = None):
+        """
+        Wraps one unit of model work, from the moment it starts waiting until it returns or
+        fails. Blocks nested inside another track() in the same context are not counted again.
+        The latency counts towards `task`'s p90 when `timeout` (its route timeout) is given.
+        """
+        if _tracked.get():
+            yield
+            return
+        token = _tracked.set(True)
+        started = time.monotonic()
+        with self._lock:
+            self.inflight += 1
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                self.inflight -= 1
+                if timeout and task not in LATENCY_EXCLUDED:
+                    self._timeouts[task] = timeout
+                    self._latencies.setdefault(task, deque(maxlen=1024)).append((now, (now - started) * 1000))
+            _tracked.reset(token)
+
+    def latency_load(self) -> Tuple[float, Optional[str], Optional[float]]:
+        """
+        (p90 / route timeout, task, p90 ms) for the task class under the most pressure.
+        Classes with fewer than LATENCY_MIN_SAMPLES recent calls don't count yet.
+        """
+        cutoff = time.monotonic() - LATENCY_WINDOW
+        worst: Tuple[float, Optional[str], Optional[float]] = (0.0, None, None)
+        with self._lock:
+            for task, window in self._latencies.items():
+                while window and window[0][0] < cutoff:
+                    window.popleft()
+                if len(window) < LATENCY_MIN_SAMPLES:
+                    continue
+                samples = sorted(ms for _, ms in window)
+                p90 = samples[min(len(samples) - 1, int(0.9 * len(samples)))]
+                load = p90 / (self._timeouts[task] * 1000)
+                if load > worst[0]:
+                    worst = (load, task, p90)
+        return worst
+
+    def on_change(self, callback: Callable[[int], None]) -> None:
+        """Calls callback(new_tier) after every transition (from whichever thread evaluated it)."""
+        self._listeners.append(callback)
+
+    # ---------- tiers ----------
+    def tier(self) -> int:
+        if FORCE_TIER:
+            return int(FORCE_TIER)
+        now = time.monotonic()
+        if now - self._evaluated_at >= EVALUATE_EVERY:
+            self._evaluated_at = now
+            self._evaluate(now)
+        return self._tier
+
+    def _evaluate(self, now: float) -> None:
+        inflight = self.inflight
+        load, task, p90 = self.latency_load()
+        target = max(_tier_for(inflight, INFLIGHT_TIERS), _tier_for(load, LATENCY_TIERS))
+        if target > self._tier:
+            self._set(target, inflight, task, p90)
+            self._calm_since = None
+        elif target < self._tier:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= STEP_DOWN_AFTER:
+                self._set(self._tier - 1, inflight, task, p90)
+                self._calm_since = now
+        else:
+            self._calm_since = None
+
+    def _set(self, tier: int, inflight: int, task: Optional[str], p90: Optional[float]) -> None:
+        old, self._tier = self._tier, tier
+        METRICS.incr("overload.transitions")
+        METRICS.incr(f"overload.entered_tier{tier}")
+        self.transitions.append({"at": time.time(), "from": old, "to": tier, "inflight": inflight,
+                                 "task": task, "p90_ms": p90})
+        lat = f"{task} p90 {p90:.0f} ms" if p90 is not None else "p90 n/a"
+        print(f"{'⚠' if tier > old else '✅'} Overload tier {old} → {tier} ({inflight} model calls in flight, {lat})")
+        for callback in self._listeners:
+            callback(tier)
+
+    def summary(self) -> List[str]:
+        _, task, p90 = self.latency_load()
+        lines = [f"Overload tier: **{self.tier()}** · {self.inflight} model calls in flight · "
+                 f"p90 {f'{p90 / 1000:.1f} s ({task})' if p90 is not None else '–'}"]
+        for t in list(self.transitions)[-3:][::-1]:
+            lines.append(f"• <t:{int(t['at'])}:R> tier {t['from']} → {t['to']} ({t['inflight']} in flight)")
+        return lines
+
+
+class TierGate:
+    """
+    Async concurrency gate whose limit depends on the overload tier. Waiters are served
+    FIFO; `waiting` lets callers show a queue position or turn work away. When the tier
+    drops and the limit goes up, queued waiters are let in without waiting for a release.
+    """
+
+    def __init__(self, controller: OverloadController, limits: Dict[int, int]):
+        self.controller = controller
+        self.limits = limits
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        controller.on_change(self._tier_changed)
+
+    def limit(self) -> int:
+        tier = self.controller.tier()
+        return self.limits.get(tier, min(self.limits.values()))
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def must_wait(self) -> bool:
+        return bool(self._waiters) or self.active >= self.limit()
+
+    async def __aenter__(self):
+        if not self.must_wait():
+            self.active += 1
+            return self
+        self._loop = asyncio.get_running_loop()
+        fut = self._loop.create_future()
+        self._waiters.append(fut)
+        try:
+            while not fut.done():
+                # Tiers are evaluated lazily; polling keeps them moving while everyone waits
+                try:
+                    await asyncio.wait_for(asyncio.shield(fut), EVALUATE_EVERY)
+                except asyncio.TimeoutError:
+                    self._grant()
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()   # granted just as we were cancelled
+            else:
+                self._waiters.remove(fut)
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self._release()
+
+    def _release(self) -> None:
+        self.active -= 1
+        self._grant()
+
+    def _tier_changed(self, tier: int) -> None:
+        loop = self._loop
+        if loop is not None and self._waiters and not loop.is_closed():
+            loop.call_soon_threadsafe(self._grant)
+
+    def _grant(self) -> None:
+        limit = self.limit()
+        while self._waiters and self.active < limit:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.active += 1
+                fut.set_result(None)
+
+
+OVERLOAD = OverloadController()
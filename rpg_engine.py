@@ -0,0 +1,116 @@
+# rpg_engine.py
+"""
+Procedural encounter generation and fight resolution for the RPG cog.
+Pure Python with no Discord or network dependencies, so rpg_sim.py can reuse the
+same rules to balance it.
+"""
+import random
+import zlib
+from typing import Any, Dict, List, Mapping, Tuple
+
+# =========================
+# Balance config
+# =========================
+MAX_ENEMY_STAT = 18          # enemy atk/def cap at level 1
+ENEMY_STAT_CAP_PER_LVL = 2   # cap grows with player level so high levels stay challenging
+
+# Fight rule: each side rolls d20 + ATK - opposing DEF (floored at 1); player wins ties.
+# "margin" = (player ATK - enemy DEF) - (enemy ATK - player DEF), i.e. the player's
+# edge in that comparison. Each tier targets a margin, which fixes its win rate.
+# A fight is that single exchange, so enemies have no HP.
+#   name: (weight, margin, xp_range, coin_range)
+ENCOUNTER_TIERS: Dict[str, Tuple[int, int, Tuple[int, int], Tuple[int, int]]] = {
+    "easy":   (30,  4, (12, 20), (8, 18)),
+    "normal": (45,  1, (16, 26), (12, 26)),
+    "hard":   (20, -2, (26, 38), (22, 40)),
+    "elite":  (5,  -5, (40, 60), (40, 70)),
+}
+
+# Higher up, the enemy stat cap bites and the base margins leave the player a growing
+# edge, so brackets override them. Tuned with rpg_sim.py --tune 0.70,0.57,0.43,0.30;
+# re-run it after changing the tiers or caps.
+#   (min level, {tier: margin}), highest bracket first
+BRACKET_MARGINS: List[Tuple[int, Dict[str, int]]] = [
+    (50, {"easy": 3, "normal": -1, "hard": -4, "elite": -8}),
+    (20, {"hard": -3, "elite": -6}),
+]
+
+ATK_SHARE_RANGE = (0.4, 0.6)   # share of the enemy's stat budget that goes to ATK
+
+_ADJECTIVES = {
+    "easy": ["Sleepy", "Clumsy", "Tiny", "Lost", "Grumpy"],
+    "normal": ["Feral", "Sneaky", "Rusty", "Howling", "Bog"],
+    "hard": ["Armored", "Vicious", "Cursed", "Ironhide", "Bloodfang"],
+    "elite": ["Ancient", "Dread", "Storm-Touched", "Abyssal", "Crowned"],
+}
+_CREATURES = [
+    ("Slime", "wobbles into view, leaving a sticky trail"),
+    ("Goblin", "grins with far too many teeth"),
+    ("Skeleton", "rattles its bones menacingly"),
+    ("Wolf", "circles you with a low growl"),
+    ("Bandit", "demands your coin purse"),
+    ("Mushroom Knight", "raises a tiny spore-crusted lance"),
+    ("Golem", "grinds forward on stone joints"),
+    ("Wyrmling", "hisses a puff of smoke"),
+]
+_SCENES = [
+    "A crooked path through mossy stones.",
+    "A collapsed mine shaft, dripping and dark.",
+    "Fog rolls over a forgotten battlefield.",
+    "A quiet glade where the birds have stopped singing.",
+    "A rope bridge sways above a roaring gorge.",
+    "Torchlight flickers across a ruined crypt.",
+]
+
+
+def enemy_stat_cap(lvl: int) -> int:
+    return MAX_ENEMY_STAT + ENEMY_STAT_CAP_PER_LVL * max(0, lvl - 1)
+
+
+def tier_margin(tier: str, lvl: int) -> int:
+    """The tier's target margin for a player of this level."""
+    for min_lvl, margins in BRACKET_MARGINS:
+        if lvl >= min_lvl:
+            return margins.get(tier, ENCOUNTER_TIERS[tier][1])
+    return ENCOUNTER_TIERS[tier][1]
+
+
+def encounter_rng(user_id: int, guild_id: int, bucket: int) -> random.Random:
+    """Seeded RNG so the same player/time bucket always yields the same encounter."""
+    return random.Random(zlib.crc32(f"{user_id}:{guild_id}:{bucket}".encode()))
+
+
+def generate_encounter(player: Mapping[str, int], rng: random.Random) -> Dict[str, Any]:
+    """
+    Builds an enemy scaled to the player's lvl/atk/def.
+    Returns {tier, enemy:{name, atk, def, description}, scene, xp_range, coin_range}.
+    """
+    lvl, p_atk, p_def = player["lvl"], player["atk"], player["def"]
+    names = list(ENCOUNTER_TIERS)
+    tier = rng.choices(names, weights=[ENCOUNTER_TIERS[n][0] for n in names])[0]
+    _, _, xp_range, coin_range = ENCOUNTER_TIERS[tier]
+    margin = tier_margin(tier, lvl)
+
+    cap = enemy_stat_cap(lvl)
+    budget = max(1, p_atk + p_def - margin)
+    e_atk = max(1, min(round(budget * rng.uniform(*ATK_SHARE_RANGE)), cap))
+    e_def = max(0, min(budget - e_atk, cap))
+
+    creature, blurb = rng.choice(_CREATURES)
+    name = f"{rng.choice(_ADJECTIVES[tier])} {creature}"
+    return {
+        "tier": tier,
+        "enemy": {"name": name, "atk": e_atk, "def": e_def, "description": f"The {name.lower()} {blurb}."},
+        "scene": rng.choice(_SCENES),
+        "xp_range": xp_range,
+        "coin_range": coin_range,
+    }
+
+
+def resolve_fight(player: Mapping[str, int], enemy: Mapping[str, int], rng: random.Random) -> Dict[str, int]:
+    """One exchange of d20 rolls. Returns the raw rolls, scores and whether the player won."""
+    p_roll = rng.randint(1, 20) + player["atk"]
+    e_roll = rng.randint(1, 20) + enemy["atk"]
+    p_score = max(1, p_roll - enemy["def"])
+    e_score = max(1, e_roll - player["def"])
+    return {"p_roll": p_roll, "e_roll": e_roll, "p_score": p_score, "e_score": e_score, "won": p_score >= e_score}
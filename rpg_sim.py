@@ -0,0 +1,175 @@
+# rpg_sim.py
+"""
+Monte Carlo balance simulator for the procedural encounters in rpg_engine.py.
+Vectorized with NumPy (millions of fights per second), using the same tiers, per-bracket
+margins, stat budget and d20 rule as the live cog. --tune prints the margin each tier
+needs to hit its target win rate next to the one the engine uses now.
+
+    python rpg_sim.py                                  # synthetic players
+    python rpg_sim.py --db rpg.db                      # sample real player stats
+    python rpg_sim.py --fights 5000000 --tune 0.70,0.57,0.43,0.30
+"""
+import argparse
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    raise SystemExit("rpg_sim.py needs numpy: pip install numpy")
+
+from rpg_engine import (ENCOUNTER_TIERS, BRACKET_MARGINS, ATK_SHARE_RANGE, MAX_ENEMY_STAT,
+                        ENEMY_STAT_CAP_PER_LVL, tier_margin)
+
+LEVEL_BRACKETS = [(1, 4), (5, 9), (10, 19), (20, 49), (50, 99)]
+BATCH = 1_000_000
+
+TIER_NAMES = list(ENCOUNTER_TIERS)
+TIER_WEIGHTS = np.array([ENCOUNTER_TIERS[t][0] for t in TIER_NAMES], dtype=np.float64)
+TIER_WEIGHTS /= TIER_WEIGHTS.sum()
+# Margin per (engine bracket, tier); rows start at the levels in MARGIN_LEVELS
+MARGIN_LEVELS = np.array([1] + sorted(lvl for lvl, _ in BRACKET_MARGINS), dtype=np.int32)
+MARGIN_TABLE = np.array([[tier_margin(t, int(lvl)) for t in TIER_NAMES] for lvl in MARGIN_LEVELS], dtype=np.int32)
+TIER_XP = np.array([ENCOUNTER_TIERS[t][2] for t in TIER_NAMES], dtype=np.int32)
+TIER_COINS = np.array([ENCOUNTER_TIERS[t][3] for t in TIER_NAMES], dtype=np.int32)
+
+
+# =========================
+# Player samples
+# =========================
+def synthetic_players(rng: "np.random.Generator", lo: int, hi: int, n: int) -> Dict[str, "np.ndarray"]:
+    """Rough progression model: each level brings ~1 ATK and ~1 DEF from training and items."""
+    lvl = rng.integers(lo, hi + 1, n, dtype=np.int32)
+    atk = 5 + np.rint(lvl * rng.normal(1.0, 0.25, n)).astype(np.int32)
+    dfn = 3 + np.rint(lvl * rng.normal(0.9, 0.25, n)).astype(np.int32)
+    return {"lvl": lvl, "atk": np.maximum(atk, 1), "def": np.maximum(dfn, 0)}
+
+
+def players_from_db(path: str, rng: "np.random.Generator", lo: int, hi: int, n: int) -> Optional[Dict[str, "np.ndarray"]]:
+    """Resamples (with replacement) real players in the level bracket."""
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT lvl, atk, def FROM rpg_users WHERE lvl BETWEEN ? AND ?", (lo, hi)).fetchall()
+    conn.close()
+    if not rows:
+        return None
+    arr = np.asarray(rows, dtype=np.int32)
+    pick = rng.integers(0, len(arr), n)
+    return {"lvl": arr[pick, 0], "atk": arr[pick, 1], "def": arr[pick, 2]}
+
+
+# =========================
+# Simulation
+# =========================
+def simulate(players: Dict[str, "np.ndarray"], rng: "np.random.Generator",
+             tier_idx: Optional["np.ndarray"] = None, margins: Optional["np.ndarray"] = None) -> Dict[str, "np.ndarray"]:
+    """
+    One adventure per player row: draw tier, build the enemy, roll the fight, pay out.
+    `margins` (one per tier) replaces the engine's per-bracket margins, for tuning.
+    """
+    lvl, atk, dfn = players["lvl"], players["atk"], players["def"]
+    n = len(lvl)
+    if tier_idx is None:
+        tier_idx = rng.choice(len(TIER_NAMES), size=n, p=TIER_WEIGHTS).astype(np.int32)
+
+    cap = MAX_ENEMY_STAT + ENEMY_STAT_CAP_PER_LVL * np.maximum(0, lvl - 1)
+    if margins is None:
+        margin = MARGIN_TABLE[np.searchsorted(MARGIN_LEVELS, lvl, side="right") - 1, tier_idx]
+    else:
+        margin = margins[tier_idx]
+    budget = np.maximum(1, atk + dfn - margin)
+    e_atk = np.clip(np.rint(budget * rng.uniform(*ATK_SHARE_RANGE, n)).astype(np.int32), 1, cap)
+    e_def = np.clip(budget - e_atk, 0, cap)
+
+    p_score = np.maximum(1, rng.integers(1, 21, n, dtype=np.int32) + atk - e_def)
+    e_score = np.maximum(1, rng.integers(1, 21, n, dtype=np.int32) + e_atk - dfn)
+    won = p_score >= e_score
+
+    xp_lo, xp_hi = TIER_XP[tier_idx, 0], TIER_XP[tier_idx, 1]
+    c_lo, c_hi = TIER_COINS[tier_idx, 0], TIER_COINS[tier_idx, 1]
+    xp = np.where(won, rng.integers(xp_lo, xp_hi + 1), 0)
+    coins = np.where(won, rng.integers(c_lo, c_hi + 1), 0)
+    return {"tier": tier_idx, "won": won, "xp": xp, "coins": coins, "lvl": lvl}
+
+
+def run_bracket(sample_fn, rng: "np.random.Generator", fights: int) -> Dict[str, float]:
+    wins = np.zeros(len(TIER_NAMES))
+    counts = np.zeros(len(TIER_NAMES))
+    xp_total = coins_total = lvl_total = 0.0
+    done = 0
+    while done < fights:
+        n = min(BATCH, fights - done)
+        res = simulate(sample_fn(n), rng)
+        counts += np.bincount(res["tier"], minlength=len(TIER_NAMES))
+        wins += np.bincount(res["tier"], weights=res["won"], minlength=len(TIER_NAMES))
+        xp_total += res["xp"].sum()
+        coins_total += res["coins"].sum()
+        lvl_total += res["lvl"].sum()
+        done += n
+    out = {"win": wins.sum() / fights, "xp": xp_total / fights, "coins": coins_total / fights}
+    # XP to the next level is 100 * lvl
+    out["fights_per_level"] = (100 * lvl_total / fights) / max(out["xp"], 1e-9)
+    for i, name in enumerate(TIER_NAMES):
+        out[f"win_{name}"] = wins[i] / counts[i] if counts[i] else float("nan")
+    return out
+
+
+def tune_margins(sample_fn, rng: "np.random.Generator", targets: List[float], fights: int) -> List[Tuple[str, int, float]]:
+    """For each tier, the margin whose simulated win rate is closest to its target."""
+    players = sample_fn(fights)
+    result = []
+    for i, (name, target) in enumerate(zip(TIER_NAMES, targets)):
+        tier_idx = np.full(fights, i, dtype=np.int32)
+        best = None
+        for margin in range(-12, 13):
+            margins = np.full(len(TIER_NAMES), margin, dtype=np.int32)
+            rate = simulate(players, rng, tier_idx=tier_idx, margins=margins)["won"].mean()
+            if best is None or abs(rate - target) < abs(best[2] - target):
+                best = (name, margin, float(rate))
+        result.append(best)
+    return result
+
+
+# =========================
+# CLI
+# =========================
+def main():
+    ap = argparse.ArgumentParser(description="Simulate RPG encounter balance per level bracket.")
+    ap.add_argument("--fights", type=int, default=2_000_000, help="fights per bracket")
+    ap.add_argument("--db", help="sample player stats from this rpg.db instead of the synthetic model")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--tune", help=f"comma-separated target win rates for tiers {','.join(TIER_NAMES)}")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'bracket':>9} {'win':>6} " + " ".join(f"{t:>7}" for t in TIER_NAMES) + f" {'xp/f':>6} {'c/f':>6} {'f/lvl':>6}")
+    sim_time = 0.0
+    total = 0
+    for lo, hi in LEVEL_BRACKETS:
+        if args.db:
+            if players_from_db(args.db, rng, lo, hi, 1) is None:
+                print(f"{lo:>4}-{hi:<4} (no players)")
+                continue
+            sample_fn = lambda n, lo=lo, hi=hi: players_from_db(args.db, rng, lo, hi, n)
+        else:
+            sample_fn = lambda n, lo=lo, hi=hi: synthetic_players(rng, lo, hi, n)
+
+        started = time.perf_counter()
+        r = run_bracket(sample_fn, rng, args.fights)
+        sim_time += time.perf_counter() - started
+        total += args.fights
+        tiers = " ".join(f"{r['win_' + t]:>7.1%}" for t in TIER_NAMES)
+        print(f"{lo:>4}-{hi:<4} {r['win']:>6.1%} {tiers} {r['xp']:>6.1f} {r['coins']:>6.1f} {r['fights_per_level']:>6.1f}")
+
+        if args.tune:
+            targets = [float(x) for x in args.tune.split(",")]
+            for name, margin, rate in tune_margins(sample_fn, rng, targets, min(args.fights, BATCH)):
+                print(f"           tune {name:<7} margin {margin:+d} -> {rate:.1%} "
+                      f"(engine {tier_margin(name, lo):+d})")
+
+    if total:
+        print(f"\n{total:,} fights in {sim_time:.2f}s ({total / sim_time:,.0f} fights/s, excluding --tune)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# trace_replay.py
+"""
+Replays a traffic trace recorded with TRACE=1 (see tracing.py) against a stub model.
+
+Events are re-issued with their recorded spacing divided by --speed, through the bot's
+real code paths (prompt building and memory writes, image cache, poem cache, RPG cog
+actions). Every model call is answered by a stub that sleeps for the recorded model
+latency and returns text of the recorded size, so the run reproduces production load
+shape locally, without Discord or OpenAI.
+
+    python trace_replay.py traces/                         # real time
+    python trace_replay.py traces/trace-20251019-18.jsonl.gz --speed 25
+    python trace_replay.py traces/ --speed 100 --kinds chat,mention --model-latency 0.5
+    python trace_replay.py traces/ --kinds chat,mention --burst 60   # overload tiers under a backlog
+
+Needs the bot's dependencies installed (it imports newbot_ai and the cogs). Databases
+are created in --workdir so production data is never touched.
+"""
+import argparse
+import asyncio
+import base64
+import contextvars
+import glob
+import gzip
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MODEL_MS = 800.0       # stub latency for events recorded without model timings
+CHARS_PER_TOKEN = 4
+WORDS = "the quick brown fox jumps over a lazy dog while the goblin shop sells swords".split()
+PNG_1PX = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+
+# Recorded model behaviour of the event being replayed; to_thread copies it into the stub's thread
+_call_profile: contextvars.ContextVar[Dict[str, float]] = contextvars.ContextVar(
+    "call_profile", default={"ms": DEFAULT_MODEL_MS, "chars": 400}
+)
+
+
+# =========================
+# Trace loading
+# =========================
+def load_events(paths: List[str], kinds: Optional[set]) -> List[Dict[str, Any]]:
+    files = []
+    for p in paths:
+        files.extend(sorted(glob.glob(os.path.join(p, "*.jsonl.gz"))) if os.path.isdir(p) else [p])
+    events = []
+    for path in files:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    ev = json.loads(line)
+                except ValueError:
+                    continue  # torn final line of a crashed writer
+                if kinds is None or ev.get("kind", "").split(":")[0] in kinds:
+                    events.append(ev)
+    events.sort(key=lambda e: e["t"])
+    return events
+
+
+def _id(anon_id: Optional[str]) -> Optional[int]:
+    return int(anon_id, 16) if anon_id else None
+
+
+def _text(chars: int) -> str:
+    words = []
+    n = 0
+    while n < chars:
+        w = WORDS[len(words) % len(WORDS)]
+        words.append(w)
+        n += len(w) + 1
+    return " ".join(words)[:max(chars, 1)]
+
+
+# =========================
+# Stub model
+# =========================
+class _StubCompletions:
+    def __init__(self, latency_scale: float):
+        self.latency_scale = latency_scale
+
+    def create(self, *, messages, response_format=None, n=1, **_):
+        profile = _call_profile.get()
+        time.sleep(profile["ms"] * self.latency_scale / 1000)
+        content = "{}" if response_format else _text(int(profile["chars"]))
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // CHARS_PER_TOKEN
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content)) for _ in range(n)],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(content) // CHARS_PER_TOKEN,
+                                  prompt_tokens_details=SimpleNamespace(cached_tokens=0)),
+        )
+
+
+class _StubImages:
+    def __init__(self, latency_scale: float):
+        self.latency_scale = latency_scale
+
+    def generate(self, **_):
+        time.sleep(_call_profile.get()["ms"] * self.latency_scale / 1000)
+        return SimpleNamespace(data=[SimpleNamespace(url=None, b64_json=PNG_1PX)], usage=None)
+
+
+class StubClient:
+    """Quacks like the parts of openai.OpenAI the bot uses."""
+
+    def __init__(self, latency_scale: float):
+        self.chat = SimpleNamespace(completions=_StubCompletions(latency_scale))
+        self.images = _StubImages(latency_scale)
+
+
+# =========================
+# Replayer
+# =========================
+class Replayer:
+    def __init__(self, newbot_ai, rpg, poem):
+        self.bot = newbot_ai
+        self.rpg = rpg
+        self.poem = poem
+
+    async def run(self, ev: Dict[str, Any]) -> None:
+        llm = ev.get("llm") or {}
+        calls = max(1, llm.get("calls", 1))
+        _call_profile.set({
+            "ms": llm.get("ms", DEFAULT_MODEL_MS * calls) / calls,
+            "chars": max(1, llm.get("completion_tokens", 0) // calls * CHARS_PER_TOKEN) if llm else ev.get("reply_chars", 400),
+        })
+        kind, _, detail = ev["kind"].partition(":")
+        uid, gid = _id(ev.get("user")), _id(ev.get("guild"))
+        handler = getattr(self, "_" + kind.replace(".", "_"), None)
+        if handler:
+            await handler(uid, gid, ev, detail)
+
+    # ---------- bot core ----------
+    async def _chat(self, uid, gid, ev, _):
+        prompt = _text(ev.get("prompt_chars", 40))
+        reply = await self.bot.generate_reply(self.bot.BOT_PERSONALITY, uid, gid, prompt)
+        await self.bot.remember_exchange(uid, gid, prompt, reply)
+
+    _mention = _chat
+
+    async def _image(self, uid, gid, ev, _):
+        key = self.bot.ImageCache.key(_text(ev.get("prompt_chars", 40)) + str(ev["t"]), self.bot.IMAGE_MODEL, self.bot.IMAGE_SIZE)
+        if ev.get("cache") == "hit":
+            self.bot.image_cache.get(key)
+            return
+        result = self.bot.openai_client.images.generate(model=self.bot.IMAGE_MODEL, prompt="", size=self.bot.IMAGE_SIZE)
+        self.bot.image_cache.put(key, base64.b64decode(result.data[0].b64_json))
+
+    # ---------- poem cog ----------
+    async def _poem(self, uid, gid, ev, _):
+        await self.poem.get_poem(f"user{uid % 10_000}", ev.get("style", "silly"))
+
+    async def _poems(self, uid, gid, ev, _):
+        names = [f"user{(uid + i) % 10_000}" for i in range(ev.get("targets", 2) - ev.get("cached", 0))]
+        if names:
+            await self.poem._generate_group(names, ev.get("style", "silly"))
+
+    # ---------- rpg cog ----------
+    async def _rpg_open(self, uid, gid, ev, _):
+        self.rpg.embed_profile(uid, gid)
+        self.rpg.prefetch_for_menu(uid, gid)
+
+    async def _rpg_menu(self, uid, gid, ev, choice):
+        if choice == "Inventory":
+            self.rpg.inventory_screen(uid, gid)
+        elif choice == "Shop":
+            await self.rpg.get_ai_shop(gid, avg_player_lvl=self.rpg.get_user(uid, gid)["lvl"])
+        elif choice == "Mine / Work":
+            await self.rpg.do_mine(uid, gid)
+        elif choice == "Adventure":
+            await self.rpg.do_adventure(uid, gid)
+        elif choice == "Leaderboard":
+            self.rpg.embed_leaderboard(gid, "level")
+        else:
+            self.rpg.embed_profile(uid, gid)
+
+    async def _rpg_train(self, uid, gid, ev, _):
+        await self.rpg.do_train(uid, gid)
+
+    async def _rpg_gamble(self, uid, gid, ev, _):
+        await self.rpg.do_roll(uid, gid)
+
+    async def _rpg_inv(self, uid, gid, ev, _):
+        self.rpg.inventory_screen(uid, gid, "qty")
+
+    async def _rpg_lb(self, uid, gid, ev, _):
+        self.rpg.embed_leaderboard(gid, "level")
+
+    async def _rpg_buy(self, uid, gid, ev, _):
+        self.rpg._shop_cache_get(gid)
+        self.rpg.get_user(uid, gid)
+
+    async def _rpg_back(self, uid, gid, ev, _):
+        self.rpg.embed_profile(uid, gid)
+
+    _rpg_reset = _rpg_back   # never actually resets anyone during a replay
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return float("nan")
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+
+async def replay(events: List[Dict[str, Any]], replayer: Replayer, speed: float):
+    loop = asyncio.get_running_loop()
+    durations: Dict[str, List[float]] = defaultdict(list)
+    recorded: Dict[str, List[float]] = defaultdict(list)
+    start_lag: List[float] = []
+    loop_lag: List[float] = []
+    errors: Dict[str, int] = defaultdict(int)
+    done = asyncio.Event()
+
+    async def sample_loop_lag():
+        while not done.is_set():
+            t = loop.time()
+            await asyncio.sleep(0.1)
+            loop_lag.append(max(0.0, (loop.time() - t - 0.1) * 1000))
+
+    async def one(ev: Dict[str, Any], due: float):
+        kind = ev["kind"]
+        start_lag.append(max(0.0, (loop.time() - due) * 1000))
+        t = time.perf_counter()
+        try:
+            await replayer.run(ev)
+        except Exception as e:
+            errors[f"{kind}: {type(e).__name__}"] += 1
+        durations[kind].append((time.perf_counter() - t) * 1000)
+        if "dur_ms" in ev:
+            recorded[kind].append(ev["dur_ms"])
+
+    sampler = asyncio.create_task(sample_loop_lag())
+    t0_trace, t0 = events[0]["t"], loop.time()
+    tasks = []
+    for ev in events:
+        due = t0 + (ev["t"] - t0_trace) / speed
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(ev, due)))
+    await asyncio.gather(*tasks)
+    done.set()
+    await sampler
+    wall = loop.time() - t0
+    return durations, recorded, start_lag, loop_lag, errors, wall
+
+
+# =========================
+# CLI
+# =========================
+def main():
+    ap = argparse.ArgumentParser(description="Replay a recorded traffic trace against a stub model.")
+    ap.add_argument("paths", nargs="+", help="trace files or directories of trace-*.jsonl.gz")
+    ap.add_argument("--speed", type=float, default=1.0, help="time compression, 1 to 100")
+    ap.add_argument("--kinds", help="comma-separated event kinds to replay (e.g. chat,mention,rpg.menu)")
+    ap.add_argument("--limit", type=int, help="replay only the first N events")
+    ap.add_argument("--model-latency", type=float, default=1.0, help="multiplier on recorded model latency")
+    ap.add_argument("--burst", type=int,
+                    help="fire the first N events all at once instead of on their recorded spacing "
+                         "(checks that the overload tiers engage under a backlog)")
+    ap.add_argument("--workdir", default="replay_data")
+    args = ap.parse_args()
+    if not 1 <= args.speed <= 100:
+        ap.error("--speed must be between 1 and 100")
+
+    paths = [os.path.abspath(p) for p in args.paths]
+    events = load_events(paths, set(args.kinds.split(",")) if args.kinds else None)[:args.limit]
+    if not events:
+        raise SystemExit("No events to replay.")
+    if args.burst:
+        events = [dict(ev, t=events[0]["t"]) for ev in events[:args.burst]]
+
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    sys.path.insert(0, REPO_ROOT)
+    os.environ.setdefault("OPENAI_API_KEY", "replay-not-used")
+    os.environ["TRACE"] = "0"
+    import newbot_ai
+    from cogs.rpg import RPGCog
+    from cogs.poem import Poem
+    from overload import OVERLOAD
+
+    stub = StubClient(args.model_latency)
+    newbot_ai.openai_client = stub
+    newbot_ai.bot.openai_client = stub
+    replayer = Replayer(newbot_ai, RPGCog(SimpleNamespace(openai_client=stub)), Poem(None, stub))
+
+    span = events[-1]["t"] - events[0]["t"]
+    print(f"Replaying {len(events):,} events spanning {span:.0f}s at {args.speed:g}x (~{span / args.speed:.0f}s)…")
+    durations, recorded, start_lag, loop_lag, errors, wall = asyncio.run(replay(events, replayer, args.speed))
+
+    print(f"\nDone in {wall:.1f}s ({len(events) / max(wall, 1e-9):.1f} events/s)")
+    print(f"\n{'kind':<26} {'count':>7} {'rec p50':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for kind in sorted(durations):
+        s = durations[kind]
+        print(f"{kind:<26} {len(s):>7} {percentile(recorded[kind], 50):>8.0f} "
+              f"{percentile(s, 50):>8.0f} {percentile(s, 95):>8.0f} {percentile(s, 99):>8.0f}")
+    print(f"\nStart lag (ms):  p50 {percentile(start_lag, 50):.0f}  p99 {percentile(start_lag, 99):.0f}  max {max(start_lag):.0f}")
+    print(f"Loop lag (ms):   p50 {percentile(loop_lag, 50):.0f}  p99 {percentile(loop_lag, 99):.0f}  max {max(loop_lag, default=0):.0f}")
+    transitions = list(OVERLOAD.transitions)
+    peak = max((t["to"] for t in transitions), default=0)
+    print(f"Overload:        peak tier {peak}, {len(transitions)} transitions")
+    for t in transitions:
+        p90 = f"{t['task']} {t['p90_ms']:.0f} ms" if t["p90_ms"] is not None else "n/a"
+        print(f"  +{t['at'] - time.time() + wall:6.1f}s  tier {t['from']} → {t['to']}  ({t['inflight']} in flight, p90 {p90})")
+    if errors:
+        print("\nErrors:")
+        for k, n in sorted(errors.items()):
+            print(f"  {k}: {n}")
+
+
+if __name__ == "__main__":
+    main()
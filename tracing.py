@@ -0,0 +1,149 @@
+# tracing.py
+"""
+Opt-in traffic tracer (TRACE=1).
+
+Each traced interaction becomes one anonymized JSON event: kind, hashed user/guild ids,
+input/output sizes, handler duration and the LLM calls made while it ran (tokens, latency).
+Events are appended to hourly gzip'd JSONL files in TRACE_DIR by a background thread;
+no message text is ever written. trace_replay.py re-drives a trace against a stub model.
+"""
+import atexit
+import contextvars
+import functools
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from metrics import METRICS
+from usage import request_scope, usage_tokens
+
+TRACE_ENABLED = os.getenv("TRACE", "0") == "1"
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+TRACE_SALT = os.getenv("TRACE_SALT") or secrets.token_hex(16)   # random per run unless pinned
+TRACE_FLUSH_SECONDS = 5.0
+TRACE_MAX_QUEUE = 50_000       # buffered events; beyond this new events are dropped
+
+# The event of the interaction currently running; copied into to_thread workers and child tasks
+_current: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("trace_event", default=None)
+
+
+def anon(value: Any) -> Optional[str]:
+    """Salted hash of an id: stable within a trace, not reversible to the Discord id."""
+    if value is None:
+        return None
+    return hmac.new(TRACE_SALT.encode(), str(value).encode(), hashlib.sha256).hexdigest()[:12]
+
+
+class Tracer:
+    def __init__(self, enabled: bool = TRACE_ENABLED, directory: str = TRACE_DIR):
+        self.enabled = enabled
+        self.directory = directory
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=TRACE_MAX_QUEUE)
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+            self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    # ---------- recording ----------
+    def emit(self, event: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            METRICS.incr("trace.dropped")
+
+    @contextmanager
+    def span(self, kind: str, user_id: Any = None, guild_id: Any = None, **fields):
+        """
+        Times the block as one event. Yields the event dict so the handler can add
+        fields (sizes, cache outcome); LLM calls made inside are attached via record_llm.
+        Also sets the usage request scope, so it runs (cheaply) even when tracing is off.
+        """
+        with request_scope(kind, guild_id):
+            if not self.enabled:
+                yield {}
+                return
+            event = {"t": round(time.time(), 3), "kind": kind, "user": anon(user_id), "guild": anon(guild_id), **fields}
+            token = _current.set(event)
+            started = time.perf_counter()
+            try:
+                yield event
+                event.setdefault("ok", True)
+            except BaseException:
+                event["ok"] = False
+                raise
+            finally:
+                event["dur_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                _current.reset(token)
+                self.emit(event)
+
+    def record_llm(self, response: Any, started: float) -> None:
+        """Adds one model call (tokens from response.usage, latency since `started`) to the current event."""
+        event = _current.get()
+        if event is None:
+            return
+        llm = event.setdefault("llm", {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "ms": 0.0})
+        prompt, completion, cached = usage_tokens(response)
+        llm["calls"] += 1
+        llm["prompt_tokens"] += prompt
+        llm["completion_tokens"] += completion
+        llm["cached_tokens"] += cached
+        llm["ms"] = round(llm["ms"] + (time.perf_counter() - started) * 1000, 1)
+
+    # ---------- writer ----------
+    def _path(self) -> str:
+        return os.path.join(self.directory, time.strftime("trace-%Y%m%d-%H.jsonl.gz", time.gmtime()))
+
+    def _drain(self) -> None:
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        # Each flush appends one gzip member; readers see the concatenation as one stream
+        with gzip.open(self._path(), "ab") as f:
+            f.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in batch).encode())
+
+    def _write_loop(self) -> None:
+        while not self._stop.wait(TRACE_FLUSH_SECONDS):
+            try:
+                self._drain()
+            except Exception as e:
+                print(f"⚠ Trace write failed: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        try:
+            self._drain()
+        except Exception:
+            pass
+
+
+TRACER = Tracer()
+
+
+def traced(kind: str):
+    """
+    Decorator for component callbacks `(self, interaction)`: a METRICS span (btn.<kind>)
+    plus a trace event for the clicking user.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, interaction, *args, **kwargs):
+            with METRICS.span(f"btn.{kind}"), TRACER.span(kind, interaction.user.id, interaction.guild_id):
+                return await fn(self, interaction, *args, **kwargs)
+        return wrapper
+    return decorator
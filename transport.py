@@ -0,0 +1,140 @@
+# transport.py
+"""
+Shared HTTP transport for the OpenAI client and image downloads.
+
+One httpx.Client serves every call. Its pool is sized to the overload controller's top
+in-flight tier, with keep-alive so calls reuse warm TLS connections. It speaks HTTP/2
+when the optional `h2` package is installed. Timeouts are explicit: callers pass
+task_timeout(read, connect) per task class, and anything else gets DEFAULT_TIMEOUT.
+prewarm_connections() opens connections at startup, so the first commands don't pay
+for the handshake.
+
+Every request is traced through httpcore. METRICS records whether it reused a pooled
+connection or opened one (http.requests / http.connections_opened), and how long TCP
+connect + TLS took (http.handshake_ms).
+"""
+import asyncio
+import atexit
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from metrics import METRICS
+from overload import INFLIGHT_TIERS
+
+try:
+    import h2  # noqa: F401  (httpx only needs it installed)
+    HTTP2 = os.getenv("HTTP2", "1") == "1"
+except ImportError:
+    HTTP2 = False
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+
+# Model calls beyond the top overload tier are already being shed, so that plus some
+# headroom for image downloads and embeddings is as many connections as we need
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", str(INFLIGHT_TIERS[-1] + 8)))
+HTTP_KEEPALIVE_CONNECTIONS = INFLIGHT_TIERS[1]   # idle connections kept warm
+HTTP_KEEPALIVE_EXPIRY = 90.0     # seconds an idle connection is kept
+HTTP_CONNECT_TIMEOUT = 5.0       # TCP + TLS
+HTTP_POOL_TIMEOUT = 10.0         # waiting for a free connection
+HTTP_READ_TIMEOUT = 60.0         # default when the caller doesn't pass a task timeout
+HTTP_PREWARM_CONNECTIONS = 1 if HTTP2 else 4   # one HTTP/2 connection multiplexes everything
+
+
+def task_timeout(read: float, connect: float = HTTP_CONNECT_TIMEOUT) -> httpx.Timeout:
+    """Timeout for one task class: `read` for the response (and writes), `connect` for TCP + TLS."""
+    return httpx.Timeout(read, connect=connect, pool=HTTP_POOL_TIMEOUT)
+
+
+DEFAULT_TIMEOUT = task_timeout(HTTP_READ_TIMEOUT)
+
+
+class _ConnTrace:
+    """httpcore trace callback for one request; notes whether it had to open a connection."""
+
+    def __init__(self, counted: bool = True):
+        self.counted = counted
+        self.opened = False
+        self._started: Dict[str, float] = {}
+        self.handshake_ms = 0.0
+
+    def __call__(self, event: str, info: Dict[str, Any]) -> None:
+        step, _, phase = event.rpartition(".")
+        if not step.endswith(("connect_tcp", "start_tls")):
+            return
+        if phase == "started":
+            self.opened = True
+            self._started[step] = time.perf_counter()
+        elif phase == "complete" and step in self._started:
+            self.handshake_ms += (time.perf_counter() - self._started.pop(step)) * 1000
+        elif phase == "failed":
+            METRICS.incr("http.connect_failures")
+
+
+def _on_request(request: httpx.Request) -> None:
+    request.extensions.setdefault("trace", _ConnTrace())
+
+
+def _on_response(response: httpx.Response) -> None:
+    trace = response.request.extensions.get("trace")
+    if not isinstance(trace, _ConnTrace) or not trace.counted:
+        return
+    METRICS.incr("http.requests")
+    if trace.opened:
+        METRICS.incr("http.connections_opened")
+        METRICS.observe("http.handshake_ms", trace.handshake_ms)
+
+
+HTTP_CLIENT = httpx.Client(
+    http2=HTTP2,
+    timeout=DEFAULT_TIMEOUT,
+    limits=httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    ),
+    event_hooks={"request": [_on_request], "response": [_on_response]},
+)
+atexit.register(HTTP_CLIENT.close)
+
+
+def _warm_one() -> Optional[float]:
+    # Unauthenticated, so the API answers with a quick 401; the connection stays pooled
+    trace = _ConnTrace(counted=False)
+    try:
+        HTTP_CLIENT.get(f"{OPENAI_BASE_URL}/models", extensions={"trace": trace},
+                        timeout=task_timeout(HTTP_CONNECT_TIMEOUT))
+    except httpx.HTTPError as e:
+        print(f"⚠ Connection pre-warm failed: {e}")
+        return None
+    return trace.handshake_ms
+
+
+async def prewarm_connections(n: int = HTTP_PREWARM_CONNECTIONS) -> None:
+    """Opens `n` pooled connections to the API concurrently (blocking client, so in threads)."""
+    results = await asyncio.gather(*(asyncio.to_thread(_warm_one) for _ in range(n)))
+    warmed = [ms for ms in results if ms is not None]
+    METRICS.incr("http.prewarmed", len(warmed))
+    if warmed:
+        print(f"🔌 Pre-warmed {len(warmed)} API connection(s) "
+              f"({'HTTP/2' if HTTP2 else 'HTTP/1.1'}, handshake ~{max(warmed):.0f} ms)")
+
+
+def connection_summary() -> List[str]:
+    """Connection reuse and handshake latency for /stats."""
+    total = METRICS.get("http.requests")
+    if not total:
+        return []
+    opened = METRICS.get("http.connections_opened")
+    p50 = METRICS.percentile("http.handshake_ms", 50)
+    lines = [f"{total} requests over {opened} new connections "
+             f"(reuse **{1 - opened / total:.1%}**, pool {HTTP_MAX_CONNECTIONS}, "
+             f"{'HTTP/2' if HTTP2 else 'HTTP/1.1'})"]
+    if p50 is not None:
+        lines.append(f"Handshake p50 {p50:.0f} / p95 {METRICS.percentile('http.handshake_ms', 95):.0f} ms")
+    failures = METRICS.get("http.connect_failures")
+    if failures:
+        lines.append(f"{failures} connect failures")
+    return lines
@@ -0,0 +1,248 @@
+# usage.py
+"""
+Model token / cost accounting per guild and command.
+
+Every model call is added to an in-memory aggregate keyed by (hour, guild, command, model);
+a background thread folds it into the usage_hourly table every USAGE_FLUSH_SECONDS, so
+the hot path is a dict update under a lock. The guild and command come from the request
+scope that TRACER.span sets for each interaction (contextvars follow to_thread workers
+and child tasks). Daily per-guild budgets turn into "downgrade" / "refuse" states that
+the callers act on.
+"""
+import atexit
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import METRICS
+
+USAGE_DB = os.getenv("USAGE_DB", "memory.db")
+USAGE_FLUSH_SECONDS = 300.0
+USAGE_DAILY_BUDGET_USD = float(os.getenv("USAGE_DAILY_BUDGET_USD", "0"))   # per guild; 0 = unlimited
+USAGE_GUILD_BUDGETS: Dict[str, float] = json.loads(os.getenv("USAGE_GUILD_BUDGETS", "{}"))  # {"guild_id": usd}
+USAGE_DOWNGRADE_AT = 0.8      # fraction of the budget after which callers downgrade
+
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-image-1": (5.00, 1.25, 40.00),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+}
+
+OK, DOWNGRADE, REFUSE = "ok", "downgrade", "refuse"
+
+CREATE_USAGE_HOURLY = """
+CREATE TABLE IF NOT EXISTS usage_hourly (
+    hour INTEGER NOT NULL,             -- unix time // 3600
+    guild_id TEXT NOT NULL,
+    command TEXT NOT NULL,
+    model TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    cost_micros INTEGER NOT NULL,      -- USD * 1e6
+    PRIMARY KEY (hour, guild_id, command, model)
+) WITHOUT ROWID
+"""
+
+# (command, guild key) of the interaction currently running
+_scope: contextvars.ContextVar[Tuple[str, str]] = contextvars.ContextVar("usage_scope", default=("other", "-"))
+
+
+class BudgetExceeded(Exception):
+    def __init__(self):
+        super().__init__("this server has used up today's AI budget — try again after midnight UTC")
+
+
+@contextmanager
+def request_scope(kind: str, guild_id: Any):
+    """Attributes model calls made inside the block to `kind` (up to any ':' detail) and the guild."""
+    token = _scope.set((kind.partition(":")[0], str(guild_id) if guild_id else "DM"))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_guild() -> str:
+    return _scope.get()[1]
+
+
+def usage_tokens(response: Any) -> Tuple[int, int, int]:
+    """(prompt, completion, cached) tokens. Chat reports prompt/completion; the images API input/output."""
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None) or getattr(usage, "input_tokens_details", None)
+    return (
+        getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0) or 0,
+        getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", 0) or 0,
+        getattr(details, "cached_tokens", 0) or 0,
+    )
+
+
+def cost_micros(model: str, prompt: int, completion: int, cached: int) -> int:
+    p_in, p_cached, p_out = MODEL_PRICES.get(model, (0.0, 0.0, 0.0))
+    return round((prompt - cached) * p_in + cached * p_cached + completion * p_out)
+
+
+def _today() -> int:
+    return int(time.time()) // 86400
+
+
+class UsageLedger:
+    def __init__(self, db_file: str = USAGE_DB):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[int, str, str, str], List[int]] = {}
+        self._day = _today()
+        self._spent: Dict[str, int] = defaultdict(int)     # guild -> cost_micros today (UTC)
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Creates the table, loads today's spend and starts the flush thread."""
+        conn = sqlite3.connect(self.db_file)
+        conn.execute(CREATE_USAGE_HOURLY)
+        rows = conn.execute(
+            "SELECT guild_id, SUM(cost_micros) FROM usage_hourly WHERE hour >= ? GROUP BY guild_id",
+            (self._day * 24,)
+        ).fetchall()
+        conn.commit()
+        conn.close()
+        with self._lock:
+            for g, spent in rows:
+                self._spent[g] += spent
+        self._flusher = threading.Thread(target=self._flush_loop, name="usage-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # ---------- recording ----------
+    def record(self, model: str, response: Any) -> None:
+        command, guild = _scope.get()
+        prompt, completion, cached = usage_tokens(response)
+        cost = cost_micros(model, prompt, completion, cached)
+        key = (int(time.time()) // 3600, guild, command, model)
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._pending[key] = [0, 0, 0, 0, 0]
+            row[0] += 1
+            row[1] += prompt
+            row[2] += completion
+            row[3] += cached
+            row[4] += cost
+            if key[0] // 24 != self._day:
+                self._day = key[0] // 24
+                self._spent.clear()
+            self._spent[guild] += cost
+
+    # ---------- budgets ----------
+    def budget_usd(self, guild: str) -> float:
+        return float(USAGE_GUILD_BUDGETS.get(guild, USAGE_DAILY_BUDGET_USD))
+
+    def spent_usd(self, guild: str) -> float:
+        if _today() != self._day:
+            return 0.0
+        return self._spent.get(guild, 0) / 1e6
+
+    def budget_state(self, guild: Optional[str] = None) -> str:
+        """OK, DOWNGRADE or REFUSE for `guild` (default: the current request's guild)."""
+        guild = guild or current_guild()
+        budget = self.budget_usd(guild)
+        if budget <= 0:
+            return OK
+        spent = self.spent_usd(guild)
+        if spent >= budget:
+            METRICS.incr("usage.refused")
+            return REFUSE
+        if spent >= budget * USAGE_DOWNGRADE_AT:
+            METRICS.incr("usage.downgraded")
+            return DOWNGRADE
+        return OK
+
+    def check(self, guild: Optional[str] = None) -> str:
+        """budget_state, but raises BudgetExceeded instead of returning REFUSE."""
+        state = self.budget_state(guild)
+        if state == REFUSE:
+            raise BudgetExceeded()
+        return state
+
+    # ---------- rollups ----------
+    def flush(self) -> int:
+        """Adds the pending aggregate into usage_hourly; returns the number of rows written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.executemany(
+                """INSERT INTO usage_hourly
+                       (hour, guild_id, command, model, calls, prompt_tokens, completion_tokens, cached_tokens, cost_micros)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (hour, guild_id, command, model) DO UPDATE SET
+                       calls = calls + excluded.calls,
+                       prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                       completion_tokens = completion_tokens + excluded.completion_tokens,
+                       cached_tokens = cached_tokens + excluded.cached_tokens,
+                       cost_micros = cost_micros + excluded.cost_micros""",
+                [(*key, *row) for key, row in pending.items()]
+            )
+            conn.commit()
+        except sqlite3.Error:
+            with self._lock:   # put it back; the next flush retries
+                for key, row in pending.items():
+                    cur = self._pending.setdefault(key, [0, 0, 0, 0, 0])
+                    for i, v in enumerate(row):
+                        cur[i] += v
+            raise
+        finally:
+            conn.close()
+        return len(pending)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(USAGE_FLUSH_SECONDS):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠ Usage flush failed: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def report(self, days: int, guild: Optional[str] = None, limit: int = 10) -> List[sqlite3.Row]:
+        """
+        Totals over the last `days` days: per command for one guild, or per guild when
+        `guild` is None. Blocking; flushes first so the numbers include the current hour.
+        """
+        self.flush()
+        group = "command" if guild else "guild_id"
+        since = int(time.time()) // 3600 - days * 24
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            f"""SELECT {group} AS name, SUM(calls) AS calls, SUM(prompt_tokens) AS prompt_tokens,
+                       SUM(completion_tokens) AS completion_tokens, SUM(cached_tokens) AS cached_tokens,
+                       SUM(cost_micros) AS cost_micros
+                FROM usage_hourly
+                WHERE hour > ? AND (? IS NULL OR guild_id = ?)
+                GROUP BY {group} ORDER BY cost_micros DESC LIMIT ?""",
+            (since, guild, guild, limit)
+        ).fetchall()
+        conn.close()
+        return rows
+
+
+USAGE = UsageLedger()
@@ -0,0 +1,32 @@
+# warmup.py
+"""
+Budget for the startup warm-up that newbot_ai's main() starts as a task alongside the
+gateway connect. Each step checks the budget before loading more, so a big database
+costs at most WARMUP_SECONDS and roughly WARMUP_MAX_BYTES of cache.
+"""
+import os
+import time
+
+WARMUP_ENABLED = os.getenv("WARMUP", "1") == "1"
+WARMUP_SECONDS = float(os.getenv("WARMUP_SECONDS", "20"))
+WARMUP_MAX_BYTES = int(os.getenv("WARMUP_MAX_MB", "32")) * 1_048_576
+WARMUP_GUILDS = 50          # most recently active guilds to warm
+WARMUP_CHANNELS = 200       # most recently active channels to warm (MEMORY_SCOPE=channel)
+WARMUP_SCAN_ROWS = 20_000   # newest memory rows looked at to find those channels
+
+
+class WarmupBudget:
+    def __init__(self, seconds: float = WARMUP_SECONDS, max_bytes: int = WARMUP_MAX_BYTES):
+        self.started = time.monotonic()
+        self.deadline = self.started + seconds
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+
+    def ok(self) -> bool:
+        return time.monotonic() < self.deadline and self.used_bytes < self.max_bytes
+
+    def charge(self, nbytes: int) -> None:
+        self.used_bytes += nbytes
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started